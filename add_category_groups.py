@@ -1,7 +1,17 @@
 """Add category_group column to CSV based on CB2 navigation structure."""
 import csv
+import os
+import tempfile
+from collections import Counter
 from pathlib import Path
 
+import pandas as pd
+
+from taxonomy import load_taxonomy_cache, to_subcategory_groups
+
+# Rows per chunk for the streaming bulk mode
+BULK_CHUNK_SIZE = 50_000
+
 # Mapping from sub_category to category_group based on CB2 website navigation
 SUBCATEGORY_TO_GROUP = {
     # FURNITURE - LIVING ROOM FURNITURE
@@ -115,13 +125,29 @@ SUBCATEGORY_TO_GROUP = {
 }
 
 
-def get_category_group(category, sub_category):
+def category_group_mapping():
+    """SUBCATEGORY_TO_GROUP extended with groups from the discovered nav taxonomy, if cached.
+
+    Discovered groups only fill subcategories missing from the hand-checked
+    table: when the nav heading lookup misses, discovery falls back to the
+    category name (e.g. 'FURNITURE'), which must not replace a checked group.
+    """
+    mapping = dict(SUBCATEGORY_TO_GROUP)
+    cache = load_taxonomy_cache()
+    if cache:
+        for subcategory, group in to_subcategory_groups(cache["categories"]).items():
+            mapping.setdefault(subcategory, group)
+    return mapping
+
+
+def get_category_group(category, sub_category, mapping=None):
     """Determine category_group based on category and sub_category."""
     sub_category = sub_category.strip()
+    mapping = SUBCATEGORY_TO_GROUP if mapping is None else mapping
     
     # First check direct mapping
-    if sub_category in SUBCATEGORY_TO_GROUP:
-        return SUBCATEGORY_TO_GROUP[sub_category]
+    if sub_category in mapping:
+        return mapping[sub_category]
     
     # Fallback: use category name if no specific mapping
     if not sub_category:
@@ -134,6 +160,7 @@ def get_category_group(category, sub_category):
 def add_category_groups(input_csv, output_csv):
     """Add category_group column to CSV."""
     rows = []
+    mapping = category_group_mapping()
     
     # Read CSV
     with open(input_csv, 'r', encoding='utf-8') as f:
@@ -160,7 +187,7 @@ def add_category_groups(input_csv, output_csv):
                 del row['category_group']
             
             # Get category_group
-            category_group = get_category_group(category, sub_category)
+            category_group = get_category_group(category, sub_category, mapping)
             row['category_group'] = category_group
             
             rows.append(row)
@@ -175,13 +202,88 @@ def add_category_groups(input_csv, output_csv):
     print(f"Processed {len(rows)} products")
     
     # Show summary
-    from collections import Counter
     groups = Counter([r['category_group'] for r in rows])
     print(f"\nCategory Groups Summary:")
     for group, count in sorted(groups.items()):
         print(f"  {group}: {count}")
 
 
+def assign_category_groups(chunk, mapping=SUBCATEGORY_TO_GROUP):
+    """Return the category_group column for a DataFrame chunk.
+
+    sub_category is converted to a categorical so the mapping lookup runs once
+    per distinct subcategory instead of once per row; unmapped rows fall back
+    to the upper-cased category, same as get_category_group().
+    """
+    sub_categories = chunk['sub_category'].str.strip().astype('category')
+    groups = sub_categories.map(mapping).astype(object)
+    fallback = chunk['category'].str.strip().str.upper()
+    return groups.where(groups.notna(), fallback)
+
+
+def _output_mode(path):
+    """Permissions for a rewritten output: those of the existing file, else the umask default."""
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def add_category_groups_bulk(input_csv, output_csv, chunksize=BULK_CHUNK_SIZE):
+    """Add category_group column to CSV, streaming in chunks.
+
+    Rows are written to a temp file next to output_csv which then replaces it,
+    so input_csv and output_csv may be the same file without risking data loss.
+    Returns a Counter of rows per category_group, built in the same pass.
+    """
+    output_path = Path(output_csv)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    mapping = category_group_mapping()
+    groups = Counter()
+    total = 0
+
+    fd, tmp_name = tempfile.mkstemp(prefix=output_path.name + '.', suffix='.tmp', dir=output_path.parent)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            reader = pd.read_csv(input_csv, dtype=str, keep_default_na=False, chunksize=chunksize)
+            for chunk_num, chunk in enumerate(reader):
+                # Drop existing category_group columns (pandas suffixes duplicates as .1, .2, ...)
+                stale = [c for c in chunk.columns if c == 'category_group' or c.startswith('category_group.')]
+                chunk = chunk.drop(columns=stale)
+                for col in ('category', 'sub_category'):
+                    if col not in chunk.columns:
+                        chunk[col] = ''
+
+                # Insert category_group after sub_category
+                chunk.insert(chunk.columns.get_loc('sub_category') + 1, 'category_group', assign_category_groups(chunk, mapping))
+
+                chunk.to_csv(f, header=chunk_num == 0, index=False, lineterminator='\r\n')
+                groups.update(chunk['category_group'].value_counts().to_dict())
+                total += len(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file 0600; give it the mode a plain open() would have kept
+        os.chmod(tmp_name, _output_mode(output_path))
+        os.replace(tmp_name, output_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+    print(f"Added category_group column to {output_csv}")
+    print(f"Processed {total} products")
+
+    print(f"\nCategory Groups Summary:")
+    for group, count in sorted(groups.items()):
+        print(f"  {group}: {count}")
+
+    return groups
+
+
 if __name__ == '__main__':
     input_file = Path('cb2_all_products_final.csv')
     output_file = Path('cb2_all_products_final.csv')  # Overwrite same file
@@ -190,5 +292,5 @@ if __name__ == '__main__':
         print(f"Error: {input_file} not found!")
         exit(1)
     
-    add_category_groups(input_file, output_file)
+    add_category_groups_bulk(input_file, output_file)
     print("\nDone!")
@@ -3,19 +3,30 @@ Add ALL product details to existing cb2_products.csv.
 Extracts: dimensions, all_images, sku, description, colors, details
 Visits each product page to extract the complete data.
 Enhanced with anti-detection measures.
-Works from START to END (products 1 -> N).
+Works from START to END (products 1 -> N), visiting only rows still missing
+the target fields (all_images by default, or --fields dimensions,description).
 """
 
+import argparse
 import asyncio
 import logging
 import json
 import csv
 import random
+from collections import Counter
 from pathlib import Path
 
 import nodriver as uc
 
-from config import HEADLESS, CHROME_USER_DATA_DIR
+import extractors
+from async_writer import AsyncWriter
+from checkpoint import load_checkpoint, save_checkpoint
+from browser_profiles import ResourceMeter, add_profile_argument, start_browser
+from memory_governor import MemoryGovernor
+from config import BASE_URL, CHROME_USER_DATA_DIR, SELECTORS
+from detail_cache import DetailCache, fill_known_fields
+from image_urls import CANONICAL_IMAGE_JS, ImageIndex, dedupe_image_urls
+from pending_work import PendingWork, row_key
 
 logging.basicConfig(
     level=logging.INFO,
@@ -31,11 +42,22 @@ HUMAN_SCROLL_DELAY = 0.3  # Delay between scroll actions
 WARMUP_WAIT = 5   # Seconds for initial warmup
 BATCH_SIZE = 20  # Products per batch before break (smaller batches)
 BATCH_BREAK = 30  # Seconds to pause between batches (longer breaks)
-BROWSER_RESTART_EVERY = 50  # Restart browser frequently for fresh sessions
+
+# Columns added to the listing CSV by this script
+DETAIL_COLUMNS = ['dimensions', 'all_images', 'sku', 'description', 'colors', 'details']
+# A plain run fills rows that have no images yet; --fields targets other gaps
+DEFAULT_TARGETS = ['all_images']
 
 # Files
 INPUT_CSV = Path("c:/Users/Syed Taha Hasan/Desktop/cb2/cb2_all_products.csv")
 OUTPUT_CSV = Path("c:/Users/Syed Taha Hasan/Desktop/cb2/cb2_all_products_with_details.csv")
+IMAGE_ASSETS_CSV = Path("c:/Users/Syed Taha Hasan/Desktop/cb2/cb2_image_assets.csv")
+# Earlier runs' outputs whose detail fields are reused instead of revisiting the page,
+# each with the fields it may supply (None: all). full_scraper caps all_images at 10,
+# so only its dimensions are taken.
+DETAIL_CACHE_CSVS = [
+    (Path("c:/Users/Syed Taha Hasan/Desktop/cb2/cb2_full_products.csv"), ['dimensions']),
+]
 
 # Use OUTPUT_CSV if it exists and has data, otherwise use INPUT_CSV
 def get_source_csv():
@@ -48,26 +70,52 @@ def get_source_csv():
     return INPUT_CSV
 PROGRESS_FILE = Path("c:/Users/Syed Taha Hasan/Desktop/cb2/all_products_details_progress.json")
 
-# JavaScript to extract ALL product information (dimensions, images, SKU, description, colors, details)
-EXTRACT_ALL_JS = """
+# JavaScript to extract ALL product information (dimensions, images, SKU, description, colors, details).
+# Called through extractors with a list of DETAIL_COLUMNS as its argument, only those sections run.
+EXTRACT_ALL_TEMPLATE = """
 (function() {
+    const fields = (typeof __args !== 'undefined' && __args[0]) || null;
+    const want = field => !fields || fields.includes(field);
     const result = {
         images: [],
         dimensions: '',
         sku: '',
         description: '',
         colors: [],
-        details: ''
+        details: '',
+        scoped: false
     };
     
-    const bodyText = document.body.innerText;
+    // ==================== SCOPE ====================
+    // Locate the PDP details/dimensions container once; the dimension and SKU
+    // patterns and the details sweep then run over its subtree instead of the
+    // whole document. Each falls back to the page (one shared body innerText
+    // read) only when the container gave nothing.
+    const scopeSelector = __DETAILS_SCOPE__;
+    let scope = null;
+    if (scopeSelector && (want('dimensions') || want('sku') || want('details'))) {
+        for (const el of document.querySelectorAll(scopeSelector)) {
+            const t = el.textContent || '';
+            if (t.length > 40 && /dimension|overall|width|height/i.test(t)) {
+                scope = el;
+                break;
+            }
+        }
+    }
+    result.scoped = !!scope;
+    
+    const scopeText = scope ? scope.innerText : '';
+    let bodyText = null;
+    const pageText = () => (bodyText === null ? (bodyText = document.body.innerText) : bodyText);
     const seen = new Set();
     
     // ==================== IMAGES ====================
+    if (want('all_images')) {
+    const canonicalImage = __CANONICAL_IMAGE__;
     document.querySelectorAll('img').forEach(img => {
         let src = img.src || img.dataset.src || '';
         if (src && src.includes('cb2.scene7.com') && !seen.has(src)) {
-            let clean = src.split('?')[0].replace(/\\/\\$[^/]*$/, '');
+            let clean = canonicalImage(src);
             if (!seen.has(clean) && clean.length > 20) {
                 seen.add(clean);
                 result.images.push(clean);
@@ -80,7 +128,7 @@ EXTRACT_ALL_JS = """
         srcset.split(',').forEach(part => {
             let src = part.trim().split(' ')[0];
             if (src && src.includes('cb2.scene7.com')) {
-                let clean = src.split('?')[0].replace(/\\/\\$[^/]*$/, '');
+                let clean = canonicalImage(src);
                 if (!seen.has(clean) && clean.length > 20) {
                     seen.add(clean);
                     result.images.push(clean);
@@ -88,57 +136,64 @@ EXTRACT_ALL_JS = """
             }
         });
     });
-    
-    // ==================== DIMENSIONS ====================
-    let match = bodyText.match(/(\\d+(?:\\.\\d+)?)"?\\s*W\\s*x\\s*(\\d+(?:\\.\\d+)?)"?\\s*D\\s*x\\s*(\\d+(?:\\.\\d+)?)"?\\s*H/i);
-    if (match) {
-        result.dimensions = match[1] + '"W x ' + match[2] + '"D x ' + match[3] + '"H';
-    }
-    
-    if (!result.dimensions) {
-        match = bodyText.match(/Overall\\s*Dimensions?[:\\s]+([^\\n]+)/i);
-        if (match) result.dimensions = match[1].trim().substring(0, 150);
     }
     
-    if (!result.dimensions) {
-        const widthMatch = bodyText.match(/Width[:\\s]+(\\d+(?:\\.\\d+)?)"?/i);
-        const depthMatch = bodyText.match(/Depth[:\\s]+(\\d+(?:\\.\\d+)?)"?/i);
-        const heightMatch = bodyText.match(/Height[:\\s]+(\\d+(?:\\.\\d+)?)"?/i);
+    // ==================== DIMENSIONS ====================
+    const findDimensions = (text) => {
+        let match = text.match(/(\\d+(?:\\.\\d+)?)"?\\s*W\\s*x\\s*(\\d+(?:\\.\\d+)?)"?\\s*D\\s*x\\s*(\\d+(?:\\.\\d+)?)"?\\s*H/i);
+        if (match) {
+            return match[1] + '"W x ' + match[2] + '"D x ' + match[3] + '"H';
+        }
+        
+        match = text.match(/Overall\\s*Dimensions?[:\\s]+([^\\n]+)/i);
+        if (match) return match[1].trim().substring(0, 150);
+        
+        const widthMatch = text.match(/Width[:\\s]+(\\d+(?:\\.\\d+)?)"?/i);
+        const depthMatch = text.match(/Depth[:\\s]+(\\d+(?:\\.\\d+)?)"?/i);
+        const heightMatch = text.match(/Height[:\\s]+(\\d+(?:\\.\\d+)?)"?/i);
         
         if (widthMatch || heightMatch) {
             const parts = [];
             if (widthMatch) parts.push(widthMatch[1] + '"W');
             if (depthMatch) parts.push(depthMatch[1] + '"D');
             if (heightMatch) parts.push(heightMatch[1] + '"H');
-            result.dimensions = parts.join(' x ');
+            return parts.join(' x ');
         }
-    }
-    
-    if (!result.dimensions) {
-        match = bodyText.match(/Dimensions?[:\\s]+([^\\n]+)/i);
+        
+        match = text.match(/Dimensions?[:\\s]+([^\\n]+)/i);
         if (match) {
             const dimText = match[1].trim().substring(0, 150);
             // Only use if it contains numbers (valid dimensions)
             if (dimText.match(/\\d/)) {
-                result.dimensions = dimText;
+                return dimText;
             }
         }
-    }
+        return '';
+    };
     
-    result.dimensions = result.dimensions.replace(/[\\n\\r\\t]+/g, ' ').trim().substring(0, 200);
+    if (want('dimensions')) {
+        result.dimensions = findDimensions(scope ? scopeText : pageText());
+        // Scoped container had no dimensions - fall back to one full-page scan
+        if (!result.dimensions && scope) {
+            result.dimensions = findDimensions(pageText());
+        }
+        
+        result.dimensions = result.dimensions.replace(/[\\n\\r\\t]+/g, ' ').trim().substring(0, 200);
+    }
     
     // ==================== SKU ====================
-    let skuMatch = bodyText.match(/SKU[:\\s#]*([A-Z0-9-]+)/i);
-    if (skuMatch) {
-        result.sku = skuMatch[1].trim();
-    } else {
-        skuMatch = bodyText.match(/(?:Item|Product)\\s*(?:#|ID)[:\\s]*([A-Z0-9-]+)/i);
-        if (skuMatch) result.sku = skuMatch[1].trim();
-    }
+    if (want('sku')) {
+    const findSku = (text) => {
+        const skuMatch = text.match(/SKU[:\\s#]*([A-Z0-9-]+)/i) ||
+            text.match(/(?:Item|Product)\\s*(?:#|ID)[:\\s]*([A-Z0-9-]+)/i);
+        return skuMatch ? skuMatch[1].trim() : '';
+    };
+    
+    if (scope) result.sku = findSku(scopeText);
     
     if (!result.sku) {
         const metaSku = document.querySelector('meta[property="product:retailer_item_id"]');
-        if (metaSku) result.sku = metaSku.content;
+        if (metaSku) result.sku = (metaSku.content || '').trim();
     }
     
     if (!result.sku) {
@@ -146,7 +201,12 @@ EXTRACT_ALL_JS = """
         if (urlMatch) result.sku = urlMatch[1];
     }
     
+    // Nothing in the container, meta tag or URL - one full-page scan
+    if (!result.sku) result.sku = findSku(pageText());
+    }
+    
     // ==================== DESCRIPTION ====================
+    if (want('description')) {
     const descSelectors = [
         '[data-testid="product-description"]',
         '.product-description',
@@ -197,20 +257,30 @@ EXTRACT_ALL_JS = """
         .replace(/\\s{2,}/g, ' ')
         .trim()
         .substring(0, 1000);
+    }
     
     // ==================== DETAILS ====================
-    const detailsSections = [];
+    if (want('details')) {
     const detailsHeaders = ['details', 'specifications', 'materials', 'care', 'features', 'about'];
-    
-    detailsHeaders.forEach(header => {
-        const elements = document.querySelectorAll(`[class*="${header}"], [data-testid*="${header}"]`);
-        elements.forEach(elem => {
-            const text = (elem.innerText || elem.textContent || '').trim();
-            if (text.length > 20 && text.length < 1500) {
-                detailsSections.push(text);
-            }
+    const sweepDetails = (root) => {
+        const sections = [];
+        detailsHeaders.forEach(header => {
+            const selector = `[class*="${header}"], [data-testid*="${header}"]`;
+            const elems = Array.from(root.querySelectorAll(selector));
+            if (root !== document && root.matches(selector)) elems.unshift(root);
+            elems.forEach(elem => {
+                const text = (elem.innerText || elem.textContent || '').trim();
+                if (text.length > 20 && text.length < 1500) {
+                    sections.push(text);
+                }
+            });
         });
-    });
+        return sections;
+    };
+    
+    let detailsSections = scope ? sweepDetails(scope) : [];
+    // Scoped container had no detail sections - fall back to one document-wide sweep
+    if (detailsSections.length === 0) detailsSections = sweepDetails(document);
     
     if (detailsSections.length > 0) {
         result.details = detailsSections.join(' | ');
@@ -221,8 +291,10 @@ EXTRACT_ALL_JS = """
         .replace(/\\s{2,}/g, ' ')
         .trim()
         .substring(0, 1500);
+    }
     
     // ==================== COLORS ====================
+    if (want('colors')) {
     const colorSet = new Set();
     
     const swatches = document.querySelectorAll(
@@ -244,25 +316,82 @@ EXTRACT_ALL_JS = """
     });
     
     result.colors = Array.from(colorSet).slice(0, 10);
+    }
     
     return JSON.stringify(result);
 })();
-"""
+""".replace("__CANONICAL_IMAGE__", CANONICAL_IMAGE_JS)
+
+# Scoped (default): patterns run over the PDP details container when one is found
+EXTRACT_ALL_JS = EXTRACT_ALL_TEMPLATE.replace("__DETAILS_SCOPE__", json.dumps(SELECTORS.pdp_details))
+
+# Full-page scan over document.body.innerText; kept for comparison in benchmark.py
+EXTRACT_ALL_FULL_JS = EXTRACT_ALL_TEMPLATE.replace("__DETAILS_SCOPE__", "''")
+
+# Block check, lazy-load scrolling and EXTRACT_ALL_JS in ONE awaited evaluation,
+# instead of a block-check evaluate, three scroll evaluates and an extract evaluate.
+# Takes the same optional field list; without all_images there is nothing lazy-loaded
+# to wait for, so the scroll is skipped.
+# Returns JSON: {status: 'ok' | 'blocked' | 'captcha', data: {...}, timings: {...}}
+PAGE_PIPELINE_JS = """
+(async function() {
+    const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+    const t0 = performance.now();
+    
+    // ==================== BLOCK DETECTION ====================
+    const head = (document.body ? document.body.innerText : '').substring(0, 500);
+    if (head.includes('Access Denied') || head.toLowerCase().includes('blocked')) {
+        return JSON.stringify({status: 'blocked'});
+    }
+    if (head.toLowerCase().includes('verify') || head.toLowerCase().includes('robot')) {
+        return JSON.stringify({status: 'captcha'});
+    }
+    
+    // ==================== LAZY-LOAD SCROLL ====================
+    const fields = (typeof __args !== 'undefined' && __args[0]) || null;
+    if (!fields || fields.includes('all_images')) {
+        for (const [fraction, pause] of [[0.33, 300], [0.66, 300], [1, 500]]) {
+            window.scrollTo(0, document.body.scrollHeight * fraction);
+            await sleep(pause);
+        }
+        await sleep(200 + Math.random() * 200);
+    }
+    
+    // ==================== EXTRACTION ====================
+    const t1 = performance.now();
+    const data = JSON.parse(__EXTRACT_ALL__);
+    return JSON.stringify({
+        status: 'ok',
+        data: data,
+        timings: {scroll_ms: t1 - t0, extract_ms: performance.now() - t1}
+    });
+})()
+""".replace("__EXTRACT_ALL__", EXTRACT_ALL_JS.strip().rstrip(";"))
+
+extractors.register("pdp_pipeline", PAGE_PIPELINE_JS)
 
 
 def load_progress():
-    """Load progress."""
-    if PROGRESS_FILE.exists():
-        try:
-            return json.loads(PROGRESS_FILE.read_text())
-        except:
-            pass
-    return {"processed": []}
+    """Load progress (newest valid checkpoint generation)."""
+    return load_checkpoint(PROGRESS_FILE, {"processed": []})
 
 
 def save_progress(progress):
     """Save progress."""
-    PROGRESS_FILE.write_text(json.dumps(progress))
+    save_checkpoint(PROGRESS_FILE, progress)
+
+
+def reconcile_processed(processed, products):
+    """
+    Make the processed set agree with the rows: OUTPUT_CSV is rewritten whole, so a
+    row with images is done even if the checkpoint after it was lost, and a URL
+    in the checkpoint whose row has no data is retried.
+    """
+    done = {p.get('product_link', '') for p in products if p.get('all_images', '').strip()}
+    added, dropped = len(done - processed), len(processed - done)
+    if added or dropped:
+        logger.info("Checkpoint reconciled with %s: +%d done, %d to retry", OUTPUT_CSV.name, added, dropped)
+    return done
 
 
 def read_input_csv():
@@ -300,6 +429,31 @@ def write_output_csv(products, fieldnames):
         writer.writerows(products)
 
 
+def merge_details(product, details, image_index=None):
+    """Fill the product's missing fields from extracted details (existing data is preserved).
+
+    Returns False if the page yielded no usable data (probably blocked).
+    """
+    if not any(details.get(col) for col in DETAIL_COLUMNS):
+        return False
+    if not product.get('dimensions', '').strip() and details['dimensions']:
+        product['dimensions'] = details['dimensions']
+    if not product.get('all_images', '').strip() and details['all_images']:
+        images = details['all_images']
+        if image_index is not None:
+            images = image_index.add(details['sku'] or product.get('sku', ''), images)
+        product['all_images'] = '|'.join(images)
+    if not product.get('sku', '').strip() and details['sku']:
+        product['sku'] = details['sku']
+    if not product.get('description', '').strip() and details['description']:
+        product['description'] = details['description']
+    if not product.get('colors', '').strip() and details['colors']:
+        product['colors'] = '|'.join(details['colors'])
+    if not product.get('details', '').strip() and details['details']:
+        product['details'] = details['details']
+    return True
+
+
 async def human_like_scroll(page):
     """Quick scroll to trigger lazy-loading."""
     try:
@@ -314,8 +468,73 @@ async def human_like_scroll(page):
         pass
 
 
-async def get_product_details(browser, url, timeout=20, retry_count=0):
-    """Get ALL details from product page: dimensions, images, SKU, description, colors, details."""
+async def get_product_details(browser, url, timeout=20, retry_count=0, fields=None):
+    """Get ALL details from product page: dimensions, images, SKU, description, colors, details.
+
+    Block detection, lazy-load scrolling and extraction run in a single
+    awaited PAGE_PIPELINE_JS evaluation (one CDP round trip per product),
+    called by name from the extractor bundle installed on the tab.
+    With fields (a subset of DETAIL_COLUMNS) only those are extracted, and the
+    scroll is skipped unless all_images is among them. result['loaded'] tells
+    whether the page itself was read, even if it had none of the fields.
+    """
+    result = {
+        'dimensions': '',
+        'all_images': [],
+        'sku': '',
+        'description': '',
+        'colors': [],
+        'details': '',
+        'loaded': False
+    }
+    max_retries = 2
+    
+    try:
+        page = await browser.get(url)
+        
+        # Optimized initial wait (reduced for speed)
+        await asyncio.sleep(random.uniform(0.8, 1.2))
+        
+        response = await extractors.call(page, "pdp_pipeline", list(fields) if fields else None)
+        outcome = json.loads(response) if isinstance(response, str) else {}
+        status = outcome.get('status')
+        
+        if status == 'blocked':
+            if retry_count < max_retries:
+                logger.warning("Access Denied - waiting 30s and retrying...")
+                await asyncio.sleep(30)
+                return await get_product_details(browser, url, timeout, retry_count + 1, fields)
+            logger.error("Access Denied after retries - skipping")
+            return result
+        
+        if status == 'captcha':
+            logger.warning("CAPTCHA detected - waiting 60s for manual solve...")
+            await asyncio.sleep(60)
+            return await get_product_details(browser, url, timeout, retry_count + 1, fields)
+        
+        if status == 'ok':
+            data = outcome.get('data') or {}
+            result['loaded'] = True
+            result['dimensions'] = data.get("dimensions", "")
+            result['all_images'] = dedupe_image_urls(data.get("images", []))
+            result['sku'] = data.get("sku", "")
+            result['description'] = data.get("description", "")
+            result['colors'] = data.get("colors", [])
+            result['details'] = data.get("details", "")
+        else:
+            logger.debug("Extraction error: %s", str(response)[:50])
+                
+    except Exception as e:
+        logger.debug("Error: %s", str(e)[:50])
+    
+    return result
+
+
+async def get_product_details_stepwise(browser, url, timeout=20, retry_count=0):
+    """Multi-evaluate version of get_product_details (block check, 3 scrolls, extract).
+
+    Kept as the baseline for benchmark.py; the scraper uses get_product_details.
+    """
     result = {
         'dimensions': '',
         'all_images': [],
@@ -339,7 +558,7 @@ async def get_product_details(browser, url, timeout=20, retry_count=0):
                 if retry_count < max_retries:
                     logger.warning("Access Denied - waiting 30s and retrying...")
                     await asyncio.sleep(30)
-                    return await get_product_details(browser, url, timeout, retry_count + 1)
+                    return await get_product_details_stepwise(browser, url, timeout, retry_count + 1)
                 else:
                     logger.error("Access Denied after retries - skipping")
                     return result
@@ -348,7 +567,7 @@ async def get_product_details(browser, url, timeout=20, retry_count=0):
             if "verify" in page_text.lower() or "robot" in page_text.lower():
                 logger.warning("CAPTCHA detected - waiting 60s for manual solve...")
                 await asyncio.sleep(60)
-                return await get_product_details(browser, url, timeout, retry_count + 1)
+                return await get_product_details_stepwise(browser, url, timeout, retry_count + 1)
         except:
             pass
         
@@ -364,7 +583,7 @@ async def get_product_details(browser, url, timeout=20, retry_count=0):
             if response:
                 data = json.loads(response)
                 result['dimensions'] = data.get("dimensions", "")
-                result['all_images'] = data.get("images", [])
+                result['all_images'] = dedupe_image_urls(data.get("images", []))
                 result['sku'] = data.get("sku", "")
                 result['description'] = data.get("description", "")
                 result['colors'] = data.get("colors", [])
@@ -378,8 +597,9 @@ async def get_product_details(browser, url, timeout=20, retry_count=0):
     return result
 
 
-async def main():
-    """Main function."""
+async def main(fields=None, retry_tried=False, profile=None):
+    """Main function. fields: fill only rows missing any of these (default: rows without images)."""
+    targets = list(fields) if fields else DEFAULT_TARGETS
     # Load existing products
     logger.info("Reading existing CSV: %s", INPUT_CSV)
     products = read_input_csv()
@@ -387,94 +607,128 @@ async def main():
     
     # Load progress
     progress = load_progress()
-    processed = set(progress.get("processed", []))
+    processed = reconcile_processed(set(progress.get("processed", [])), products)
+    
+    # Index images already collected; collapses size/format variants in existing rows too
+    image_index = ImageIndex()
+    for product in products:
+        if product.get('all_images', '').strip():
+            product['all_images'] = '|'.join(image_index.add(product.get('sku', ''), product['all_images'].split('|')))
     
     # Add new columns if not present
     fieldnames = list(products[0].keys()) if products else []
-    new_columns = ['dimensions', 'all_images', 'sku', 'description', 'colors', 'details']
-    for col in new_columns:
+    for col in DETAIL_COLUMNS:
         if col not in fieldnames:
             fieldnames.append(col)
     
+    # Rows still missing detail fields, saved with the progress so a resume starts on them directly
+    pending = PendingWork.load(progress.get("pending"), products, DETAIL_COLUMNS)
+    rows_by_key = {}
+    for product in products:
+        rows_by_key.setdefault(row_key(product), []).append(product)
+    
+    # Fill what is known without a page visit (SKU from the URL, earlier runs' rows)
+    cache = DetailCache(DETAIL_COLUMNS)
+    for csv_path, cache_fields in DETAIL_CACHE_CSVS:
+        cache.load_csv(csv_path, cache_fields)
+    known = Counter()
+    for key in list(pending.gaps):
+        for product in rows_by_key.get(key, []):
+            filled = fill_known_fields(product, DETAIL_COLUMNS, cache)
+            if filled:
+                known.update(filled)
+                pending.update(key, product)
+                if ("cache", "all_images") in filled:
+                    product['all_images'] = '|'.join(image_index.add(product.get('sku', ''), product['all_images'].split('|')))
+    if known:
+        logger.info("Filled without a page visit: %s", ', '.join(f"{f} from {stage}={n}" for (stage, f), n in sorted(known.items())))
+    queue = pending.select(targets, retry_tried)
+    
     browser = None
+    meter = governor = None
+    writer = AsyncWriter()  # CSV rewrites and progress saves run off the event loop
+    writer.start()
+    
+    def save_all():
+        progress["processed"] = list(processed)
+        progress["pending"] = pending.to_progress()
+        writer.rewrite_csv(OUTPUT_CSV, fieldnames, products)
+        writer.checkpoint(PROGRESS_FILE, progress)
     
     try:
         logger.info("Starting browser with FRESH profile (better for avoiding detection)...")
         # Use fresh temp profile - avoids flagged sessions
-        browser = await uc.start(
-            headless=HEADLESS,
-            browser_args=['--disable-blink-features=AutomationControlled']
-        )
+        browser = await start_browser(profile)
+        meter = ResourceMeter(profile, browser)
+        governor = MemoryGovernor(profile, meter)
         
         # Quick warm-up with fresh profile
         logger.info("Warming up fresh browser session...")
         try:
-            page = await browser.get("https://www.cb2.com/")
+            page = await browser.get(BASE_URL + "/")
             await asyncio.sleep(random.uniform(3, 5))
             await human_like_scroll(page)
             logger.info("Browser ready.")
         except Exception as e:
             logger.warning("Warmup issue: %s", str(e)[:50])
         
-        # Count products needing details (only skip if has images)
-        already_done = sum(1 for p in products if p.get('all_images', '').strip())
-        to_scrape = len(products) - already_done
+        to_scrape = len(queue)
         
         logger.info("=" * 60)
-        logger.info("Products to scrape: %d (skipping %d with existing data)", to_scrape, already_done)
-        # Calculate with batch breaks and browser restarts
+        logger.info("Products to scrape: %d missing %s (skipping %d)", to_scrape, '/'.join(targets), len(products) - to_scrape)
+        gaps = pending.field_counts()
+        logger.info("Rows missing each field: %s", ', '.join(f"{f}={gaps[f]}" for f in DETAIL_COLUMNS))
+        # Calculate with batch breaks (browser restarts only happen under memory pressure)
         avg_delay = (MIN_DELAY + MAX_DELAY) / 2 + 8  # Plus page load/scroll time
         batch_breaks = (to_scrape / BATCH_SIZE) * BATCH_BREAK
-        browser_restarts = (to_scrape / BROWSER_RESTART_EVERY) * 15  # ~15s per restart
-        total_time = (to_scrape * avg_delay + batch_breaks + browser_restarts) / 3600
-        logger.info("Estimated time: ~%.1f hours (STEALTH: %d-%ds delays, %ds break/%d, browser restart/%d)", 
-                   total_time, MIN_DELAY, MAX_DELAY, BATCH_BREAK, BATCH_SIZE, BROWSER_RESTART_EVERY)
+        total_time = (to_scrape * avg_delay + batch_breaks) / 3600
+        logger.info("Estimated time: ~%.1f hours (STEALTH: %d-%ds delays, %ds break/%d)", 
+                   total_time, MIN_DELAY, MAX_DELAY, BATCH_BREAK, BATCH_SIZE)
         logger.info("=" * 60)
         
-        start_idx = len(processed)
-        
         products_in_batch = 0
+        page_loads = 0
         
-        for i, product in enumerate(products):
+        for i, key in enumerate(queue):
+            rows = rows_by_key.get(key)
+            if not rows:
+                continue
+            product = rows[0]
             url = product.get('product_link', '')
             
-            # Check if product has images - if not, we need to scrape it regardless of progress
-            has_images = product.get('all_images', '').strip() != ''
-            has_sku = product.get('sku', '').strip() != ''
-            
-            # Skip if product already has images (successfully scraped)
-            if has_images:
-                if i % 100 == 0:
-                    logger.info("Skipping (has images): %d/%d", i+1, len(products))
+            # The saved index may predate the last CSV write: re-check the row itself
+            if not set(targets).intersection(pending.update(key, product)):
                 continue
             
-            # If no images but in progress file, it was blocked before - retry it
-            # (don't skip based on progress file if data is missing)
-            
             # Log progress every 5 products
             if products_in_batch % 5 == 0 or products_in_batch == 0:
                 logger.info("Progress: %d/%d (%.1f%%) - %s", 
-                           i + 1, len(products), (i + 1) / len(products) * 100,
+                           i + 1, to_scrape, (i + 1) / to_scrape * 100,
                            product.get('name', '')[:30])
             
-            # Get ALL details
-            details = await get_product_details(browser, url)
+            # Get ALL details, or in a --fields pass only the targeted ones this row lacks
+            wanted = [f for f in pending.missing(key) if f in targets] if fields else None
+            details = await get_product_details(browser, url, fields=wanted)
+            page_loads += 1
+            meter.page_done()
+            
+            # Recycle the tab, or restart the browser, only when memory crosses the limits
+            current = await governor.after_page(browser)
+            if current is not browser:
+                browser = current
+                # Warmup with natural browsing
+                await browser.get(BASE_URL + "/")
+                await asyncio.sleep(random.uniform(4, 6))
+                await human_like_scroll(await browser.get(BASE_URL + "/furniture/"))
+                await asyncio.sleep(random.uniform(3, 5))
+                logger.info("  [Browser restarted - continuing...]")
             
             # Only update and mark as processed if we got actual data
-            if details['dimensions'] or details['all_images'] or details['sku'] or details['description']:
-                # Only update fields that are missing (preserve existing data)
-                if not product.get('dimensions', '').strip() and details['dimensions']:
-                    product['dimensions'] = details['dimensions']
-                if not product.get('all_images', '').strip() and details['all_images']:
-                    product['all_images'] = '|'.join(details['all_images'])
-                if not product.get('sku', '').strip() and details['sku']:
-                    product['sku'] = details['sku']
-                if not product.get('description', '').strip() and details['description']:
-                    product['description'] = details['description']
-                if not product.get('colors', '').strip() and details['colors']:
-                    product['colors'] = '|'.join(details['colors'])
-                if not product.get('details', '').strip() and details['details']:
-                    product['details'] = details['details']
+            if merge_details(product, details, image_index):
+                for duplicate in rows[1:]:
+                    merge_details(duplicate, details, image_index)
+                pending.update(key, product)
+                pending.mark_tried(key, targets)
                 processed.add(url)
                 products_in_batch += 1
                 logger.info("  -> dims=%s, imgs=%d, sku=%s, desc=%s, colors=%d, details=%s", 
@@ -484,14 +738,15 @@ async def main():
                            'YES' if details['description'] else 'NO',
                            len(details['colors']),
                            'YES' if details['details'] else 'NO')
+            elif details['loaded']:
+                pending.mark_tried(key, targets)
+                logger.info("  -> Page has none of: %s", ', '.join(wanted or targets))
             else:
                 logger.warning("  -> No data extracted (page blocked?)")
             
             # Save progress every 5 successful products
             if products_in_batch > 0 and products_in_batch % 5 == 0:
-                progress["processed"] = list(processed)
-                save_progress(progress)
-                write_output_csv(products, fieldnames)
+                save_all()
                 logger.info("  [Saved progress - %d products with data]", products_in_batch)
             
             # Batch break - pause longer every BATCH_SIZE successful products
@@ -500,50 +755,34 @@ async def main():
                 await asyncio.sleep(BATCH_BREAK)
                 logger.info("  [Resuming...]")
             
-            # Restart browser periodically for fresh session
-            if products_in_batch > 0 and products_in_batch % BROWSER_RESTART_EVERY == 0:
-                logger.info("  [Restarting browser for fresh session...]")
-                try:
-                    browser.stop()
-                except:
-                    pass
-                await asyncio.sleep(10)
-                browser = await uc.start(
-                    headless=HEADLESS,
-                    browser_args=['--disable-blink-features=AutomationControlled']
-                )
-                # Warmup with natural browsing
-                await browser.get("https://www.cb2.com/")
-                await asyncio.sleep(random.uniform(4, 6))
-                await human_like_scroll(await browser.get("https://www.cb2.com/furniture/"))
-                await asyncio.sleep(random.uniform(3, 5))
-                logger.info("  [Browser restarted - continuing...]")
-            
             # Human-like delay between products
             await asyncio.sleep(random.uniform(MIN_DELAY, MAX_DELAY))
         
         # Final save
-        write_output_csv(products, fieldnames)
-        progress["processed"] = list(processed)
-        save_progress(progress)
+        save_all()
         
         logger.info("=" * 60)
-        logger.info("COMPLETE!")
+        logger.info("COMPLETE! %d product pages loaded (%d fields filled without a visit)",
+                    page_loads, sum(known.values()))
         logger.info("Output saved to: %s", OUTPUT_CSV)
         logger.info("=" * 60)
         
     except KeyboardInterrupt:
         logger.info("Interrupted - saving progress...")
-        write_output_csv(products, fieldnames)
-        progress["processed"] = list(processed)
-        save_progress(progress)
+        save_all()
     except Exception as e:
         logger.exception("Error: %s", e)
         # Save what we have
-        write_output_csv(products, fieldnames)
-        progress["processed"] = list(processed)
-        save_progress(progress)
+        save_all()
     finally:
+        await writer.close()
+        if products:
+            assets = image_index.write_csv(IMAGE_ASSETS_CSV)
+            logger.info("Image assets: %d unique of %d URLs -> %s", assets, image_index.urls_seen, IMAGE_ASSETS_CSV)
+        if meter:
+            meter.log()
+        if governor:
+            governor.close()
         if browser:
             try:
                 browser.stop()
@@ -552,4 +791,14 @@ async def main():
 
 
 if __name__ == "__main__":
-    uc.loop().run_until_complete(main())
+    parser = argparse.ArgumentParser(description="Add product page details to the listing CSV.")
+    parser.add_argument("--fields", help=f"comma-separated; only rows missing any of these ({', '.join(DETAIL_COLUMNS)})")
+    add_profile_argument(parser)
+    parser.add_argument("--retry-tried", action="store_true",
+                        help="also refetch rows whose page was already loaded without the field")
+    args = parser.parse_args()
+    fields = [f.strip() for f in args.fields.split(",") if f.strip()] if args.fields else None
+    unknown = set(fields or []) - set(DETAIL_COLUMNS)
+    if unknown:
+        parser.error(f"unknown field(s): {', '.join(sorted(unknown))}")
+    uc.loop().run_until_complete(main(fields, args.retry_tried, args.profile))
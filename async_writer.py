@@ -0,0 +1,276 @@
+"""
+Background writer task so scraping coroutines never wait on disk.
+
+    async with AsyncWriter() as writer:
+        writer.append_rows(OUTPUT_CSV, CSV_HEADER, batch, after=mark_seen)
+        writer.checkpoint(PROGRESS_JSON, progress, output=OUTPUT_CSV)
+        writer.rewrite_csv(OUTPUT_CSV, fieldnames, products)
+
+Every call only snapshots its data and puts it on an asyncio.Queue; a single
+task drains the queue and does the file I/O off the loop. Appended rows are
+batched and written once flush_rows are pending or flush_seconds have
+passed, through one csv_writer.BufferedCsvWriter per file that stays open
+for the whole run (in a worker thread). Checkpoints and full
+rewrites are atomic (temp file, fsync, replace) and coalesced, so if saves
+come faster than the disk, only the newest snapshot of each file is written.
+Queue order is kept: pending rows are flushed before any later checkpoint,
+rewrite or submitted call, so a checkpoint never claims rows that are not on
+disk yet. If an append fails, its rows are kept and retried at the next
+flush; until they are on disk every checkpoint is held back, and flush() and
+close() raise WriterError (the cause is also in writer.error). Checkpoints use the checksummed format of checkpoint.py, keep the
+previous generation as <name>.prev and, given output=, record how many bytes
+of that file they cover (output_bytes) so a resume only reconciles the rest.
+"""
+
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import aiofiles
+import aiofiles.os
+
+from checkpoint import encode_checkpoint, output_size, previous_path
+from config import WRITER_FLUSH_ROWS, WRITER_FLUSH_SECONDS
+from csv_writer import BufferedCsvWriter
+
+logger = logging.getLogger(__name__)
+
+_CLOSE = object()
+
+
+class WriterError(RuntimeError):
+    """Appended rows could not be written; checkpoints are held back until they are."""
+
+
+def format_csv(fieldnames: list[str], rows: list[dict], header: bool) -> str:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=fieldnames, extrasaction="ignore")
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buf.getvalue()
+
+
+async def write_atomic(path: Path, text: str, keep_previous: bool = False) -> None:
+    """Write text to path via a temp file, fsync and rename (optionally keeping the old file as .prev)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    async with aiofiles.open(tmp, "w", encoding="utf-8", newline="") as f:
+        await f.write(text)
+        await f.flush()
+        await asyncio.to_thread(os.fsync, f.fileno())
+    if keep_previous and await aiofiles.os.path.exists(path):
+        await aiofiles.os.replace(path, previous_path(path))
+    await aiofiles.os.replace(tmp, path)
+
+
+def _render_checkpoint(text: str, output: Optional[Path], output_bytes: int) -> str:
+    data = json.loads(text)
+    if output is not None:
+        data["output_bytes"] = output_bytes
+    return encode_checkpoint(data)
+
+
+class AsyncWriter:
+    """Single task that owns all output-file writes for a run."""
+
+    def __init__(self, flush_rows: int = WRITER_FLUSH_ROWS, flush_seconds: float = WRITER_FLUSH_SECONDS) -> None:
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        # path -> (fieldnames, rows, after-callbacks) not yet appended
+        self._appends: dict[Path, tuple[list[str], list[dict], list[Callable]]] = {}
+        self._pending_rows = 0
+        # path -> (renderer, keep .prev) of the newest checkpoint/rewrite not yet written
+        self._snapshots: dict[Path, tuple[Callable[[], str], bool]] = {}
+        # Open appenders, one per output file, closed with the writer
+        self._files: dict[Path, BufferedCsvWriter] = {}
+        self.rows_written = 0
+        self.flushes = 0
+        # Last append failure, cleared once every kept row is on disk
+        self.error: Optional[Exception] = None
+
+    async def __aenter__(self) -> "AsyncWriter":
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="async-writer")
+
+    # ---- producer side: never blocks ----
+
+    def append_rows(self, path, fieldnames: list[str], rows: list[dict], after: Optional[Callable[[], None]] = None) -> None:
+        """Queue rows for appending (header written if the file is new). after() runs once they are on disk."""
+        if rows:
+            self._queue.put_nowait(("append", Path(path), list(fieldnames), [dict(r) for r in rows], after))
+
+    def checkpoint(self, path, data: Any, output=None) -> None:
+        """
+        Queue a checkpoint of data (serialized now, so later changes to data don't leak in).
+
+        With output, the checkpoint also records the size of that file once
+        the rows queued before it are written, as output_bytes.
+        """
+        output = Path(output) if output is not None else None
+        self._queue.put_nowait(("checkpoint", Path(path), json.dumps(data), output))
+
+    def rewrite_csv(self, path, fieldnames: list[str], rows: list[dict]) -> None:
+        """Queue an atomic rewrite of a whole CSV (rows copied now, formatted off the loop)."""
+        fieldnames, rows = list(fieldnames), [dict(r) for r in rows]
+        self._queue.put_nowait(("snapshot", Path(path), lambda: format_csv(fieldnames, rows, header=True), False))
+
+    def submit(self, fn: Callable, *args) -> None:
+        """Queue fn(*args) to run in a worker thread, after everything queued before it is written."""
+        self._queue.put_nowait(("call", fn, args))
+
+    async def flush(self) -> None:
+        """Wait until everything queued so far is on disk. Raises WriterError if rows could not be appended."""
+        done = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(("flush", done))
+        await done
+
+    async def close(self) -> None:
+        """Write everything still queued and stop the task. Raises WriterError if rows were left unwritten."""
+        if self._task is None:
+            return
+        self._queue.put_nowait((_CLOSE,))
+        try:
+            await self._task
+        finally:
+            self._task = None
+        if self.error is not None:
+            raise WriterError(f"{self._pending_rows} rows could not be written: {self.error}") from self.error
+
+    # ---- writer task ----
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            try:
+                items = [await asyncio.wait_for(self._queue.get(), timeout)]
+            except asyncio.TimeoutError:
+                await self._safe(self._flush_appends())
+                deadline = None
+                continue
+            while not self._queue.empty():
+                items.append(self._queue.get_nowait())
+
+            closing = False
+            for item in items:
+                kind = item[0]
+                if kind == "append":
+                    _, path, fieldnames, rows, after = item
+                    entry = self._appends.setdefault(path, (fieldnames, [], []))
+                    entry[1].extend(rows)
+                    if after:
+                        entry[2].append(after)
+                    self._pending_rows += len(rows)
+                    if deadline is None:
+                        deadline = loop.time() + self.flush_seconds
+                elif kind == "snapshot":
+                    _, path, render, keep_previous = item
+                    await self._safe(self._flush_appends())
+                    self._snapshots[path] = (render, keep_previous)
+                elif kind == "checkpoint":
+                    _, path, text, output = item
+                    await self._safe(self._flush_appends())
+                    if self._appends:
+                        # Its progress may cover rows that failed to append: never let it claim them
+                        logger.error("Checkpoint %s held back: %d rows are not on disk (%s)",
+                                     path, self._pending_rows, self.error)
+                        continue
+                    # Measured now: rows queued after this checkpoint may be written before it is
+                    size = output_size(output) if output is not None else 0
+                    self._snapshots[path] = (lambda t=text, o=output, n=size: _render_checkpoint(t, o, n), True)
+                elif kind == "call":
+                    await self._safe(self._flush_all())
+                    _, fn, args = item
+                    await self._safe(asyncio.to_thread(fn, *args))
+                elif kind == "flush":
+                    await self._safe(self._flush_all())
+                    if self.error is not None:
+                        item[1].set_exception(WriterError(f"{self._pending_rows} rows could not be written: {self.error}"))
+                    else:
+                        item[1].set_result(None)
+                elif kind is _CLOSE:
+                    closing = True
+
+            if self._pending_rows >= self.flush_rows or closing:
+                await self._safe(self._flush_appends())
+            if self._pending_rows == 0:
+                deadline = None
+            await self._safe(self._write_snapshots())
+            if closing:
+                for out in self._files.values():
+                    await self._safe(asyncio.to_thread(out.close))
+                self._files.clear()
+                return
+
+    async def _safe(self, coro) -> None:
+        # A failed write is logged, not raised: the task must keep serving later writes
+        try:
+            await coro
+        except Exception as e:
+            logger.exception("Writer error: %s", e)
+
+    async def _flush_all(self) -> None:
+        await self._flush_appends()
+        await self._write_snapshots()
+
+    async def _flush_appends(self) -> None:
+        appends, self._appends, self._pending_rows = self._appends, {}, 0
+        failure = None
+        for path, (fieldnames, rows, callbacks) in appends.items():
+            try:
+                out = self._files.get(path)
+                if out is None:
+                    # Batching happens here, so the appender only flushes when told to
+                    out = BufferedCsvWriter(path, fieldnames, flush_rows=sys.maxsize, flush_seconds=float("inf"))
+                    await asyncio.to_thread(out.open)
+                    self._files[path] = out
+                await asyncio.to_thread(self._write_rows, out, rows)
+            except Exception as e:
+                # Keep the rows and their callbacks for the next flush; reopening the
+                # file drops any partial row this attempt left behind
+                broken = self._files.pop(path, None)
+                if broken is not None:
+                    try:
+                        await asyncio.to_thread(broken.close)
+                    except Exception:
+                        pass
+                self._appends[path] = (fieldnames, rows, callbacks)
+                self._pending_rows += len(rows)
+                failure = failure or e
+                continue
+            self.rows_written += len(rows)
+            self.flushes += 1
+            for callback in callbacks:
+                callback()
+        if failure is not None:
+            self.error = failure
+            raise failure
+        if not self._appends:
+            self.error = None
+
+    @staticmethod
+    def _write_rows(out: BufferedCsvWriter, rows: list[dict]) -> None:
+        out.writerows(rows)
+        out.flush()
+
+    async def _write_snapshots(self) -> None:
+        snapshots, self._snapshots = self._snapshots, {}
+        for path, (render, keep_previous) in snapshots.items():
+            await write_atomic(path, await asyncio.to_thread(render), keep_previous)
@@ -0,0 +1,290 @@
+"""
+Benchmarks for scraper hot paths.
+
+    python benchmark.py pdp URL [URL ...]        # CDP round trips and latency per product page
+    python benchmark.py extract URL [URL ...]    # in-page extraction time, full vs scoped
+    python benchmark.py urls [--count 100000]    # URL canonicalization + SKU throughput
+    python benchmark.py profiles URL [URL ...]   # CPU and RSS per page for each execution profile
+
+The pdp benchmark loads each URL with every extraction mode and reports CDP
+round trips (page.evaluate calls), evaluated script bytes, time spent in
+them, and wall time per product. The extract benchmark loads each URL once
+and times EXTRACT_ALL_JS variants in the page with performance.now(), so
+heavy PDPs show the cost of full-body innerText scans directly. Point either
+at a handful of product pages; neither writes any CSVs. The urls benchmark
+needs no browser: it runs synthetic listing links (each repeated, as across
+listing pages and pagination merges) through the old per-call helpers and
+through product_urls. The profiles benchmark runs the production PDP
+extraction over the URLs once per execution profile (browser_profiles.py)
+and reports browser CPU seconds and RSS per page, for sizing tabs per host.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import re
+import statistics
+import time
+
+import nodriver as uc
+
+from browser_profiles import PROFILES, ResourceMeter, add_profile_argument, start_browser
+from config import PAGE_LOAD_WAIT
+import add_product_details
+import product_urls
+
+logger = logging.getLogger(__name__)
+
+
+class CountingPage:
+    """Wraps a nodriver tab and counts evaluate() round trips, payload size and latency."""
+
+    def __init__(self, page, stats: dict) -> None:
+        self._page = page
+        self._stats = stats
+
+    async def evaluate(self, *args, **kwargs):
+        expression = args[0] if args else kwargs.get("expression", "")
+        self._stats["payload_bytes"] += len(expression.encode("utf-8"))
+        start = time.perf_counter()
+        try:
+            return await self._page.evaluate(*args, **kwargs)
+        finally:
+            self._stats["round_trips"] += 1
+            self._stats["evaluate_s"] += time.perf_counter() - start
+
+    def __getattr__(self, name):
+        return getattr(self._page, name)
+
+
+class CountingBrowser:
+    """Wraps a nodriver browser so every tab it returns is a CountingPage."""
+
+    def __init__(self, browser, stats: dict) -> None:
+        self._browser = browser
+        self._stats = stats
+
+    async def get(self, *args, **kwargs):
+        return CountingPage(await self._browser.get(*args, **kwargs), self._stats)
+
+    def __getattr__(self, name):
+        return getattr(self._browser, name)
+
+
+PDP_MODES = {
+    "stepwise": add_product_details.get_product_details_stepwise,
+    "batched": add_product_details.get_product_details,
+}
+
+
+async def bench_pdp(urls: list[str], modes: list[str], profile=None) -> list[dict]:
+    """Run each extraction mode over urls and return one result row per mode."""
+    browser = await start_browser(profile)
+    rows = []
+    try:
+        for mode in modes:
+            stats = {"round_trips": 0, "evaluate_s": 0.0, "payload_bytes": 0}
+            counting = CountingBrowser(browser, stats)
+            start = time.perf_counter()
+            for url in urls:
+                await PDP_MODES[mode](counting, url)
+            wall = time.perf_counter() - start
+            n = len(urls)
+            rows.append({
+                "mode": mode,
+                "products": n,
+                "round_trips_per_product": stats["round_trips"] / n,
+                "payload_bytes_per_product": stats["payload_bytes"] // n,
+                "evaluate_ms_per_product": stats["evaluate_s"] * 1000 / n,
+                "wall_s_per_product": wall / n,
+            })
+    finally:
+        browser.stop()
+    return rows
+
+
+EXTRACT_VARIANTS = {
+    "full": add_product_details.EXTRACT_ALL_FULL_JS,
+    "scoped": add_product_details.EXTRACT_ALL_JS,
+}
+
+# Times one extractor run inside the page
+TIMED_EXTRACT_JS = """
+(function() {
+    const t0 = performance.now();
+    const result = JSON.parse(__EXTRACT__);
+    return JSON.stringify({ms: performance.now() - t0, scoped: !!result.scoped});
+})()
+"""
+
+
+async def bench_extract(urls: list[str], repeats: int, profile=None) -> list[dict]:
+    """Time each EXTRACT_ALL_JS variant in-page on every url; one result row per variant."""
+    browser = await start_browser(profile)
+    timings = {variant: [] for variant in EXTRACT_VARIANTS}
+    scoped_pages = {variant: 0 for variant in EXTRACT_VARIANTS}
+    try:
+        for url in urls:
+            page = await browser.get(url)
+            await asyncio.sleep(PAGE_LOAD_WAIT)
+            await add_product_details.human_like_scroll(page)
+            for repeat in range(repeats):
+                # Interleave variants so layout caching favours neither
+                for variant, js in EXTRACT_VARIANTS.items():
+                    expression = TIMED_EXTRACT_JS.replace("__EXTRACT__", js.strip().rstrip(";"))
+                    out = json.loads(await page.evaluate(expression))
+                    timings[variant].append(out["ms"])
+                    if repeat == 0:
+                        scoped_pages[variant] += out["scoped"]
+    finally:
+        browser.stop()
+
+    rows = []
+    for variant, values in timings.items():
+        rows.append({
+            "variant": variant,
+            "pages": len(urls),
+            "scoped_pages": scoped_pages[variant],
+            "mean_ms": statistics.mean(values),
+            "median_ms": statistics.median(values),
+            "max_ms": max(values),
+        })
+    baseline = rows[0]["mean_ms"]
+    for row in rows:
+        row["speedup"] = baseline / row["mean_ms"] if row["mean_ms"] else 0.0
+    return rows
+
+
+async def bench_profiles(urls: list[str], profiles: list[str]) -> list[dict]:
+    """Production PDP extraction over urls under each profile; one row of per-page cost per profile."""
+    rows = []
+    for name in profiles:
+        browser = await start_browser(name)
+        try:
+            meter = ResourceMeter(name, browser)
+            extracted = 0
+            for url in urls:
+                details = await add_product_details.get_product_details(browser, url)
+                extracted += bool(details["all_images"] or details["dimensions"])
+                meter.page_done()
+            row = meter.summary()
+            row["pages_with_data"] = extracted
+            rows.append(row)
+        finally:
+            browser.stop()
+    return rows
+
+
+def _legacy_normalize(url: str) -> str:
+    u = url.strip().split("?")[0].rstrip("/")
+    if u.startswith("/"):
+        u = "https://www.cb2.com" + u
+    elif not u.startswith("http"):
+        u = "https://www.cb2.com/" + u.lstrip("/")
+    return u
+
+
+def _legacy_sku(url: str) -> str:
+    match = re.search(r'/s(\d{5,6})', url)
+    return match.group(1) if match else ""
+
+
+def synthetic_links(count: int, repeat: int) -> list[str]:
+    """count listing hrefs, each distinct link appearing about repeat times, in mixed forms."""
+    rng = random.Random(42)
+    distinct = []
+    for i in range(max(1, count // repeat)):
+        path = f"/furniture/item-{i}/s{100000 + i}"
+        distinct.append(rng.choice([path, path + "/", path + "?localedetail=US", "https://www.cb2.com" + path]))
+    return [rng.choice(distinct) for _ in range(count)]
+
+
+def bench_urls(count: int, repeat: int) -> list[dict]:
+    """Time canonical URL + SKU for count links: legacy per-call, memoized per-call, and batch."""
+    links = synthetic_links(count, repeat)
+
+    def legacy():
+        return [(u, _legacy_sku(u)) for u in map(_legacy_normalize, links)]
+
+    def per_call():
+        return [(u, product_urls.product_sku(u)) for u in map(product_urls.canonical_url, links)]
+
+    def batch():
+        return product_urls.canonicalize_batch(links)
+
+    rows = []
+    for name, fn in (("legacy", legacy), ("memoized", per_call), ("batch", batch)):
+        product_urls.canonical_url.cache_clear()
+        product_urls.product_sku.cache_clear()
+        start = time.perf_counter()
+        fn()
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        fn()
+        warm = time.perf_counter() - start
+        rows.append({
+            "variant": name,
+            "urls": count,
+            "cold_ms": cold * 1000,
+            "warm_ms": warm * 1000,
+            "urls_per_s": int(count / cold) if cold else 0,
+        })
+    baseline = rows[0]["cold_ms"]
+    for row in rows:
+        row["speedup"] = baseline / row["cold_ms"] if row["cold_ms"] else 0.0
+    return rows
+
+
+def print_table(rows: list[dict]) -> None:
+    if not rows:
+        return
+    columns = list(rows[0].keys())
+    widths = {c: max(len(c), *(len(_fmt(r[c])) for r in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for r in rows:
+        print("  ".join(_fmt(r[c]).ljust(widths[c]) for c in columns))
+
+
+def _fmt(value) -> str:
+    return f"{value:.2f}" if isinstance(value, float) else str(value)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Scraper benchmarks.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    pdp = sub.add_parser("pdp", help="CDP round trips and latency per product page")
+    pdp.add_argument("urls", nargs="+")
+    pdp.add_argument("--modes", default=",".join(PDP_MODES), help="Comma-separated: " + ", ".join(PDP_MODES))
+    add_profile_argument(pdp)
+
+    extract = sub.add_parser("extract", help="In-page extraction time, full-body vs scoped")
+    extract.add_argument("urls", nargs="+")
+    extract.add_argument("--repeats", type=int, default=5)
+    add_profile_argument(extract)
+
+    profiles = sub.add_parser("profiles", help="Browser CPU and RSS per page for each execution profile")
+    profiles.add_argument("urls", nargs="+")
+    profiles.add_argument("--profiles", default=",".join(PROFILES), help="Comma-separated: " + ", ".join(PROFILES))
+
+    urls = sub.add_parser("urls", help="URL canonicalization + SKU extraction throughput (no browser)")
+    urls.add_argument("--count", type=int, default=100_000)
+    urls.add_argument("--repeat", type=int, default=5, help="Average appearances of each distinct link")
+
+    args = parser.parse_args()
+    if args.command == "pdp":
+        modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+        print_table(uc.loop().run_until_complete(bench_pdp(args.urls, modes, args.profile)))
+    elif args.command == "extract":
+        print_table(uc.loop().run_until_complete(bench_extract(args.urls, args.repeats, args.profile)))
+    elif args.command == "profiles":
+        names = [p.strip() for p in args.profiles.split(",") if p.strip()]
+        print_table(uc.loop().run_until_complete(bench_profiles(args.urls, names)))
+    elif args.command == "urls":
+        print_table(bench_urls(args.count, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Distributed crawl mode: a TCP broker in front of the SQLite work queue.
+
+    python broker.py serve --port 8642                       # on the queue host
+    python broker.py enqueue enrich --input cb2_all_products.csv
+    python broker.py worker enrich --broker queue-host:8642  # on every crawl host
+    python broker.py status
+    python broker.py merge enrich --input cb2_all_products.csv
+
+The broker owns work_queue.sqlite and serves it over newline-delimited JSON
+({"op": ..., "args": {...}} -> {"ok": ..., "result": ...}). Workers on any
+host lease jobs, heartbeat, and send results and metrics back through
+RemoteQueue, which has the same methods as WorkQueue, so coordinator.run_worker
+runs unchanged against either. Scaling out is starting more workers.
+
+Enrich jobs are one per SKU (the job key), so a SKU is handed out once no
+matter how many input rows or enqueue calls name it. Results are committed
+exactly once: the broker serializes every request, a completion is accepted
+only from the worker holding the lease, and a retried completion after a
+dropped connection is acknowledged without being written twice.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from dataclasses import asdict
+from typing import Any, Optional
+
+import nodriver as uc
+
+from browser_profiles import add_profile_argument
+from config import BROKER_HOST, BROKER_PORT, BROKER_RETRIES, BROKER_TIMEOUT, WORK_QUEUE_DB
+from work_queue import Job, WorkQueue
+import add_product_details
+import coordinator
+import full_scraper
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+# WorkQueue methods callable over the wire
+BROKER_OPS = {
+    "enqueue_many", "lease", "heartbeat", "complete", "fail", "report",
+    "reclaim_expired", "counts", "results", "worker_stats",
+}
+
+# Shared secret, optional; set the same value on the broker and every worker
+BROKER_TOKEN = os.environ.get("CB2_BROKER_TOKEN", "")
+
+
+# ==================== SERVER ====================
+
+class Broker:
+    """Serves one WorkQueue to remote workers. Requests are handled one at a time."""
+
+    def __init__(self, db_path: str, token: str = BROKER_TOKEN) -> None:
+        self.queue = WorkQueue(db_path)
+        self.token = token
+
+    def dispatch(self, request: dict) -> dict:
+        op = request.get("op")
+        if self.token and request.get("token") != self.token:
+            return {"ok": False, "error": "bad token"}
+        if op not in BROKER_OPS:
+            return {"ok": False, "error": f"unknown op {op!r}"}
+        try:
+            result = getattr(self.queue, op)(**request.get("args", {}))
+        except Exception as e:
+            logger.exception("Op %s failed", op)
+            return {"ok": False, "error": repr(e)}
+        if isinstance(result, Job):
+            result = asdict(result)
+        return {"ok": True, "result": result}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = writer.get_extra_info("peername")
+        logger.debug("Connection from %s", peer)
+        try:
+            while line := await reader.readline():
+                try:
+                    response = self.dispatch(json.loads(line))
+                except json.JSONDecodeError:
+                    response = {"ok": False, "error": "bad request"}
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def reclaim_loop(self, every: float) -> None:
+        while True:
+            await asyncio.sleep(every)
+            reclaimed = self.queue.reclaim_expired()
+            if reclaimed:
+                logger.info("Reclaimed %d expired lease(s)", reclaimed)
+
+    async def serve(self, host: str, port: int, reclaim_every: float = 30) -> None:
+        server = await asyncio.start_server(self.handle, host, port, limit=64 * 1024 * 1024)
+        logger.info("Broker on %s:%d (queue %s)", host, port, self.queue.db_path)
+        reclaimer = asyncio.create_task(self.reclaim_loop(reclaim_every))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            reclaimer.cancel()
+            self.queue.close()
+
+
+# ==================== CLIENT ====================
+
+class RemoteQueue:
+    """
+    WorkQueue-compatible client for a broker. Reconnects and retries on network errors.
+
+    Calls block on the network (and on retry back-off), so coordinator.run_worker
+    runs them in threads (blocking_io); a lock keeps one request on the socket
+    at a time. Retrying lease is safe: the broker hands a worker the job it
+    already holds rather than a second one.
+    """
+
+    blocking_io = True
+
+    def __init__(self, host: str = BROKER_HOST, port: int = BROKER_PORT, token: str = BROKER_TOKEN,
+                 timeout: float = BROKER_TIMEOUT, retries: int = BROKER_RETRIES) -> None:
+        self.host = host
+        self.port = port
+        self.token = token
+        self.timeout = timeout
+        self.retries = retries
+        self._sock: Optional[socket.socket] = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> None:
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._file = self._sock.makefile("rwb")
+
+    def close(self) -> None:
+        if self._sock:
+            try:
+                self._file.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = self._file = None
+
+    def _call(self, op: str, **args) -> Any:
+        with self._lock:
+            return self._call_locked(op, **args)
+
+    def _call_locked(self, op: str, **args) -> Any:
+        request = json.dumps({"op": op, "args": args, "token": self.token}).encode("utf-8") + b"\n"
+        for attempt in range(1, self.retries + 1):
+            try:
+                if self._sock is None:
+                    self._connect()
+                self._file.write(request)
+                self._file.flush()
+                line = self._file.readline()
+                if not line:
+                    raise ConnectionError("broker closed the connection")
+                break
+            except OSError as e:
+                self.close()
+                if attempt == self.retries:
+                    raise
+                logger.warning("Broker %s:%d unreachable (%s), retry %d", self.host, self.port, e, attempt)
+                time.sleep(min(2 ** attempt, 30))
+        response = json.loads(line)
+        if not response["ok"]:
+            raise RuntimeError(f"broker {op}: {response['error']}")
+        return response["result"]
+
+    def enqueue_many(self, kind: str, jobs: list[tuple[str, dict]]) -> int:
+        return self._call("enqueue_many", kind=kind, jobs=jobs)
+
+    def lease(self, worker: str, kind: Optional[str] = None) -> Optional[Job]:
+        job = self._call("lease", worker=worker, kind=kind)
+        return Job(**job) if job else None
+
+    def heartbeat(self, job_id: int, worker: str) -> bool:
+        return self._call("heartbeat", job_id=job_id, worker=worker)
+
+    def complete(self, job_id: int, worker: str, result: Any) -> bool:
+        return self._call("complete", job_id=job_id, worker=worker, result=result)
+
+    def fail(self, job_id: int, worker: str, error: str) -> None:
+        self._call("fail", job_id=job_id, worker=worker, error=error)
+
+    def report(self, worker: str, done: int = 0, failed: int = 0, busy_seconds: float = 0.0, metrics: Optional[dict] = None) -> None:
+        self._call("report", worker=worker, done=done, failed=failed, busy_seconds=busy_seconds, metrics=metrics)
+
+    def counts(self, kind: Optional[str] = None) -> dict[str, int]:
+        return self._call("counts", kind=kind)
+
+    def results(self, kind: str) -> list[tuple[str, Any]]:
+        return [tuple(r) for r in self._call("results", kind=kind)]
+
+    def worker_stats(self) -> list[dict]:
+        return self._call("worker_stats")
+
+
+# ==================== CLI ====================
+
+def parse_address(address: str) -> tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host or BROKER_HOST, int(port) if port else BROKER_PORT
+
+
+def print_status(queue) -> None:
+    for kind in (coordinator.LISTING, coordinator.ENRICH):
+        print(f"{kind:8} {queue.counts(kind)}")
+    for w in queue.worker_stats():
+        age = time.time() - w["last_seen"]
+        print(f"  {w['worker']:40} done={w['jobs_done']:<6} failed={w['jobs_failed']:<4} "
+              f"busy={w['busy_seconds']:.0f}s seen={age:.0f}s ago {w['metrics']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Distributed crawl: broker, workers and job management.")
+    parser.add_argument("--broker", default=f"{BROKER_HOST}:{BROKER_PORT}", help="host:port of the broker")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="Run the broker")
+    serve.add_argument("--host", default=BROKER_HOST)
+    serve.add_argument("--port", type=int, default=BROKER_PORT)
+    serve.add_argument("--db", default=WORK_QUEUE_DB)
+
+    enqueue = sub.add_parser("enqueue", help="Add jobs through the broker")
+    enqueue.add_argument("stage", choices=[coordinator.LISTING, coordinator.ENRICH])
+    enqueue.add_argument("--input", default=str(add_product_details.INPUT_CSV))
+
+    worker = sub.add_parser("worker", help="Run one crawl worker against the broker")
+    worker.add_argument("stage", choices=[coordinator.LISTING, coordinator.ENRICH])
+    worker.add_argument("--id", help="Worker id (default: host-pid)")
+    add_profile_argument(worker)
+
+    sub.add_parser("status", help="Job counts and per-worker metrics")
+
+    merge = sub.add_parser("merge", help="Fetch results from the broker and write the stage's CSV")
+    merge.add_argument("stage", choices=[coordinator.LISTING, coordinator.ENRICH])
+    merge.add_argument("--input", default=str(add_product_details.INPUT_CSV))
+    merge.add_argument("--output")
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        asyncio.run(Broker(args.db).serve(args.host, args.port))
+        return
+
+    queue = RemoteQueue(*parse_address(args.broker))
+    try:
+        if args.command == "enqueue":
+            if args.stage == coordinator.LISTING:
+                jobs = coordinator.listing_jobs()
+            else:
+                jobs = coordinator.enrich_jobs(args.input, shard_size=1)
+            added = queue.enqueue_many(args.stage, jobs)
+            logger.info("Enqueued %d new %s jobs (%d already known)", added, args.stage, len(jobs) - added)
+        elif args.command == "worker":
+            worker_id = args.id or f"{socket.gethostname()}-{os.getpid()}"
+            coordinator.configure_worker_logging(worker_id)
+            uc.loop().run_until_complete(coordinator.run_worker(queue, worker_id, args.stage, args.profile))
+        elif args.command == "status":
+            print_status(queue)
+        elif args.command == "merge":
+            if args.stage == coordinator.LISTING:
+                coordinator.merge_listing(queue, args.output or add_product_details.INPUT_CSV, full_scraper.MEMBERSHIP_CSV)
+            else:
+                coordinator.merge_enrich(queue, args.input, args.output or add_product_details.OUTPUT_CSV)
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Execution profiles: how the browser is launched, and what it costs per page.
+
+    headed-debug       visible window at WINDOW_WIDTH x WINDOW_HEIGHT, as before;
+                       for watching a run or solving a CAPTCHA by hand
+    headless-fast      headless, 1366x768, no GPU compositing (default)
+    minimal-viewport   headless, 1024x768 at scale 1, no web fonts or smooth
+                       scrolling; the least rendering work per page
+
+Choose one with --profile on any command, or CB2_PROFILE / EXECUTION_PROFILE.
+
+    browser = await start_browser(profile)
+    meter = ResourceMeter(profile, browser)
+    ...
+    meter.page_done()          # after each page load
+    meter.log()                # CPU seconds per page and RSS of the browser process tree
+
+CPU and RSS come from psutil when it is installed, else from /proc (Linux);
+with neither, only the Python process's own CPU time is reported.
+"""
+
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import nodriver as uc
+
+from config import EXECUTION_PROFILE, WINDOW_HEIGHT, WINDOW_WIDTH
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+STEALTH_ARGS = ('--disable-blink-features=AutomationControlled',)
+
+
+@dataclass(frozen=True)
+class ExecutionProfile:
+    name: str
+    headless: bool
+    width: int
+    height: int
+    browser_args: tuple[str, ...] = field(default=())
+
+    def start_kwargs(self, user_data_dir: Optional[str] = None) -> dict:
+        """Keyword arguments for nodriver.start()."""
+        kw = {
+            "headless": self.headless,
+            "browser_args": [*STEALTH_ARGS, f"--window-size={self.width},{self.height}", *self.browser_args],
+        }
+        if user_data_dir:
+            kw["user_data_dir"] = user_data_dir
+        return kw
+
+
+PROFILES = {
+    "headed-debug": ExecutionProfile("headed-debug", headless=False, width=WINDOW_WIDTH, height=WINDOW_HEIGHT),
+    "headless-fast": ExecutionProfile(
+        "headless-fast", headless=True, width=1366, height=768,
+        browser_args=("--disable-gpu", "--disable-dev-shm-usage", "--mute-audio"),
+    ),
+    "minimal-viewport": ExecutionProfile(
+        "minimal-viewport", headless=True, width=1024, height=768,
+        browser_args=(
+            "--disable-gpu", "--disable-dev-shm-usage", "--mute-audio",
+            "--force-device-scale-factor=1", "--disable-remote-fonts", "--disable-smooth-scrolling",
+        ),
+    ),
+}
+
+
+def get_profile(name: Optional[str] = None) -> ExecutionProfile:
+    name = name or EXECUTION_PROFILE
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown execution profile {name!r}; choose from {', '.join(PROFILES)}") from None
+
+
+def add_profile_argument(parser) -> None:
+    """--profile option shared by every command that starts a browser."""
+    parser.add_argument("--profile", choices=list(PROFILES), default=EXECUTION_PROFILE,
+                        help=f"browser execution profile (default: {EXECUTION_PROFILE})")
+
+
+async def start_browser(profile=None, user_data_dir: Optional[str] = None):
+    """Start nodriver with a profile (an ExecutionProfile or its name)."""
+    if not isinstance(profile, ExecutionProfile):
+        profile = get_profile(profile)
+    browser = await uc.start(**profile.start_kwargs(user_data_dir))
+    if not profile.headless:
+        try:
+            await browser.main_tab.set_window_size(width=profile.width, height=profile.height)
+        except Exception:
+            pass
+    logger.info("Browser started (profile %s, %dx%d%s)", profile.name, profile.width, profile.height,
+                ", headless" if profile.headless else "")
+    return browser
+
+
+def browser_pid(browser) -> Optional[int]:
+    return getattr(browser, "_process_pid", None)
+
+
+# ==================== PROCESS TREE SAMPLING ====================
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _proc_table() -> dict[int, tuple[int, float, int]]:
+    """pid -> (parent pid, cpu seconds, rss bytes) for every process, from /proc."""
+    table = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                stat = f.read().decode("utf-8", "replace")
+        except OSError:
+            continue
+        # Fields after the parenthesised command name, which may contain spaces
+        fields = stat[stat.rfind(")") + 2:].split()
+        ppid = int(fields[1])
+        cpu = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+        rss = int(fields[21]) * _PAGE_SIZE
+        table[int(entry)] = (ppid, cpu, rss)
+    return table
+
+
+def process_tree_usage(pid: int) -> dict[int, tuple[float, int]]:
+    """pid -> (cpu seconds, rss bytes) for pid and all its descendants (empty if unavailable)."""
+    if psutil is not None:
+        try:
+            root = psutil.Process(pid)
+            usage = {}
+            for proc in [root, *root.children(recursive=True)]:
+                try:
+                    t = proc.cpu_times()
+                    usage[proc.pid] = (t.user + t.system, proc.memory_info().rss)
+                except psutil.Error:
+                    continue
+            return usage
+        except psutil.Error:
+            return {}
+    if not os.path.isdir("/proc"):
+        return {}
+    table = _proc_table()
+    if pid not in table:
+        return {}
+    children: dict[int, list[int]] = {}
+    for p, (ppid, _, _) in table.items():
+        children.setdefault(ppid, []).append(p)
+    usage, stack = {}, [pid]
+    while stack:
+        p = stack.pop()
+        usage[p] = table[p][1:]
+        stack.extend(children.get(p, []))
+    return usage
+
+
+class ResourceMeter:
+    """Per-page CPU time and RSS of a browser's process tree (plus this process's CPU)."""
+
+    def __init__(self, profile, browser=None) -> None:
+        self.profile = profile.name if isinstance(profile, ExecutionProfile) else (profile or EXECUTION_PROFILE)
+        self.pages = 0
+        self.browser_cpu = 0.0
+        self.rss = 0
+        self.peak_rss = 0
+        self._pid = None
+        self._last_cpu: dict[int, float] = {}
+        self._python_cpu0 = time.process_time()
+        self._wall0 = time.perf_counter()
+        if browser is not None:
+            self.attach(browser)
+
+    def attach(self, browser) -> None:
+        """Measure a (re)started browser from now on; CPU used so far is kept."""
+        self.sample()
+        self._pid = browser_pid(browser)
+        self._last_cpu = {p: cpu for p, (cpu, _) in process_tree_usage(self._pid).items()} if self._pid else {}
+
+    def sample(self) -> int:
+        """Add CPU used since the last sample; returns the current tree RSS in bytes."""
+        if not self._pid:
+            return 0
+        usage = process_tree_usage(self._pid)
+        for p, (cpu, _) in usage.items():
+            # Renderers come and go: count each live process's growth, never a negative delta
+            self.browser_cpu += max(0.0, cpu - self._last_cpu.get(p, 0.0))
+        self._last_cpu = {p: cpu for p, (cpu, _) in usage.items()}
+        self.rss = sum(rss for _, rss in usage.values())
+        self.peak_rss = max(self.peak_rss, self.rss)
+        return self.rss
+
+    def page_done(self, pages: int = 1) -> None:
+        self.pages += pages
+        self.sample()
+
+    def summary(self) -> dict:
+        pages = max(self.pages, 1)
+        return {
+            "profile": self.profile,
+            "pages": self.pages,
+            "wall_s_per_page": (time.perf_counter() - self._wall0) / pages,
+            "browser_cpu_s_per_page": self.browser_cpu / pages,
+            "python_cpu_s_per_page": (time.process_time() - self._python_cpu0) / pages,
+            "rss_mb": self.rss / 2**20,
+            "peak_rss_mb": self.peak_rss / 2**20,
+        }
+
+    def log(self) -> None:
+        s = self.summary()
+        if not self._pid or (psutil is None and not os.path.isdir("/proc")):
+            logger.info("Profile %s: %d pages, python CPU %.3f s/page (install psutil for browser CPU/RSS)",
+                        s["profile"], s["pages"], s["python_cpu_s_per_page"])
+            return
+        logger.info("Profile %s: %d pages, browser CPU %.2f s/page, python CPU %.3f s/page, RSS %.0f MB (peak %.0f MB)",
+                    s["profile"], s["pages"], s["browser_cpu_s_per_page"], s["python_cpu_s_per_page"],
+                    s["rss_mb"], s["peak_rss_mb"])
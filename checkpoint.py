@@ -0,0 +1,137 @@
+"""
+Atomic, checksummed progress checkpoints with a previous generation.
+
+A checkpoint file is a small JSON envelope:
+
+    {"format": "cb2-checkpoint/1", "sha256": "...", "saved_at": "...", "data": {...}}
+
+save_checkpoint writes a temp file, fsyncs it, moves the current checkpoint
+to <name>.prev and renames the temp file into place, so there is always one
+complete generation on disk. load_checkpoint verifies the checksum and falls
+back to .prev when the newest file is missing, truncated or corrupt; plain
+JSON progress files from before this format are still read.
+
+Checkpoints can also record how far the output CSV had been written
+(output_bytes); on resume, output_tail() returns only the rows appended
+after that point, which are the ones to reconcile.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FORMAT = "cb2-checkpoint/1"
+
+
+def _digest(payload: str) -> str:
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def encode_checkpoint(data: Any) -> str:
+    payload = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return json.dumps({
+        "format": CHECKPOINT_FORMAT,
+        "sha256": _digest(payload),
+        "saved_at": datetime.now().isoformat(timespec="seconds"),
+        "data": data,
+    })
+
+
+def decode_checkpoint(text: str) -> Any:
+    """Data from a checkpoint (or legacy plain JSON). Raises ValueError if it is damaged."""
+    doc = json.loads(text)
+    if not (isinstance(doc, dict) and doc.get("format") == CHECKPOINT_FORMAT):
+        return doc
+    payload = json.dumps(doc["data"], sort_keys=True, separators=(",", ":"))
+    if _digest(payload) != doc.get("sha256"):
+        raise ValueError("checksum mismatch")
+    return doc["data"]
+
+
+def previous_path(path: Path) -> Path:
+    return path.with_name(path.name + ".prev")
+
+
+def replace_keeping_previous(tmp: Path, path: Path) -> None:
+    """Rename tmp over path, keeping the current path as its .prev generation."""
+    if path.exists():
+        os.replace(path, previous_path(path))
+    os.replace(tmp, path)
+
+
+def save_checkpoint(path, data: Any) -> None:
+    """Atomically write a checksummed checkpoint, keeping the previous one as .prev."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(encode_checkpoint(data))
+        f.flush()
+        os.fsync(f.fileno())
+    replace_keeping_previous(tmp, path)
+
+
+def load_checkpoint(path, default: Optional[dict] = None) -> dict:
+    """Newest valid generation of a checkpoint, or a copy of default if there is none."""
+    path = Path(path)
+    for candidate in (path, previous_path(path)):
+        if not candidate.exists():
+            continue
+        try:
+            data = decode_checkpoint(candidate.read_text(encoding="utf-8"))
+        except (ValueError, KeyError, OSError) as e:
+            logger.warning("Checkpoint %s is damaged (%s) - trying the previous generation", candidate, e)
+            continue
+        if candidate != path:
+            logger.warning("Resuming from previous checkpoint generation %s", candidate)
+        return data
+    if path.exists() or previous_path(path).exists():
+        logger.error("No valid checkpoint generation for %s - starting from scratch", path)
+    return dict(default or {})
+
+
+def output_size(csv_path) -> int:
+    """Current size of an output file (0 if missing), for a checkpoint's output_bytes."""
+    try:
+        return os.path.getsize(csv_path)
+    except OSError:
+        return 0
+
+
+def output_tail(csv_path, offset: int) -> Optional[list[dict]]:
+    """
+    Rows appended to csv_path after byte offset (as recorded in a checkpoint).
+
+    Returns None if the file is shorter than offset (rewritten or truncated
+    since), meaning the whole file has to be reconciled instead.
+    """
+    path = Path(csv_path)
+    if not path.exists():
+        return None if offset else []
+    with open(path, "rb") as f:
+        header_line = f.readline()
+        size = f.seek(0, os.SEEK_END)
+        if offset > size:
+            return None
+        f.seek(max(offset, len(header_line)))
+        tail = f.read()
+    header = next(csv.reader(io.StringIO(header_line.decode("utf-8"))), [])
+    return list(csv.DictReader(io.StringIO(tail.decode("utf-8", errors="replace")), fieldnames=header))
+
+
+def read_output_rows(csv_path, offset: int = 0) -> list[dict]:
+    """Rows after offset, or every row when the tail cannot be trusted."""
+    tail = output_tail(csv_path, offset)
+    if tail is not None:
+        return tail
+    logger.warning("%s changed since the checkpoint - reconciling against the whole file", csv_path)
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
@@ -7,7 +7,8 @@ from dataclasses import dataclass
 from typing import Optional
 
 # --- Base URL ---
-BASE_URL = "https://www.cb2.com"
+# CB2_BASE_URL points every scraper at another host, e.g. the local mock_server.py
+BASE_URL = os.environ.get("CB2_BASE_URL", "https://www.cb2.com").rstrip("/")
 
 # --- Anti-Detection: Delays (seconds) ---
 MIN_DELAY = 2
@@ -17,6 +18,11 @@ PAGE_LOAD_WAIT = 4
 BETWEEN_CATEGORY_DELAY = 3
 BETWEEN_PRODUCT_DELAY = 1
 
+# --- Listing pagination ---
+LISTING_MAX_SCROLLS = 30
+LISTING_MAX_PAGES = 50
+LISTING_PAGE_CONCURRENCY = 3
+
 # --- Rate Limiting ---
 MAX_REQUESTS_PER_MINUTE = 30
 BATCH_SAVE_EVERY = 50
@@ -29,16 +35,80 @@ RETRY_DELAY = 5
 # --- Output ---
 OUTPUT_CSV = "cb2_products.csv"
 PROGRESS_JSON = "progress.json"
+PRODUCT_ID_MODE = "stable"      # "stable": UUIDv5 of the SKU, same on every run; "uuid7": random per row
+PRODUCT_ID_INDEX_CSV = "product_ids.csv"   # SKU -> first-seen timestamp
 ERROR_SCREENSHOTS_DIR = "error_screenshots"
 
+# --- Dedup of scraped URLs (dedup.py) ---
+DEDUP_BACKEND = "set"           # "set" (exact, in memory), "hash" (exact, mmap'd file), "bloom" (mmap'd, approximate)
+DEDUP_PATH = "seen_urls.bin"
+DEDUP_FP_RATE = 0.001           # bloom only: lifetime false-positive bound
+DEDUP_INITIAL_CAPACITY = 100_000
+
+# --- Background writer (async_writer.py) ---
+WRITER_FLUSH_ROWS = 50          # Append buffered rows once this many are pending...
+WRITER_FLUSH_SECONDS = 5        # ...or once the oldest has waited this long
+
+# --- Taxonomy discovery ---
+TAXONOMY_CACHE_JSON = "taxonomy_cache.json"
+TAXONOMY_TTL_HOURS = 24
+NAV_HOVER_WAIT = 1.0
+
+# --- Image downloads ---
+IMAGES_DIR = "images"
+IMAGE_DOWNLOAD_CONCURRENCY = 8
+IMAGE_DOWNLOAD_TIMEOUT = 30
+
+# --- Price history (price_history.py) ---
+PRICE_HISTORY_DIR = "price_history"
+
+# --- Sharded crawl (coordinator.py) ---
+WORK_QUEUE_DB = "work_queue.sqlite"
+LEASE_SECONDS = 180
+HEARTBEAT_EVERY = 30
+MAX_JOB_ATTEMPTS = 3
+ENRICH_SHARD_SIZE = 25
+COORDINATOR_POLL = 5
+MAX_WORKER_RESTARTS = 10
+
+# --- Distributed crawl (broker.py) ---
+BROKER_HOST = "127.0.0.1"   # Use 0.0.0.0 on the broker host to accept remote workers
+BROKER_PORT = 8642
+BROKER_TIMEOUT = 30         # Seconds per request
+BROKER_RETRIES = 5
+
+# --- Offline replay (mock_server.py) ---
+MOCK_HOST = "127.0.0.1"
+MOCK_PORT = 8765
+MOCK_SEED = 0                   # Same seed, same catalog, latencies and denied pages
+MOCK_FIXTURES_DIR = "fixtures"  # Recorded pages, served in place of generated ones
+
+# --- Soak tests (soak.py) ---
+SOAK_DIR = "soak_runs"          # One subdirectory of outputs and samples per run
+SOAK_SAMPLE_EVERY = 100         # Pages per sample (throughput window)
+SOAK_WARMUP_PAGES = 200         # Samples before this are not used as the baseline
+SOAK_MAX_THROUGHPUT_DECAY = 0.25    # Fail if pages/min drops more than this share from baseline
+SOAK_MAX_RSS_GROWTH_MB = 256        # Fail if the Python process grows more than this after warmup
+SOAK_MAX_FD_GROWTH = 32             # Fail if open file descriptors grow more than this after warmup
+SOAK_MAX_CHECKPOINT_MS = 500        # Fail if a checkpoint takes longer than this to reach disk
+SOAK_MAX_ERROR_RATE = 0.02          # Fail if more than this share of pages yield no data
+
 # --- Proxy (optional) ---
 PROXY_URL: Optional[str] = os.environ.get("CB2_PROXY_URL")
 
 # --- Browser ---
-HEADLESS = False
-WINDOW_WIDTH = 1920
+# Execution profile (browser_profiles.py): "headless-fast", "minimal-viewport" or "headed-debug"
+EXECUTION_PROFILE = os.environ.get("CB2_PROFILE", "headless-fast")
+WINDOW_WIDTH = 1920             # headed-debug window size
 WINDOW_HEIGHT = 1080
 
+# --- Memory governor (memory_governor.py) ---
+MEMORY_SAMPLE_EVERY = 10        # Pages between memory samples
+TAB_HEAP_LIMIT_MB = 384         # Recycle the tab above this JS heap...
+TAB_DOM_NODES_LIMIT = 150_000   # ...or this many live DOM nodes
+BROWSER_RSS_LIMIT_MB = 2048     # Restart the browser above this process-tree RSS (0: never)
+MEMORY_LOG_CSV = "memory_curve.csv"
+
 # Chrome profile path (3rd profile = "Taha" green T)
 CHROME_USER_DATA_DIR: Optional[str] = os.environ.get(
     "CB2_CHROME_USER_DATA_DIR",
@@ -60,6 +130,10 @@ class Selectors:
     product_name: str = ".product-name, .product-title, [class*='product-name']"
     product_price: str = ".price, .product-price, [class*='price']"
     product_image: str = "img[src*='scene7'], img[src*='cb2']"
+    pdp_details: str = (
+        "[data-testid*='product-details'], [data-testid*='dimensions'], [class*='product-details'], "
+        "[class*='ProductDetails'], [class*='pdp-details'], [class*='dimensions'], [id*='details']"
+    )
 
 
 SELECTORS = Selectors()
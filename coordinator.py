@@ -0,0 +1,427 @@
+"""
+Multi-process sharded crawl coordinator.
+
+    python coordinator.py listing --workers 8      # one job per subcategory
+    python coordinator.py enrich --workers 16      # one job per SKU range
+
+Work is sharded into jobs in a SQLite work queue (work_queue.py) and drained
+by N worker processes, each driving its own nodriver browser with a fresh
+profile. Workers heartbeat their lease while a job runs; if a worker process
+dies, the coordinator releases its leases right away and starts a
+replacement, and leases of hung workers expire after LEASE_SECONDS. Results
+are stored per job in the queue and merged into the usual output CSVs once
+every job is finished. Rerunning resumes: finished jobs are not redone unless
+--reset is given.
+"""
+
+import argparse
+import asyncio
+import csv
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import time
+from pathlib import Path
+
+import nodriver as uc
+
+from browser_profiles import ResourceMeter, add_profile_argument, start_browser
+from memory_governor import MemoryGovernor
+from config import (
+    COORDINATOR_POLL,
+    ENRICH_SHARD_SIZE,
+    HEARTBEAT_EVERY,
+    MAX_WORKER_RESTARTS,
+    WORK_QUEUE_DB,
+)
+from membership import MembershipIndex
+from taxonomy import load_taxonomy_cache, to_categories
+from product_ids import ProductIdIndex, product_id
+from utils import CSV_HEADER, get_product_sku
+from work_queue import WorkQueue
+import add_product_details
+import full_scraper
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+LISTING = "listing"
+ENRICH = "enrich"
+
+
+# ==================== WORKER ====================
+
+async def run_listing_job(browser, payload: dict) -> dict:
+    """Scrape one subcategory. Returns its products and every membership row; raises if the listing failed."""
+    memberships = MembershipIndex()
+    failed_urls = set()
+    products = await full_scraper.scrape_subcategory(
+        browser, payload["url"], payload["category"], payload["sub_category"], memberships, failed_urls
+    )
+    if failed_urls:
+        # Fail the job so the queue retries it instead of storing an empty result
+        raise RuntimeError(f"listing not fetched: {payload['url']}")
+    return {"products": products, "memberships": list(memberships.rows())}
+
+
+async def run_enrich_job(browser, payload: dict) -> dict:
+    """Fetch PDP details for one SKU range. Returns {product_link: details}; raises if any page did not load."""
+    results = {}
+    not_loaded = []
+    for url in payload["urls"]:
+        details = await add_product_details.get_product_details(browser, url)
+        if not details.get("loaded"):
+            not_loaded.append(url)
+        results[url] = details
+        await asyncio.sleep(random.uniform(add_product_details.MIN_DELAY, add_product_details.MAX_DELAY))
+    if not_loaded:
+        # Fail the job so the queue retries it; a completed job is never enqueued again
+        raise RuntimeError(f"{len(not_loaded)} of {len(results)} pages not loaded (blocked or timed out): {not_loaded[0]}")
+    return results
+
+
+JOB_HANDLERS = {
+    LISTING: run_listing_job,
+    ENRICH: run_enrich_job,
+}
+
+
+async def _queue_op(queue, op: str, *args, **kwargs):
+    """Call a queue method; network-backed queues (blocking_io) run it in a thread, off the browser's loop."""
+    method = getattr(queue, op)
+    if getattr(queue, "blocking_io", False):
+        return await asyncio.to_thread(method, *args, **kwargs)
+    return method(*args, **kwargs)
+
+
+async def _heartbeat(queue: WorkQueue, job_id: int, worker_id: str) -> None:
+    while True:
+        await asyncio.sleep(HEARTBEAT_EVERY)
+        if not await _queue_op(queue, "heartbeat", job_id, worker_id):
+            logger.warning("Lost lease on job %d", job_id)
+            return
+
+
+async def run_worker(queue, worker_id: str, kind: str, profile=None) -> int:
+    """
+    Lease and run jobs of kind until none are pending. Returns the number completed.
+
+    queue is a WorkQueue or anything with the same lease/heartbeat/complete/
+    fail/report methods (e.g. broker.RemoteQueue). Browser CPU and RSS per page
+    under the execution profile, and memory governor actions, are reported
+    with each completed job.
+    """
+    browser = await start_browser(profile)
+    meter = ResourceMeter(profile, browser)
+    # Several workers share a host: the memory curve goes to the log, not a shared CSV
+    governor = MemoryGovernor(profile, meter, log_path=None)
+    done = 0
+    try:
+        while True:
+            job = await _queue_op(queue, "lease", worker_id, kind)
+            if job is None:
+                break
+            logger.info("Job %s (attempt %d)", job.key, job.attempts)
+            start = time.perf_counter()
+            beat = asyncio.create_task(_heartbeat(queue, job.id, worker_id))
+            try:
+                result = await JOB_HANDLERS[job.kind](browser, job.payload)
+            except Exception as e:
+                logger.exception("Job %s failed: %s", job.key, e)
+                await _queue_op(queue, "fail", job.id, worker_id, repr(e))
+                await _queue_op(queue, "report", worker_id, failed=1, busy_seconds=time.perf_counter() - start)
+                continue
+            finally:
+                beat.cancel()
+            elapsed = time.perf_counter() - start
+            meter.page_done(len(job.payload.get("urls", ())) or 1)
+            if await _queue_op(queue, "complete", job.id, worker_id, result):
+                done += 1
+                usage = meter.summary()
+                await _queue_op(queue, "report", worker_id, done=1, busy_seconds=elapsed, metrics={
+                    "last_job": job.key, "last_job_s": round(elapsed, 2), "profile": usage["profile"],
+                    "cpu_s_per_page": round(usage["browser_cpu_s_per_page"], 3), "rss_mb": round(usage["rss_mb"]),
+                    "tab_recycles": governor.tab_recycles, "browser_restarts": governor.browser_restarts,
+                })
+            else:
+                logger.warning("Job %s: lease expired before completion - result discarded", job.key)
+            browser = await governor.after_page(browser)
+    finally:
+        meter.log()
+        governor.close()
+        try:
+            browser.stop()
+        except Exception:
+            pass
+    logger.info("Worker finished: %d jobs", done)
+    return done
+
+
+def configure_worker_logging(worker_id: str) -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"%(asctime)s [%(levelname)s] [{worker_id}] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        force=True,
+    )
+
+
+def worker_main(db_path: str, worker_id: str, kind: str, profile=None) -> None:
+    """Process entry point for one worker."""
+    configure_worker_logging(worker_id)
+    queue = WorkQueue(db_path)
+    try:
+        uc.loop().run_until_complete(run_worker(queue, worker_id, kind, profile))
+    finally:
+        queue.close()
+
+
+# ==================== COORDINATOR ====================
+
+def listing_jobs() -> list[tuple[str, dict]]:
+    """One job per subcategory, from the cached nav taxonomy or the built-in table."""
+    cache = load_taxonomy_cache()
+    categories = to_categories(cache["categories"], set(cache["empty_urls"])) if cache else full_scraper.CATEGORIES
+    return [
+        (f"{category}/{subcategory}", {"category": category, "sub_category": subcategory, "url": url})
+        for category, subcategories in categories.items()
+        for subcategory, url in subcategories.items()
+    ]
+
+
+def enqueue_listing_jobs(queue: WorkQueue) -> int:
+    return queue.enqueue_many(LISTING, listing_jobs())
+
+
+def read_csv_rows(csv_path) -> list[dict]:
+    with open(csv_path, "r", encoding="utf-8") as f:
+        return [{k: v for k, v in row.items() if k is not None} for row in csv.DictReader(f)]
+
+
+def write_csv_atomic(csv_path, fieldnames: list[str], rows: list[dict]) -> None:
+    """Write rows to a temp file, fsync it and rename it over csv_path, so a crash never truncates it."""
+    path = Path(csv_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _enrich_key(link: str) -> str:
+    """Key enrichment work and results by SKU, so every row of a product shares one fetch."""
+    return get_product_sku(link) or link
+
+
+def enrich_jobs(input_csv, shard_size: int = ENRICH_SHARD_SIZE) -> list[tuple[str, dict]]:
+    """
+    Shard rows still missing all_images into contiguous SKU ranges of shard_size.
+
+    Rows are deduplicated by SKU first; with shard_size 1 each job key is the SKU itself.
+    """
+    by_sku = {}
+    for r in read_csv_rows(input_csv):
+        if r.get("product_link") and not r.get("all_images", "").strip():
+            by_sku.setdefault(_enrich_key(r["product_link"]), r["product_link"])
+    skus = sorted(by_sku)
+    jobs = []
+    for start in range(0, len(skus), shard_size):
+        shard = skus[start:start + shard_size]
+        key = shard[0] if len(shard) == 1 else f"{shard[0]}-{shard[-1]}"
+        jobs.append((key, {"urls": [by_sku[sku] for sku in shard]}))
+    return jobs
+
+
+def enqueue_enrich_jobs(queue: WorkQueue, input_csv) -> int:
+    return queue.enqueue_many(ENRICH, enrich_jobs(input_csv))
+
+
+def merge_listing(queue: WorkQueue, output_csv, membership_csv) -> int:
+    """Merge listing job results into the listing CSV (first membership wins) and the membership table."""
+    memberships = MembershipIndex()
+    rows = []
+    for _, result in queue.results(LISTING):
+        for m in result["memberships"]:
+            memberships.add(m["sku"], m["category"], m["sub_category"], int(m["position"]))
+        rows.extend(result["products"])
+
+    seen = set()
+    product_ids = ProductIdIndex()
+    path = Path(output_csv)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_HEADER)
+        writer.writeheader()
+        for p in rows:
+            if p["sku"] in seen:
+                continue
+            seen.add(p["sku"])
+            product_ids.see(p["sku"])
+            writer.writerow({
+                "uuid7": product_id(p["url"]),
+                "name": p["name"],
+                "images": p["image"],
+                "price": p["price"],
+                "product_link": p["url"],
+                "platform": "CB2",
+                "category": p["category"],
+                "sub_category": p["sub_category"],
+            })
+            count += 1
+    memberships.write_csv(membership_csv)
+    product_ids.save()
+    logger.info("Merged %d products, %d SKUs in multiple subcategories", count, memberships.multi_membership_count())
+    return count
+
+
+def merge_enrich(queue: WorkQueue, input_csv, output_csv) -> int:
+    """Apply enrichment results to the input rows and write the details CSV.
+
+    Results are keyed by SKU (see enrich_jobs), so rows whose link differs from the
+    one that was fetched still receive the details. Detail columns already in an
+    existing output_csv are carried over first, so rows this queue did not fetch
+    keep them; the file is replaced atomically.
+    """
+    details_by_sku = {}
+    for _, result in queue.results(ENRICH):
+        for url, details in result.items():
+            details_by_sku[_enrich_key(url)] = details
+
+    rows = read_csv_rows(input_csv)
+    fieldnames = list(rows[0].keys()) if rows else list(CSV_HEADER)
+    for col in add_product_details.DETAIL_COLUMNS:
+        if col not in fieldnames:
+            fieldnames.append(col)
+
+    previous = {}
+    if Path(output_csv).exists():
+        for row in read_csv_rows(output_csv):
+            if row.get("product_link"):
+                previous.setdefault(_enrich_key(row["product_link"]), row)
+
+    updated = 0
+    for row in rows:
+        link = row.get("product_link", "")
+        if not link:
+            continue
+        key = _enrich_key(link)
+        earlier = previous.get(key)
+        if earlier:
+            for col in add_product_details.DETAIL_COLUMNS:
+                if not row.get(col, "").strip() and earlier.get(col, "").strip():
+                    row[col] = earlier[col]
+        details = details_by_sku.get(key)
+        if details and add_product_details.merge_details(row, details):
+            updated += 1
+
+    write_csv_atomic(output_csv, fieldnames, rows)
+    logger.info("Merged details into %d of %d rows -> %s", updated, len(rows), output_csv)
+    return updated
+
+
+def run_workers(db_path: str, kind: str, workers: int, profile=None) -> dict[str, int]:
+    """Start workers, replace crashed ones, and return final job counts when the queue drains."""
+    ctx = multiprocessing.get_context("spawn")
+    queue = WorkQueue(db_path)
+    procs: dict[str, multiprocessing.Process] = {}
+    spawned = 0
+    restarts = 0
+
+    def spawn() -> None:
+        nonlocal spawned
+        spawned += 1
+        worker_id = f"{socket.gethostname()}-{os.getpid()}-w{spawned}"
+        proc = ctx.Process(target=worker_main, args=(db_path, worker_id, kind, profile), name=worker_id)
+        proc.start()
+        procs[worker_id] = proc
+
+    for _ in range(workers):
+        spawn()
+
+    try:
+        while True:
+            time.sleep(COORDINATOR_POLL)
+            queue.reclaim_expired()
+            for worker_id, proc in list(procs.items()):
+                if proc.is_alive():
+                    continue
+                del procs[worker_id]
+                if proc.exitcode != 0:
+                    released = queue.release_worker(worker_id)
+                    logger.warning("Worker %s exited with %s - released %d lease(s)", worker_id, proc.exitcode, released)
+
+            counts = queue.counts(kind)
+            # Keep N workers while work is pending (crash replacements are capped)
+            while counts["pending"] and len(procs) < min(workers, counts["pending"] + counts["leased"]):
+                if spawned >= workers:
+                    if restarts >= MAX_WORKER_RESTARTS:
+                        break
+                    restarts += 1
+                spawn()
+
+            logger.info(
+                "[%s] pending=%d leased=%d done=%d failed=%d workers=%d",
+                kind, counts["pending"], counts["leased"], counts["done"], counts["failed"], len(procs),
+            )
+            if not procs and (not counts["pending"] or restarts >= MAX_WORKER_RESTARTS):
+                return counts
+    except KeyboardInterrupt:
+        logger.info("Interrupted - stopping workers (finished jobs are kept)")
+        for proc in procs.values():
+            proc.terminate()
+        for worker_id, proc in procs.items():
+            proc.join()
+            queue.release_worker(worker_id)
+        raise
+    finally:
+        queue.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a crawl stage across N worker processes.")
+    parser.add_argument("stage", choices=[LISTING, ENRICH])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--db", default=WORK_QUEUE_DB, help="SQLite work queue file")
+    parser.add_argument("--reset", action="store_true", help="Drop finished jobs of this stage and start over")
+    parser.add_argument("--input", default=str(add_product_details.INPUT_CSV), help="enrich: listing CSV to enrich")
+    parser.add_argument("--output", help="Output CSV (default: the stage's usual output file)")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    queue = WorkQueue(args.db)
+    if args.reset:
+        queue.reset(args.stage)
+    if args.stage == LISTING:
+        added = enqueue_listing_jobs(queue)
+    else:
+        added = enqueue_enrich_jobs(queue, args.input)
+    logger.info("Enqueued %d new %s jobs (%s)", added, args.stage, queue.counts(args.stage))
+    queue.close()
+
+    counts = run_workers(args.db, args.stage, args.workers, args.profile)
+    if counts["failed"]:
+        logger.warning("%d %s jobs failed after retries", counts["failed"], args.stage)
+
+    queue = WorkQueue(args.db)
+    try:
+        if args.stage == LISTING:
+            merge_listing(queue, args.output or add_product_details.INPUT_CSV, full_scraper.MEMBERSHIP_CSV)
+        else:
+            merge_enrich(queue, args.input, args.output or add_product_details.OUTPUT_CSV)
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
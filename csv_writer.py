@@ -0,0 +1,163 @@
+"""
+Open-once buffered CSV appender.
+
+    with BufferedCsvWriter(OUTPUT_CSV, OUTPUT_HEADER) as out:
+        out.writerow(row)        # memory only; flushed every flush_rows rows / flush_seconds
+
+The file is opened once and rows go through one csv.DictWriter into a large
+buffer, so a row costs no syscalls; flush() writes the buffer and fsyncs.
+The header is written only when the file is new or empty, and an existing
+file with a different header is refused rather than appended to. A row left
+half-written by a crash is cut off when the file is reopened.
+"""
+
+import csv
+import os
+import time
+from pathlib import Path
+
+from config import WRITER_FLUSH_ROWS, WRITER_FLUSH_SECONDS
+
+BUFFER_BYTES = 1 << 20
+
+
+TAIL_BYTES = 1 << 16
+
+
+def _tail_start(f, size: int) -> int:
+    """Offset of a record boundary at least TAIL_BYTES before the end (0 if none).
+
+    A newline ends a record only outside quotes, i.e. after an even number of
+    quote characters from the start of the file (escaped quotes come in pairs).
+    """
+    if size <= TAIL_BYTES:
+        return 0
+    f.seek(0)
+    quotes = 0
+    target = size - TAIL_BYTES
+    while f.tell() < target:
+        quotes += f.read(min(1 << 20, target - f.tell())).count(b'"')
+    while True:
+        line = f.readline()
+        if not line:
+            return 0
+        quotes += line.count(b'"')
+        if line.endswith(b"\n") and quotes % 2 == 0:
+            return f.tell()
+
+
+def _complete_length(tail: bytes) -> int:
+    """Bytes of tail taken up by complete records, parsed with the csv module."""
+    consumed = 0
+    done = 0
+    exhausted = False
+
+    def lines():
+        nonlocal consumed, exhausted
+        for line in tail.splitlines(keepends=True):
+            consumed += len(line)
+            yield line.decode("utf-8", errors="replace")
+        exhausted = True
+
+    for _ in csv.reader(lines()):
+        # The reader stops right after a record's last line; asking for more
+        # than the file has means the record ran into the end of the data
+        if exhausted or not tail[:consumed].endswith(b"\n"):
+            break
+        done = consumed
+    return done
+
+
+def _drop_partial_row(path: Path) -> None:
+    """Truncate an interrupted final record, including one cut off inside a quoted field."""
+    with open(path, "r+b") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        start = _tail_start(f, size)
+        f.seek(start)
+        keep = start + _complete_length(f.read())
+        if keep < size:
+            f.truncate(keep)
+
+
+def read_header(path: Path) -> list[str]:
+    """The first row of a CSV, or [] if the file is missing or empty."""
+    if not path.exists():
+        return []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return next(csv.reader(f), [])
+
+
+class BufferedCsvWriter:
+    """Long-lived appender for one CSV file. Use as a context manager or call open()/close()."""
+
+    def __init__(self, path, fieldnames: list[str], flush_rows: int = WRITER_FLUSH_ROWS,
+                 flush_seconds: float = WRITER_FLUSH_SECONDS) -> None:
+        self.path = Path(path)
+        self.fieldnames = list(fieldnames)
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.rows_written = 0
+        self._file = None
+        self._writer = None
+        self._unflushed = 0
+        self._last_flush = 0.0
+
+    def __enter__(self) -> "BufferedCsvWriter":
+        self.open()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def open(self) -> None:
+        if self._file is not None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            _drop_partial_row(self.path)
+        header = read_header(self.path)
+        if header and header != self.fieldnames:
+            raise ValueError(f"{self.path} has columns {header}, expected {self.fieldnames}")
+        self._file = open(self.path, "a", encoding="utf-8", newline="", buffering=BUFFER_BYTES)
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames, extrasaction="ignore")
+        if not header:
+            self._writer.writeheader()
+            self._unflushed += 1
+            self.flush()
+        self._last_flush = time.monotonic()
+
+    def writerow(self, row: dict) -> None:
+        self._writer.writerow(row)
+        self.rows_written += 1
+        self._unflushed += 1
+        self._maybe_flush()
+
+    def writerows(self, rows: list[dict]) -> None:
+        self._writer.writerows(rows)
+        self.rows_written += len(rows)
+        self._unflushed += len(rows)
+        self._maybe_flush()
+
+    def _maybe_flush(self) -> None:
+        if self._unflushed >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write buffered rows and fsync (no-op when nothing is buffered)."""
+        if self._file is None or not self._unflushed:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self._file.close()
+            self._file = self._writer = None
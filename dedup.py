@@ -0,0 +1,302 @@
+"""
+Pluggable "already seen" sets for URL/SKU deduplication.
+
+    seen = open_dedup("bloom", "seen_urls.bloom")
+    if seen.add(url):        # True only the first time
+        ...
+    seen.flush()
+
+Backends (DEDUP_BACKEND):
+
+    set     exact, in memory; persisted as an append-only key log
+    hash    exact up to 64-bit hash collisions; open-addressing table of key
+            hashes in a memory-mapped file, 16-32 bytes of disk per key and
+            no Python objects per key
+    bloom   scalable Bloom filter in a memory-mapped file; about 2 bytes
+            per key at 0.1% false positives. A false positive means a new
+            URL is taken as already seen and skipped, at no more than
+            DEDUP_FP_RATE over the filter's whole life.
+
+The mapped backends open instantly whatever their size: pages are read by
+the OS on demand instead of being parsed into a Python set.
+"""
+
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+
+from config import DEDUP_FP_RATE, DEDUP_INITIAL_CAPACITY
+
+
+def _hash128(key: str) -> tuple[int, int]:
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+    return struct.unpack("<QQ", digest)
+
+
+class ExactSet:
+    """Python set, persisted by appending new keys to a text file."""
+
+    def __init__(self, path) -> None:
+        self.path = Path(path)
+        self._keys: set[str] = set()
+        self._pending: list[str] = []
+        if self.path.exists():
+            self._keys.update(self.path.read_text(encoding="utf-8").splitlines())
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key: str) -> bool:
+        if key in self._keys:
+            return False
+        self._keys.add(key)
+        self._pending.append(key)
+        return True
+
+    def flush(self) -> None:
+        # Swap first: flush may run in a writer thread while add() continues
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(f"{k}\n" for k in pending))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self) -> None:
+        self.flush()
+
+
+class _Mapped:
+    """
+    Shared file/mmap handling for the memory-mapped backends. flush() may be
+    called from a writer thread; the lock keeps it off a mapping being resized.
+    """
+
+    MAGIC = b""
+
+    def __init__(self, path) -> None:
+        self.path = Path(path)
+        self._file = None
+        self._mm = None
+        self._lock = threading.Lock()
+
+    def _map(self) -> None:
+        self._file = open(self.path, "r+b")
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        if self._mm[:8] != self.MAGIC:
+            raise ValueError(f"{self.path} is not a {self.MAGIC.decode()} file")
+
+    def _unmap(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+        self._mm = self._file = None
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._mm is not None:
+                self._mm.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self._unmap()
+
+
+class HashIndex(_Mapped):
+    """
+    Linear-probing table of 64-bit key hashes in a mapped file (0 marks an
+    empty slot). Doubles, by rehashing into a new file, at half full.
+
+    Layout: magic, slot count, key count, then the slots (little-endian u64).
+    """
+
+    MAGIC = b"CB2HASH1"
+    HEADER = struct.Struct("<8sQQ")
+
+    def __init__(self, path, capacity: int = DEDUP_INITIAL_CAPACITY) -> None:
+        super().__init__(path)
+        self._slots = None
+        if not self.path.exists():
+            self._create(self.path, 1 << max(4, (2 * capacity - 1).bit_length()))
+        self._open()
+
+    @classmethod
+    def _create(cls, path: Path, slots: int) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, slots, 0))
+            f.truncate(cls.HEADER.size + slots * 8)
+
+    def _open(self) -> None:
+        self._map()
+        _, self._capacity, self._count = self.HEADER.unpack_from(self._mm)
+        self._slots = memoryview(self._mm)[self.HEADER.size:].cast("Q")
+        self._mask = self._capacity - 1
+
+    def _unmap(self) -> None:
+        if self._slots is not None:
+            self._slots.release()
+            self._slots = None
+        super()._unmap()
+
+    @staticmethod
+    def _key_hash(key: str) -> int:
+        return _hash128(key)[0] or 1
+
+    def _find(self, h: int) -> tuple[int, bool]:
+        """(slot index, found) for hash h."""
+        slots, mask = self._slots, self._mask
+        i = h & mask
+        while True:
+            v = slots[i]
+            if v == h:
+                return i, True
+            if v == 0:
+                return i, False
+            i = (i + 1) & mask
+
+    def __contains__(self, key: str) -> bool:
+        return self._find(self._key_hash(key))[1]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, key: str) -> bool:
+        h = self._key_hash(key)
+        i, found = self._find(h)
+        if found:
+            return False
+        self._slots[i] = h
+        self._count += 1
+        struct.pack_into("<Q", self._mm, 16, self._count)
+        if self._count * 2 > self._capacity:
+            self._grow()
+        return True
+
+    def _grow(self) -> None:
+        old = [h for h in self._slots if h]
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        self._create(tmp, self._capacity * 2)
+        with self._lock:
+            self._unmap()
+            os.replace(tmp, self.path)
+            self._open()
+        for h in old:
+            self._slots[self._find(h)[0]] = h
+        self._count = len(old)
+        struct.pack_into("<Q", self._mm, 16, self._count)
+
+
+class BloomFilter(_Mapped):
+    """
+    Scalable Bloom filter: a chain of stages, each twice the capacity of the
+    last with half its false-positive rate, so the total rate stays under
+    fp_rate however many keys are added.
+
+    Layout: file header (magic, fp_rate, initial capacity, stage count), then
+    per stage a header (capacity, bits, hashes, count) and its bit array.
+    """
+
+    MAGIC = b"CB2BLOM1"
+    HEADER = struct.Struct("<8sdQQ")
+    STAGE = struct.Struct("<QQQQ")
+
+    def __init__(self, path, fp_rate: float = DEDUP_FP_RATE, capacity: int = DEDUP_INITIAL_CAPACITY) -> None:
+        super().__init__(path)
+        self._stages = []
+        if not self.path.exists():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "wb") as f:
+                f.write(self.HEADER.pack(self.MAGIC, fp_rate, capacity, 0))
+            self._open()
+            self._add_stage()
+        else:
+            self._open()
+
+    def _open(self) -> None:
+        self._map()
+        _, self.fp_rate, self.initial_capacity, n = self.HEADER.unpack_from(self._mm)
+        self._stages = []  # [offset of stage header, capacity, bits, hashes, count, bit view]
+        offset = self.HEADER.size
+        for _ in range(n):
+            capacity, bits, hashes, count = self.STAGE.unpack_from(self._mm, offset)
+            start = offset + self.STAGE.size
+            view = memoryview(self._mm)[start:start + bits // 8]
+            self._stages.append([offset, capacity, bits, hashes, count, view])
+            offset = start + bits // 8
+
+    def _unmap(self) -> None:
+        for stage in self._stages:
+            stage[5].release()
+        self._stages = []
+        super()._unmap()
+
+    def _add_stage(self) -> None:
+        i = len(self._stages)
+        capacity = self.initial_capacity << i
+        p = self.fp_rate * 0.5 ** (i + 1)
+        bits = math.ceil(-capacity * math.log(p) / math.log(2) ** 2 / 64) * 64
+        hashes = max(1, round(bits / capacity * math.log(2)))
+        with self._lock:
+            self._unmap()
+            with open(self.path, "r+b") as f:
+                f.seek(0, os.SEEK_END)
+                f.write(self.STAGE.pack(capacity, bits, hashes, 0))
+                f.truncate(f.tell() + bits // 8)
+                f.seek(0)
+                f.write(self.HEADER.pack(self.MAGIC, self.fp_rate, self.initial_capacity, i + 1))
+            self._open()
+
+    @staticmethod
+    def _positions(h1: int, h2: int, bits: int, hashes: int):
+        for j in range(hashes):
+            yield (h1 + j * (h2 | 1)) % bits
+
+    def _in_stage(self, stage, h1: int, h2: int) -> bool:
+        _, _, bits, hashes, _, view = stage
+        return all(view[p >> 3] & (1 << (p & 7)) for p in self._positions(h1, h2, bits, hashes))
+
+    def __contains__(self, key: str) -> bool:
+        h1, h2 = _hash128(key)
+        return any(self._in_stage(s, h1, h2) for s in self._stages)
+
+    def __len__(self) -> int:
+        return sum(s[4] for s in self._stages)
+
+    def add(self, key: str) -> bool:
+        h1, h2 = _hash128(key)
+        if any(self._in_stage(s, h1, h2) for s in self._stages):
+            return False
+        stage = self._stages[-1]
+        offset, _, bits, hashes, _, view = stage
+        for p in self._positions(h1, h2, bits, hashes):
+            view[p >> 3] |= 1 << (p & 7)
+        stage[4] += 1
+        struct.pack_into("<Q", self._mm, offset + 24, stage[4])
+        if stage[4] >= stage[1]:
+            self._add_stage()
+        return True
+
+
+DEDUP_BACKENDS = {
+    "set": ExactSet,
+    "hash": HashIndex,
+    "bloom": BloomFilter,
+}
+
+
+def open_dedup(backend: str, path):
+    """Open (or create) a dedup set of the given backend at path."""
+    try:
+        return DEDUP_BACKENDS[backend](path)
+    except KeyError:
+        raise ValueError(f"Unknown dedup backend {backend!r}; choose from {', '.join(DEDUP_BACKENDS)}") from None
@@ -0,0 +1,94 @@
+"""
+Product-page fields that are already known without visiting the page.
+
+A PDP visit is only needed for the detail fields a row still lacks. Before
+queueing a visit, fields are filled in stages:
+
+    listing   the SKU, parsed from the product URL
+    cache     dimensions, images, description, ... from the CSVs of earlier
+              runs (the other scripts' outputs), matched by SKU
+
+    cache = DetailCache(DETAIL_COLUMNS)
+    cache.load_csv(OTHER_RUN_CSV)
+    cache.load_csv(CAPPED_RUN_CSV, fields=["dimensions"])   # only what that run wrote in full
+    for stage, field in fill_known_fields(product, DETAIL_COLUMNS, cache):
+        ...
+
+Rows whose target fields are all filled this way are never loaded.
+"""
+
+import csv
+import logging
+from pathlib import Path
+from typing import Optional
+
+from product_urls import dedup_key, product_sku
+
+logger = logging.getLogger(__name__)
+
+
+class DetailCache:
+    """Row key (SKU, else canonical URL) -> non-empty detail fields seen in earlier runs."""
+
+    def __init__(self, fields: list[str]) -> None:
+        self.fields = list(fields)
+        self._by_key: dict[str, dict[str, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def add(self, row: dict, fields: Optional[list[str]] = None) -> None:
+        """Keep the row's non-empty fields (only those in fields, if given); values already cached for its key win."""
+        link = row.get("product_link", "")
+        if not link:
+            return
+        entry = self._by_key.setdefault(dedup_key(link), {})
+        for field in self.fields:
+            if fields is not None and field not in fields:
+                continue
+            value = (row.get(field) or "").strip()
+            if value and field not in entry:
+                entry[field] = value
+
+    def load_csv(self, csv_path, fields: Optional[list[str]] = None) -> int:
+        """
+        Add every row of csv_path (if it exists). Returns the number of rows read.
+
+        fields limits what this source may supply, for outputs that store some
+        columns incompletely (e.g. a capped image list).
+        """
+        path = Path(csv_path)
+        if not path.exists():
+            return 0
+        count = 0
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                self.add(row, fields)
+                count += 1
+        logger.info("Detail cache: %d rows from %s", count, path.name)
+        return count
+
+    def get(self, key: str) -> dict[str, str]:
+        return self._by_key.get(key, {})
+
+
+def fill_known_fields(product: dict, fields: list[str], cache: Optional[DetailCache] = None) -> list[tuple[str, str]]:
+    """
+    Fill the product's empty fields that need no page visit.
+
+    Returns (stage, field) for each field filled, stage being "listing" or "cache".
+    """
+    filled = []
+    link = product.get("product_link", "")
+    if "sku" in fields and not (product.get("sku") or "").strip():
+        sku = product_sku(link)
+        if sku:
+            product["sku"] = sku
+            filled.append(("listing", "sku"))
+    if cache is not None:
+        cached = cache.get(dedup_key(link))
+        for field in fields:
+            if not (product.get(field) or "").strip() and cached.get(field):
+                product[field] = cached[field]
+                filled.append(("cache", field))
+    return filled
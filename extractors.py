@@ -0,0 +1,109 @@
+"""
+Register in-page extractor scripts once per tab and call them by name.
+
+Sending a multi-kilobyte EXTRACT_*_JS string with every page.evaluate makes
+V8 re-parse it on every product. Instead, every registered extractor is
+wrapped as a function on window.__cb2x and installed per tab with
+Page.addScriptToEvaluateOnNewDocument, so it is already defined on each page
+the tab navigates to. A call is then a short expression such as
+
+    window.__cb2x["pdp_pipeline@3f2a9c1b"]()
+
+Versions are a hash of the source, so re-registering changed source
+(hot-swap) reinstalls the bundle on each tab at its next call without
+restarting the browser.
+
+Arguments given to call() are passed as JSON and visible to the extractor
+source as the array __args.
+"""
+
+import hashlib
+import json
+import logging
+from typing import Any, Optional
+
+from nodriver import cdp
+
+logger = logging.getLogger(__name__)
+
+_MISSING = "__CB2X_MISSING__"
+
+# name -> (version, source)
+_registry: dict[str, tuple[str, str]] = {}
+
+# tab target id -> (bundle version, addScriptToEvaluateOnNewDocument identifier)
+_installed: dict[str, tuple[str, Any]] = {}
+
+
+def register(name: str, source: str, version: Optional[str] = None) -> str:
+    """Register (or hot-swap) an extractor. source is a JS expression, e.g. an IIFE. Returns its key."""
+    source = source.strip().rstrip(";")
+    version = version or hashlib.sha1(source.encode("utf-8")).hexdigest()[:8]
+    _registry[name] = (version, source)
+    return f"{name}@{version}"
+
+
+def key(name: str) -> str:
+    version, _ = _registry[name]
+    return f"{name}@{version}"
+
+
+def bundle() -> tuple[str, str]:
+    """Return (bundle version, JS) defining every registered extractor on window.__cb2x."""
+    parts = ["window.__cb2x = window.__cb2x || {};"]
+    for name in sorted(_registry):
+        version, source = _registry[name]
+        parts.append(f"window.__cb2x[{json.dumps(key(name))}] = function(...__args) {{ return ({source}); }};")
+    js = "\n".join(parts)
+    return hashlib.sha1(js.encode("utf-8")).hexdigest()[:8], js
+
+
+def call_expression(name: str, *args) -> str:
+    """The short expression that runs a registered extractor on the page."""
+    k = json.dumps(key(name))
+    call_args = ", ".join(json.dumps(a) for a in args)
+    return f"(window.__cb2x && window.__cb2x[{k}]) ? window.__cb2x[{k}]({call_args}) : {json.dumps(_MISSING)}"
+
+
+def _tab_id(tab) -> str:
+    target = getattr(tab, "target", None)
+    return getattr(target, "target_id", None) or str(id(tab))
+
+
+async def install(tab) -> None:
+    """Install the current bundle on tab (replacing an older one) for this and every later document."""
+    version, js = bundle()
+    tab_id = _tab_id(tab)
+    previous = _installed.get(tab_id)
+    if previous and previous[0] == version:
+        return
+    if previous:
+        try:
+            await tab.send(cdp.page.remove_script_to_evaluate_on_new_document(previous[1]))
+        except Exception as e:
+            logger.debug("Could not remove old extractor bundle: %s", e)
+    identifier = await tab.send(cdp.page.add_script_to_evaluate_on_new_document(source=js, run_immediately=True))
+    _installed[tab_id] = (version, identifier)
+    logger.debug("Installed extractor bundle %s on tab %s", version, tab_id)
+
+
+def forget(tab) -> None:
+    """Drop the install record of a closed tab."""
+    _installed.pop(_tab_id(tab), None)
+
+
+async def call(tab, name: str, *args) -> Any:
+    """
+    Run a registered extractor on tab and return its (awaited) result.
+
+    If the page lacks the function (bundle installed after this document was
+    created and run_immediately unsupported), the bundle is evaluated into the
+    current document once and the call retried.
+    """
+    await install(tab)
+    expression = call_expression(name, *args)
+    result = await tab.evaluate(expression, await_promise=True)
+    if result == _MISSING:
+        await tab.evaluate(bundle()[1])
+        result = await tab.evaluate(expression, await_promise=True)
+    return result
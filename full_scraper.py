@@ -2,43 +2,36 @@
 CB2 Full Scraper - ALL subcategories + product details (dimensions, all images).
 """
 
+import argparse
 import asyncio
 import logging
 import json
-import csv
 from datetime import datetime
 from pathlib import Path
 
 import nodriver as uc
 
+from async_writer import AsyncWriter
+from browser_profiles import ResourceMeter, add_profile_argument, start_browser
+from memory_governor import MemoryGovernor
+from detail_cache import DetailCache, fill_known_fields
+from checkpoint import load_checkpoint, read_output_rows, save_checkpoint
 from config import (
     BASE_URL,
-    HEADLESS,
-    PAGE_LOAD_WAIT,
     CHROME_USER_DATA_DIR,
+    SELECTORS,
 )
-from utils import (
-    normalize_product_url,
-    generate_uuid7,
-    sanitize_text,
-)
-import re
-
-
-def get_product_sku(url: str) -> str:
-    """Extract product SKU from URL for deduplication."""
-    # Extract the /s123456 part
-    match = re.search(r'/s(\d{5,6})', url)
-    return match.group(1) if match else ""
+from utils import sanitize_text
+from listing import fetch_listing
+import extractors
+from image_urls import CANONICAL_IMAGE_JS, ImageIndex
+from membership import MembershipIndex
+from price_history import PriceHistory, parse_price_cents
+from product_ids import ProductIdIndex, product_id
+from product_urls import canonicalize_batch, product_sku
+from taxonomy import get_taxonomy, load_taxonomy_cache, mark_empty_url
 
 
-def normalize_url_for_dedup(url: str) -> str:
-    """Normalize URL for deduplication - remove query params, trailing slashes."""
-    url = url.split('?')[0].split('#')[0].rstrip('/')
-    if not url.startswith('http'):
-        url = 'https://www.cb2.com' + url
-    return url.lower()
-
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(message)s",
@@ -49,6 +42,18 @@ logger = logging.getLogger(__name__)
 # Output files
 OUTPUT_CSV = Path("c:/Users/Syed Taha Hasan/Desktop/cb2/cb2_full_products.csv")
 PROGRESS_FILE = Path("c:/Users/Syed Taha Hasan/Desktop/cb2/full_progress.json")
+MEMBERSHIP_CSV = Path("c:/Users/Syed Taha Hasan/Desktop/cb2/cb2_sku_memberships.csv")
+IMAGE_ASSETS_CSV = Path("c:/Users/Syed Taha Hasan/Desktop/cb2/cb2_image_assets.csv")
+# Earlier outputs of add_product_details; products with dimensions and images there skip the PDP
+DETAIL_CACHE_CSVS = [
+    Path("c:/Users/Syed Taha Hasan/Desktop/cb2/cb2_all_products_with_details.csv"),
+]
+PDP_FIELDS = ['dimensions', 'all_images']
+
+OUTPUT_HEADER = [
+    'uuid7', 'name', 'images', 'price', 'product_link',
+    'platform', 'category', 'sub_category', 'dimensions', 'all_images'
+]
 
 # COMPLETE category structure from CB2 navigation
 CATEGORIES = {
@@ -212,13 +217,14 @@ EXTRACT_DETAILS_JS = """
     // Get all images
     const images = [];
     const seen = new Set();
+    const canonicalImage = __CANONICAL_IMAGE__;
     
     // Look for product gallery images
     document.querySelectorAll('img').forEach(img => {
         let src = img.src || img.dataset.src || '';
         if (src && src.includes('cb2.scene7.com') && !seen.has(src)) {
-            // Get high-res version
-            src = src.replace(/\\$[^/]*$/, '').split('?')[0];
+            // Canonical asset URL (full-size, no preset/format)
+            src = canonicalImage(src);
             if (!seen.has(src)) {
                 seen.add(src);
                 images.push(src);
@@ -232,7 +238,7 @@ EXTRACT_DETAILS_JS = """
         srcset.split(',').forEach(part => {
             const src = part.trim().split(' ')[0];
             if (src && src.includes('cb2.scene7.com')) {
-                const clean = src.replace(/\\$[^/]*$/, '').split('?')[0];
+                const clean = canonicalImage(src);
                 if (!seen.has(clean)) {
                     seen.add(clean);
                     images.push(clean);
@@ -241,9 +247,17 @@ EXTRACT_DETAILS_JS = """
         });
     });
     
-    // Get dimensions from product details
+    // Get dimensions from product details, scoped to the details container when found
     let dimensions = '';
-    const text = document.body.innerText;
+    const scopeSelector = __DETAILS_SCOPE__;
+    let scope = null;
+    for (const el of document.querySelectorAll(scopeSelector)) {
+        const t = el.textContent || '';
+        if (t.length > 40 && /dimension|overall|width|height/i.test(t)) {
+            scope = el;
+            break;
+        }
+    }
     
     // Look for dimension patterns
     const dimPatterns = [
@@ -253,17 +267,22 @@ EXTRACT_DETAILS_JS = """
         /([WHD]\\s*\\d+(?:\\.\\d+)?[""]?[^\\n]{0,100})/i,
     ];
     
-    for (const pattern of dimPatterns) {
-        const match = text.match(pattern);
-        if (match) {
-            dimensions = match[1].trim().substring(0, 200);
-            break;
+    const sources = scope ? [() => scope.innerText, () => document.body.innerText] : [() => document.body.innerText];
+    for (const source of sources) {
+        const text = source();
+        for (const pattern of dimPatterns) {
+            const match = text.match(pattern);
+            if (match) {
+                dimensions = match[1].trim().substring(0, 200);
+                break;
+            }
         }
+        if (dimensions) break;
     }
     
     // Also try to find in specific elements
     if (!dimensions) {
-        document.querySelectorAll('[class*="dimension"], [class*="spec"], [data-dimension]').forEach(el => {
+        (scope || document).querySelectorAll('[class*="dimension"], [class*="spec"], [data-dimension]').forEach(el => {
             if (!dimensions && el.textContent) {
                 const t = el.textContent.trim();
                 if (t.match(/[WHD].*\\d/i) || t.match(/\\d.*["x×]/)) {
@@ -278,45 +297,34 @@ EXTRACT_DETAILS_JS = """
         dimensions: dimensions
     });
 })();
-"""
+""".replace("__DETAILS_SCOPE__", json.dumps(SELECTORS.pdp_details)).replace("__CANONICAL_IMAGE__", CANONICAL_IMAGE_JS)
+
+extractors.register("details", EXTRACT_DETAILS_JS)
 
 
 def load_progress():
-    """Load progress from file."""
-    if PROGRESS_FILE.exists():
-        try:
-            return json.loads(PROGRESS_FILE.read_text())
-        except:
-            pass
-    return {"scraped_urls": [], "processed_details": []}
+    """Load progress from file (newest valid checkpoint generation)."""
+    return load_checkpoint(PROGRESS_FILE, {"scraped_urls": [], "processed_details": []})
 
 
 def save_progress(progress):
     """Save progress to file."""
-    PROGRESS_FILE.write_text(json.dumps(progress, indent=2))
-
+    save_checkpoint(PROGRESS_FILE, progress)
 
-def write_csv_row(row):
-    """Append a row to CSV."""
-    file_exists = OUTPUT_CSV.exists() and OUTPUT_CSV.stat().st_size > 0
-    with open(OUTPUT_CSV, 'a', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=[
-            'uuid7', 'name', 'images', 'price', 'product_link', 
-            'platform', 'category', 'sub_category', 'dimensions', 'all_images'
-        ])
-        if not file_exists:
-            writer.writeheader()
-        writer.writerow(row)
 
-
-async def scroll_page(page, times=25):
-    """Scroll to load products."""
-    for _ in range(times):
-        try:
-            await page.evaluate("window.scrollBy(0, 600)")
-        except:
-            pass
-        await asyncio.sleep(0.3)
+def reconcile_output(progress, processed_skus):
+    """Mark SKUs whose rows reached OUTPUT_CSV after the last checkpoint as processed."""
+    if not OUTPUT_CSV.exists():
+        return 0
+    before = len(processed_skus)
+    for row in read_output_rows(OUTPUT_CSV, progress.get("output_bytes", 0)):
+        sku = product_sku(row.get("product_link", ""))
+        if sku:
+            processed_skus.add(sku)
+    recovered = len(processed_skus) - before
+    if recovered:
+        logger.info("Recovered %d products written after the last checkpoint", recovered)
+    return recovered
 
 
 async def get_product_details(browser, url):
@@ -328,7 +336,7 @@ async def get_product_details(browser, url):
         page = await browser.get(url)
         await asyncio.sleep(3)
         
-        result = await page.evaluate(EXTRACT_DETAILS_JS)
+        result = await extractors.call(page, "details")
         if result:
             data = json.loads(result)
             dimensions = data.get("dimensions", "")
@@ -340,100 +348,117 @@ async def get_product_details(browser, url):
     return dimensions, all_images
 
 
-async def scrape_subcategory(browser, url_path, category, subcategory, scraped_skus):
-    """Scrape products from a subcategory. Uses SKU for deduplication."""
+async def scrape_subcategory(browser, url_path, category, subcategory, memberships, failed_urls=None):
+    """
+    Scrape products from a subcategory. Uses SKU for deduplication.
+
+    Every listing appearance is recorded in memberships; only SKUs not seen in
+    an earlier listing are returned, so each detail page is fetched once.
+    If the listing could not be fetched, or came back blocked or not loaded,
+    url_path is added to failed_urls. Only a listing that loaded and showed no
+    products is recorded as empty in the taxonomy cache.
+    """
     products = []
     full_url = BASE_URL.rstrip('/') + url_path
     
     try:
-        page = await browser.get(full_url)
-        await asyncio.sleep(PAGE_LOAD_WAIT + 1)
+        listing = await fetch_listing(browser, full_url, EXTRACT_LISTING_JS)
+        if listing.confirmed_empty:
+            mark_empty_url(url_path)
+        elif not listing.ok and failed_urls is not None:
+            failed_urls.add(url_path)
         
-        await scroll_page(page, 30)
-        await asyncio.sleep(1)
-        
-        result = await page.evaluate(EXTRACT_LISTING_JS)
-        if result:
-            items = json.loads(result)
+        links = canonicalize_batch([item.get("url", "") for item in listing.items])
+        for position, (item, (url, sku)) in enumerate(zip(listing.items, links), 1):
+            # Use SKU for deduplication (most reliable)
+            if not sku:
+                continue
+            if not memberships.add(sku, category, subcategory, position):
+                continue
             
-            for item in items:
-                url = normalize_product_url(item.get("url", ""))
-                if not url:
-                    continue
-                
-                # Use SKU for deduplication (most reliable)
-                sku = get_product_sku(url)
-                if not sku or sku in scraped_skus:
-                    continue
-                
-                products.append({
-                    "url": url,
-                    "sku": sku,
-                    "name": sanitize_text(item.get("name", "")) or "Unknown",
-                    "image": item.get("image", ""),
-                    "price": item.get("price", ""),
-                    "category": category,
-                    "sub_category": subcategory,
-                })
+            products.append({
+                "url": url,
+                "sku": sku,
+                "name": sanitize_text(item.get("name", "")) or "Unknown",
+                "image": item.get("image", ""),
+                "price": item.get("price", ""),
+                "category": category,
+                "sub_category": subcategory,
+            })
                     
     except Exception as e:
         logger.error("Error scraping %s: %s", subcategory, e)
+        if failed_urls is not None:
+            failed_urls.add(url_path)
     
     return products
 
 
-async def main():
-    """Main scraper."""
+async def main(profile=None):
+    """Main scraper. profile: execution profile name (default EXECUTION_PROFILE)."""
     progress = load_progress()
     scraped_skus = set(progress.get("scraped_skus", []))  # Use SKUs for deduplication
     processed_skus = set(progress.get("processed_skus", []))
-    
-    # Initialize CSV if needed
-    if not OUTPUT_CSV.exists():
-        write_csv_row({
-            'uuid7': '', 'name': '', 'images': '', 'price': '', 'product_link': '',
-            'platform': '', 'category': '', 'sub_category': '', 'dimensions': '', 'all_images': ''
-        })
-        # Remove the empty row
-        OUTPUT_CSV.write_text(OUTPUT_CSV.read_text().strip().split('\n')[0] + '\n')
+    reconcile_output(progress, processed_skus)
+    memberships = MembershipIndex()  # Rebuilt from the listings on every run
+    image_index = ImageIndex()
+    product_ids = ProductIdIndex()
     
     browser = None
+    meter = governor = None
+    # Rows and progress are written off the event loop; OUTPUT_CSV stays open for the
+    # whole run and gets its header (OUTPUT_HEADER) only when new
+    writer = AsyncWriter()
+    writer.start()
+    
+    def save_all():
+        progress["scraped_skus"] = list(scraped_skus)
+        progress["processed_skus"] = list(processed_skus)
+        writer.checkpoint(PROGRESS_FILE, progress, output=OUTPUT_CSV)
     
     try:
         logger.info("Starting browser...")
-        start_kw = {"headless": HEADLESS}
-        if CHROME_USER_DATA_DIR:
-            start_kw["user_data_dir"] = CHROME_USER_DATA_DIR
+        browser = await start_browser(profile, CHROME_USER_DATA_DIR)
         
-        browser = await uc.start(**start_kw)
-        logger.info("Browser started.")
+        categories = await get_taxonomy(browser, BASE_URL, fallback=CATEGORIES)
+        # Subcategories left out as empty, and those that fail below, are not listed this run
+        cache = load_taxonomy_cache()
+        skipped_urls = set(cache["empty_urls"]) if cache else set()
+        failed_urls = set()
         
         # Count total subcategories
-        total_subcats = sum(len(subs) for subs in CATEGORIES.values())
+        total_subcats = sum(len(subs) for subs in categories.values())
         subcat_num = 0
         all_products = []
+        run_prices = {}  # Every SKU listed this run -> price, for the price history
+        listed_skus = set()
         
         # Phase 1: Collect all products from listings
         logger.info("=" * 60)
         logger.info("PHASE 1: Collecting products from all subcategories")
         logger.info("=" * 60)
         
-        for category, subcategories in CATEGORIES.items():
+        for category, subcategories in categories.items():
             logger.info("CATEGORY: %s", category)
             
             for subcategory, url_path in subcategories.items():
                 subcat_num += 1
                 logger.info("[%d/%d] %s > %s", subcat_num, total_subcats, category, subcategory)
                 
-                products = await scrape_subcategory(browser, url_path, category, subcategory, scraped_skus)
+                products = await scrape_subcategory(browser, url_path, category, subcategory, memberships, failed_urls)
                 
                 new_count = 0
                 for p in products:
                     sku = p.get("sku", "")
-                    if sku and sku not in scraped_skus:
+                    run_prices[sku] = parse_price_cents(p.get("price", ""))
+                    product_ids.see(sku)
+                    if sku and sku not in listed_skus:
+                        listed_skus.add(sku)
                         scraped_skus.add(sku)
-                        all_products.append(p)
-                        new_count += 1
+                        # Listed in an earlier run but never detailed: still to do
+                        if sku not in processed_skus:
+                            all_products.append(p)
+                            new_count += 1
                 
                 logger.info("  Found %d new products (total: %d)", new_count, len(all_products))
                 
@@ -441,6 +466,16 @@ async def main():
         
         logger.info("=" * 60)
         logger.info("PHASE 1 COMPLETE: %d total products", len(all_products))
+        rows = memberships.write_csv(MEMBERSHIP_CSV)
+        logger.info("Memberships: %d rows, %d SKUs in multiple subcategories -> %s",
+                    rows, memberships.multi_membership_count(), MEMBERSHIP_CSV)
+        # Only a run that listed every subcategory may mark unlisted SKUs unavailable
+        complete = not failed_urls and not skipped_urls
+        if not complete:
+            logger.warning("Price history: %d subcategories failed and %d were skipped - "
+                           "not marking unlisted SKUs unavailable", len(failed_urls), len(skipped_urls))
+        PriceHistory().record(run_prices, complete=complete)
+        product_ids.save(writer)
         logger.info("=" * 60)
         
         # Phase 2: Get details for each product
@@ -448,6 +483,13 @@ async def main():
         logger.info("Estimated time: ~%d minutes", len(all_products) * 3 // 60)
         logger.info("=" * 60)
         
+        cache = DetailCache(PDP_FIELDS)
+        for csv_path in DETAIL_CACHE_CSVS:
+            cache.load_csv(csv_path)
+        page_loads = reused = 0
+        meter = ResourceMeter(profile, browser)  # Product pages only
+        governor = MemoryGovernor(profile, meter, CHROME_USER_DATA_DIR)
+        
         for i, product in enumerate(all_products):
             sku = product.get("sku", "")
             url = product["url"]
@@ -458,12 +500,23 @@ async def main():
             if (i + 1) % 50 == 0:
                 logger.info("Progress: %d/%d products (%.1f%%)", i + 1, len(all_products), (i + 1) / len(all_products) * 100)
             
-            # Get product details
-            dimensions, all_images = await get_product_details(browser, url)
+            # Both PDP fields known from an earlier run: no page visit
+            known = {'product_link': url}
+            fill_known_fields(known, PDP_FIELDS, cache)
+            visited = not all(known.get(f) for f in PDP_FIELDS)
+            if visited:
+                dimensions, all_images = await get_product_details(browser, url)
+                page_loads += 1
+                meter.page_done()
+                browser = await governor.after_page(browser)
+            else:
+                dimensions, all_images = known['dimensions'], known['all_images'].split('|')
+                reused += 1
+            all_images = image_index.add(sku, all_images)
             
             # Write to CSV
             row = {
-                'uuid7': generate_uuid7(),
+                'uuid7': product_id(url),
                 'name': product["name"],
                 'images': product["image"],
                 'price': product["price"],
@@ -474,37 +527,41 @@ async def main():
                 'dimensions': dimensions,
                 'all_images': '|'.join(all_images[:10])  # Limit to 10 images
             }
-            write_csv_row(row)
+            writer.append_rows(OUTPUT_CSV, OUTPUT_HEADER, [row])
             
             processed_skus.add(sku)
             
-            # Save progress periodically
+            # Save progress periodically (queued after the rows above, so never ahead of the CSV)
             if (i + 1) % 100 == 0:
-                progress["scraped_skus"] = list(scraped_skus)
-                progress["processed_skus"] = list(processed_skus)
-                save_progress(progress)
+                save_all()
                 logger.info("Progress saved.")
             
-            await asyncio.sleep(1.5)  # Rate limiting
+            if visited:
+                await asyncio.sleep(1.5)  # Rate limiting
         
         # Final save
-        progress["scraped_skus"] = list(scraped_skus)
-        progress["processed_skus"] = list(processed_skus)
-        save_progress(progress)
+        save_all()
+        
+        assets = image_index.write_csv(IMAGE_ASSETS_CSV)
+        logger.info("Image assets: %d unique of %d URLs -> %s", assets, image_index.urls_seen, IMAGE_ASSETS_CSV)
         
         logger.info("=" * 60)
         logger.info("SCRAPING COMPLETE!")
         logger.info("Total products: %d", len(all_products))
+        logger.info("Product pages loaded: %d (%d reused from earlier runs)", page_loads, reused)
         logger.info("Output: %s", OUTPUT_CSV)
         logger.info("=" * 60)
         
     except Exception as e:
         logger.exception("Scraper failed: %s", e)
         # Save progress on error
-        progress["scraped_skus"] = list(scraped_skus)
-        progress["processed_skus"] = list(processed_skus)
-        save_progress(progress)
+        save_all()
     finally:
+        await writer.close()
+        if meter:
+            meter.log()
+        if governor:
+            governor.close()
         if browser:
             try:
                 browser.stop()
@@ -513,4 +570,7 @@ async def main():
 
 
 if __name__ == "__main__":
-    uc.loop().run_until_complete(main())
+    parser = argparse.ArgumentParser(description="Full CB2 crawl: listings, then dimensions and images per product.")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    uc.loop().run_until_complete(main(args.profile))
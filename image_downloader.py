@@ -0,0 +1,262 @@
+"""
+Images stage: download catalog images into a content-addressed store.
+
+Reads unique image URLs from cb2_image_assets.csv (written by
+add_product_details / full_scraper) or from the images / all_images columns
+of any product CSV, and downloads them with one pooled aiohttp session under
+bounded concurrency. Each image is stored once by SHA-256 of its bytes:
+
+    images/ab/ab12...ef.jpg
+    images/manifest.jsonl      # one line per downloaded URL
+    images/thumbs/ab12...ef.jpg  (with --thumbnails)
+
+A rerun skips every URL already in the manifest, so interrupted runs resume.
+Thumbnails are generated in a process pool when Pillow is installed, also
+for images stored by earlier runs whose thumbnail is missing.
+"""
+
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import aiohttp
+
+from config import (
+    IMAGE_DOWNLOAD_CONCURRENCY,
+    IMAGE_DOWNLOAD_TIMEOUT,
+    IMAGES_DIR,
+    MAX_RETRIES,
+    RETRY_DELAY,
+    USER_AGENT,
+)
+from image_urls import dedupe_image_urls
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_INPUT_CSV = "cb2_image_assets.csv"
+
+_CONTENT_TYPE_EXT = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+    "image/avif": ".avif",
+    "image/tiff": ".tif",
+}
+
+
+def read_image_urls(csv_path) -> list[str]:
+    """Collect image URLs from an asset CSV (url column) or a product CSV (images / all_images)."""
+    urls = []
+    with open(csv_path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row.get("url"):
+                urls.append(row["url"])
+            if row.get("images"):
+                urls.append(row["images"])
+            if row.get("all_images"):
+                urls.extend(row["all_images"].split("|"))
+    return dedupe_image_urls(u.strip() for u in urls)
+
+
+def load_manifest(manifest_path: Path) -> dict[str, dict]:
+    """Load url -> record from the JSONL manifest, ignoring a torn last line."""
+    records = {}
+    if not manifest_path.exists():
+        return records
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            records[record["url"]] = record
+    return records
+
+
+def make_thumbnail(src: str, dst: str, size: int) -> str:
+    """Write a JPEG thumbnail of src to dst (runs in a worker process)."""
+    with Image.open(src) as img:
+        img.thumbnail((size, size))
+        img.convert("RGB").save(dst, "JPEG", quality=85)
+    return dst
+
+
+class ImageStore:
+    """Content-addressed image store with a JSONL manifest."""
+
+    def __init__(self, root) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.root / "manifest.jsonl"
+        self.records = load_manifest(self.manifest_path)
+        self._manifest = open(self.manifest_path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def path_for(self, digest: str, ext: str) -> Path:
+        return self.root / digest[:2] / (digest + ext)
+
+    def put(self, url: str, data: bytes, content_type: str) -> dict:
+        """Store bytes (once per digest) and append the URL to the manifest."""
+        digest = hashlib.sha256(data).hexdigest()
+        ext = _CONTENT_TYPE_EXT.get(content_type.split(";")[0].strip().lower(), ".jpg")
+        path = self.path_for(digest, ext)
+        record = {
+            "url": url,
+            "sha256": digest,
+            "path": str(path.relative_to(self.root)),
+            "bytes": len(data),
+            "content_type": content_type,
+        }
+        with self._lock:
+            is_new = not path.exists()
+            if is_new:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_suffix(path.suffix + ".tmp")
+                tmp.write_bytes(data)
+                os.replace(tmp, path)
+            self._manifest.write(json.dumps(record) + "\n")
+            self._manifest.flush()
+            self.records[url] = record
+        return dict(record, new=is_new)
+
+    def close(self) -> None:
+        self._manifest.close()
+
+
+async def fetch_image(session: aiohttp.ClientSession, url: str) -> Optional[tuple[bytes, str]]:
+    """GET an image with retries. Returns (bytes, content_type) or None."""
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            async with session.get(url) as resp:
+                if resp.status == 200:
+                    return await resp.read(), resp.headers.get("Content-Type", "")
+                if resp.status in (404, 410):
+                    logger.warning("  %d %s", resp.status, url)
+                    return None
+                logger.debug("  HTTP %d (attempt %d) %s", resp.status, attempt, url)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.debug("  %s (attempt %d) %s", type(e).__name__, attempt, url)
+        if attempt < MAX_RETRIES:
+            await asyncio.sleep(RETRY_DELAY * attempt)
+    logger.warning("  Failed after %d attempts: %s", MAX_RETRIES, url)
+    return None
+
+
+async def download_images(
+    urls: list[str],
+    out_dir=IMAGES_DIR,
+    concurrency: int = IMAGE_DOWNLOAD_CONCURRENCY,
+    thumbnail_size: int = 0,
+) -> dict[str, int]:
+    """Download urls into the store at out_dir. Returns counters for the run."""
+    store = ImageStore(out_dir)
+    pending = [u for u in urls if u not in store.records]
+    stats = {"total": len(urls), "skipped": len(urls) - len(pending), "downloaded": 0, "duplicates": 0, "failed": 0, "bytes": 0}
+    logger.info("Images: %d total, %d already in manifest, %d to download", len(urls), stats["skipped"], len(pending))
+
+    thumbs_dir = Path(out_dir) / "thumbs"
+    pool = None
+    thumb_jobs = []
+    if thumbnail_size:
+        if Image is None:
+            logger.warning("Pillow not installed - skipping thumbnails")
+        else:
+            thumbs_dir.mkdir(parents=True, exist_ok=True)
+            pool = ProcessPoolExecutor()
+
+    loop = asyncio.get_running_loop()
+    thumbs_queued = set()
+
+    def queue_thumbnail(record: dict) -> None:
+        """Queue a thumbnail for a stored file unless it exists or is already queued."""
+        dst = thumbs_dir / (record["sha256"] + ".jpg")
+        src = store.root / record["path"]
+        if record["sha256"] in thumbs_queued or dst.exists() or not src.exists():
+            return
+        thumbs_queued.add(record["sha256"])
+        thumb_jobs.append(loop.run_in_executor(pool, make_thumbnail, str(src), str(dst), thumbnail_size))
+
+    if pool is not None:
+        # Files stored by earlier runs (without --thumbnails, or interrupted
+        # before their thumbnails were written) are never downloaded again
+        for record in list(store.records.values()):
+            queue_thumbnail(record)
+        if thumb_jobs:
+            logger.info("Thumbnails: %d missing for stored images", len(thumb_jobs))
+
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=IMAGE_DOWNLOAD_TIMEOUT)
+
+    async def worker(url: str) -> None:
+        async with semaphore:
+            fetched = await fetch_image(session, url)
+        if fetched is None:
+            stats["failed"] += 1
+            return
+        data, content_type = fetched
+        record = await asyncio.to_thread(store.put, url, data, content_type)
+        stats["bytes"] += record["bytes"]
+        if pool is not None:
+            queue_thumbnail(record)
+        if not record["new"]:
+            stats["duplicates"] += 1
+            return
+        stats["downloaded"] += 1
+        done = stats["downloaded"] + stats["duplicates"] + stats["failed"]
+        if done % 100 == 0:
+            logger.info("  Progress: %d/%d", done, len(pending))
+
+    try:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers={"User-Agent": USER_AGENT}) as session:
+            await asyncio.gather(*(worker(u) for u in pending))
+        if thumb_jobs:
+            results = await asyncio.gather(*thumb_jobs, return_exceptions=True)
+            errors = [r for r in results if isinstance(r, Exception)]
+            if errors:
+                logger.warning("Thumbnail failures: %d (first: %s)", len(errors), errors[0])
+    finally:
+        store.close()
+        if pool is not None:
+            pool.shutdown()
+
+    logger.info(
+        "Images done: %d downloaded, %d duplicate content, %d failed, %d skipped (%.1f MB)",
+        stats["downloaded"], stats["duplicates"], stats["failed"], stats["skipped"], stats["bytes"] / 1e6,
+    )
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Download catalog images into a content-addressed store.")
+    parser.add_argument("--input", default=DEFAULT_INPUT_CSV, help="Asset CSV or product CSV with image columns")
+    parser.add_argument("--out", default=IMAGES_DIR, help="Image store directory")
+    parser.add_argument("--concurrency", type=int, default=IMAGE_DOWNLOAD_CONCURRENCY)
+    parser.add_argument("--thumbnails", type=int, default=0, metavar="PX", help="Also write thumbnails of this max size")
+    args = parser.parse_args()
+
+    urls = read_image_urls(args.input)
+    asyncio.run(download_images(urls, args.out, args.concurrency, args.thumbnails))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Scene7 image URL canonicalization and catalog-wide dedup.
+
+CB2 serves every product image from Scene7 under many size/format variants of
+the same asset:
+
+    https://cb2.scene7.com/is/image/CB2/FitzLoveseatGreenSHF22?$web_pdp_main$
+    https://cb2.scene7.com/is/image/CB2/FitzLoveseatGreenSHF22/$web_plp_card$/220101.jpg
+    https://cb2.scene7.com/is/image/CB2/FitzLoveseatGreenSHF22?wid=400&qlt=70&fmt=webp
+
+All three collapse to the asset ID "FitzLoveseatGreenSHF22" and the canonical
+URL https://cb2.scene7.com/is/image/CB2/FitzLoveseatGreenSHF22.
+"""
+
+import csv
+import re
+from pathlib import Path
+from typing import Iterable
+
+SCENE7_BASE = "https://cb2.scene7.com/is/image/CB2/"
+
+# Asset name is the first path segment after /is/image/CB2/
+_SCENE7_ASSET_RE = re.compile(r"scene7\.com/is/image/CB2/([^/?#$]+)", re.IGNORECASE)
+_IMAGE_EXT_RE = re.compile(r"\.(?:jpe?g|png|webp|gif|tiff?)$", re.IGNORECASE)
+
+# canonical_image_url() for the extraction scripts, built from the same patterns
+# so the in-page and Python rules cannot drift apart. Substituted for
+# __CANONICAL_IMAGE__ in the page JS.
+CANONICAL_IMAGE_JS = ("""
+src => {
+    const m = src.match(/__ASSET_RE__/i);
+    if (!m) return src.trim().split('?')[0];
+    return '__SCENE7_BASE__' + m[1].replace(/__EXT_RE__/i, '');
+}
+"""
+    .replace("__ASSET_RE__", _SCENE7_ASSET_RE.pattern.replace("/", "\\/"))
+    .replace("__EXT_RE__", _IMAGE_EXT_RE.pattern)
+    .replace("__SCENE7_BASE__", SCENE7_BASE)
+    .strip())
+
+IMAGE_ASSETS_HEADER = ["asset_id", "url", "sku_count", "variant_count"]
+
+
+def scene7_asset_id(url: str) -> str:
+    """Return the Scene7 asset ID for an image URL, or '' if it is not a CB2 Scene7 URL."""
+    match = _SCENE7_ASSET_RE.search(url or "")
+    if not match:
+        return ""
+    return _IMAGE_EXT_RE.sub("", match.group(1))
+
+
+def canonical_image_url(url: str) -> str:
+    """Strip presets, size/format params and extensions. Non-Scene7 URLs only lose their query."""
+    asset_id = scene7_asset_id(url)
+    if asset_id:
+        return SCENE7_BASE + asset_id
+    return (url or "").strip().split("?")[0]
+
+
+def dedupe_image_urls(urls: Iterable[str]) -> list[str]:
+    """Canonicalize urls and drop variants of an asset already listed, keeping first-seen order."""
+    seen = set()
+    unique = []
+    for url in urls:
+        if not url:
+            continue
+        canonical = canonical_image_url(url)
+        key = canonical.lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(canonical)
+    return unique
+
+
+class ImageIndex:
+    """Catalog-wide asset index: one entry per unique Scene7 asset, with the SKUs that use it."""
+
+    def __init__(self) -> None:
+        self._urls: dict[str, str] = {}
+        self._skus: dict[str, set[str]] = {}
+        self._variants: dict[str, int] = {}
+        self.urls_seen = 0
+
+    def add(self, sku: str, urls: Iterable[str]) -> list[str]:
+        """Index a product's image URLs. Returns the product's deduplicated canonical URLs."""
+        urls = list(urls)
+        self.urls_seen += len(urls)
+        for url in urls:
+            key = canonical_image_url(url).lower()
+            self._variants[key] = self._variants.get(key, 0) + 1
+        unique = dedupe_image_urls(urls)
+        for canonical in unique:
+            key = canonical.lower()
+            self._urls.setdefault(key, canonical)
+            if sku:
+                self._skus.setdefault(key, set()).add(sku)
+        return unique
+
+    def __len__(self) -> int:
+        return len(self._urls)
+
+    def urls(self) -> list[str]:
+        """Unique canonical URLs, in first-seen order - the download list."""
+        return list(self._urls.values())
+
+    def write_csv(self, csv_path) -> int:
+        """Write one row per unique asset. Returns the number of rows written."""
+        path = Path(csv_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=IMAGE_ASSETS_HEADER)
+            writer.writeheader()
+            for key, url in self._urls.items():
+                writer.writerow({
+                    "asset_id": scene7_asset_id(url) or url,
+                    "url": url,
+                    "sku_count": len(self._skus.get(key, ())),
+                    "variant_count": self._variants.get(key, 0),
+                })
+        return len(self._urls)
@@ -0,0 +1,258 @@
+"""
+Listing page fetching: scroll-until-stable plus server-side pagination.
+
+fetch_listing() loads a subcategory URL and first looks for pagination or
+page-size query parameters in the page's own links. When a page-size
+parameter and a result total are found, the listing is reloaded with all
+results on one page. The page is then scrolled until no new product links
+appear (bounded by LISTING_MAX_SCROLLS) and extracted; when a page parameter
+was found, the remaining pages are fetched concurrently in separate tabs.
+Items are merged by SKU, and the result count shown on the page is kept so
+completeness can be checked. A listing whose first page or page-size reload
+did not finish loading or was blocked is returned without items and
+flagged, so callers can tell it apart from a subcategory that really has no
+products.
+"""
+
+import asyncio
+import json
+import logging
+import math
+from dataclasses import dataclass, field
+from urllib.parse import urlencode, urlsplit, urlunsplit, parse_qsl
+
+from config import (
+    LISTING_MAX_PAGES,
+    LISTING_MAX_SCROLLS,
+    LISTING_PAGE_CONCURRENCY,
+    PAGE_LOAD_WAIT,
+    SCROLL_PAUSE,
+)
+from product_urls import canonicalize_batch
+
+logger = logging.getLogger(__name__)
+
+# Scroll one step and report how many product links are now in the DOM
+SCROLL_STEP_JS = """
+(function() {
+    window.scrollBy(0, 800);
+    return document.querySelectorAll('a[href*="/s"]').length;
+})();
+"""
+
+# Whether the page finished loading, and whether it is a block / bot check
+# page rather than the listing (same test as add_product_details' pipeline)
+PAGE_STATE_JS = """
+(function() {
+    const head = (document.body ? document.body.innerText : '').substring(0, 500);
+    const lower = head.toLowerCase();
+    return JSON.stringify({
+        loaded: document.readyState === 'complete' && !!document.body,
+        blocked: head.includes('Access Denied') || lower.includes('blocked')
+            || lower.includes('verify') || lower.includes('robot'),
+    });
+})();
+"""
+
+# Find page / page-size query parameters in links back to this listing,
+# plus the "N results" total shown on the page
+DETECT_PAGINATION_JS = """
+(function() {
+    const here = location.pathname.replace(/\\/$/, '');
+    const pageParams = ['page', 'pageNumber', 'pagenumber', 'pg', 'p'];
+    const sizeParams = ['pageSize', 'pagesize', 'perPage', 'sz', 'limit'];
+    const info = {pageParam: '', maxPage: 1, sizeParam: '', total: 0};
+
+    document.querySelectorAll('a[href], link[rel="next"]').forEach(a => {
+        let url;
+        try { url = new URL(a.getAttribute('href'), location.href); } catch (e) { return; }
+        if (url.pathname.replace(/\\/$/, '') !== here) return;
+        for (const p of pageParams) {
+            const v = parseInt(url.searchParams.get(p), 10);
+            if (!(v > 0)) continue;
+            if (!info.pageParam) info.pageParam = p;
+            if (p === info.pageParam) info.maxPage = Math.max(info.maxPage, v);
+        }
+        for (const p of sizeParams) {
+            if (!info.sizeParam && url.searchParams.has(p)) info.sizeParam = p;
+        }
+    });
+
+    const counter = document.querySelector('[class*="result-count"], [class*="resultCount"], [class*="product-count"]');
+    const text = counter ? counter.textContent : document.body.innerText.substring(0, 5000);
+    const m = text.match(/([\\d,]+)\\s+(?:results|items|products)\\b/i);
+    if (m) info.total = parseInt(m[1].replace(/,/g, ''), 10);
+
+    return JSON.stringify(info);
+})();
+"""
+
+
+@dataclass
+class PaginationInfo:
+    page_param: str = ""
+    max_page: int = 1
+    size_param: str = ""
+    total: int = 0
+
+
+@dataclass
+class ListingResult:
+    items: list[dict] = field(default_factory=list)
+    expected: int = 0
+    pages: int = 1
+    loaded: bool = True
+    blocked: bool = False
+
+    @property
+    def ok(self) -> bool:
+        """True if the first page loaded and was not a block page."""
+        return self.loaded and not self.blocked
+
+    @property
+    def confirmed_empty(self) -> bool:
+        """True only for a page that loaded, was not blocked, and listed no products."""
+        return self.ok and not self.items and not self.expected
+
+    @property
+    def complete(self) -> bool:
+        """True if the page showed no total or we captured at least that many SKUs."""
+        return not self.expected or len(self.items) >= self.expected
+
+
+def with_query(url: str, params: dict) -> str:
+    """Return url with params set in its query string."""
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query.update({k: str(v) for k, v in params.items()})
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
+
+
+def merge_by_sku(batches: list[list[dict]]) -> list[dict]:
+    """Merge item lists keeping the first occurrence of each SKU (items without a SKU are dropped)."""
+    merged = {}
+    for items in batches:
+        links = canonicalize_batch([item.get("url", "") for item in items])
+        for item, (_, sku) in zip(items, links):
+            if sku and sku not in merged:
+                merged[sku] = item
+    return list(merged.values())
+
+
+async def scroll_until_stable(page, max_steps: int = LISTING_MAX_SCROLLS, stable_steps: int = 3) -> int:
+    """Scroll until the product link count stops growing for stable_steps steps. Returns steps taken."""
+    last_count = -1
+    unchanged = 0
+    for step in range(1, max_steps + 1):
+        try:
+            count = await page.evaluate(SCROLL_STEP_JS)
+        except Exception:
+            count = last_count
+        if count == last_count:
+            unchanged += 1
+            if unchanged >= stable_steps:
+                return step
+        else:
+            unchanged = 0
+            last_count = count
+        await asyncio.sleep(SCROLL_PAUSE)
+    return max_steps
+
+
+async def detect_pagination(page) -> PaginationInfo:
+    """Read pagination hints from the loaded listing page."""
+    try:
+        result = await page.evaluate(DETECT_PAGINATION_JS)
+        data = json.loads(result) if result else {}
+    except Exception as e:
+        logger.debug("Pagination detection failed: %s", e)
+        data = {}
+    return PaginationInfo(
+        page_param=data.get("pageParam", ""),
+        max_page=int(data.get("maxPage", 1) or 1),
+        size_param=data.get("sizeParam", ""),
+        total=int(data.get("total", 0) or 0),
+    )
+
+
+async def page_state(page) -> tuple[bool, bool]:
+    """Return (loaded, blocked) for the current page; a failed check counts as not loaded."""
+    try:
+        result = await page.evaluate(PAGE_STATE_JS)
+        data = json.loads(result) if result else {}
+    except Exception as e:
+        logger.debug("Page state check failed: %s", e)
+        return False, False
+    return bool(data.get("loaded")), bool(data.get("blocked"))
+
+
+async def _extract(page, extract_js: str) -> list[dict]:
+    result = await page.evaluate(extract_js)
+    return json.loads(result) if result else []
+
+
+async def _fetch_extra_page(browser, url: str, extract_js: str, semaphore: asyncio.Semaphore) -> list[dict]:
+    """Load one additional listing page in its own tab and extract it."""
+    async with semaphore:
+        tab = None
+        try:
+            tab = await browser.get(url, new_tab=True)
+            await asyncio.sleep(PAGE_LOAD_WAIT)
+            await scroll_until_stable(tab)
+            return await _extract(tab, extract_js)
+        except Exception as e:
+            logger.warning("    Page fetch failed %s: %s", url, e)
+            return []
+        finally:
+            if tab is not None:
+                try:
+                    await tab.close()
+                except Exception:
+                    pass
+
+
+async def fetch_listing(browser, full_url: str, extract_js: str) -> ListingResult:
+    """
+    Fetch every product on a listing, using server-side pagination when the site offers it.
+
+    extract_js must return a JSON list of items with a "url" key.
+    """
+    page = await browser.get(full_url)
+    await asyncio.sleep(PAGE_LOAD_WAIT + 1)
+
+    loaded, blocked = await page_state(page)
+    if not loaded or blocked:
+        logger.warning("    Listing %s: %s", "blocked" if blocked else "did not load", full_url)
+        return ListingResult(loaded=loaded, blocked=blocked)
+
+    info = await detect_pagination(page)
+
+    # Preferred: one request with the page size raised to the full result count
+    if info.size_param and info.total:
+        page = await browser.get(with_query(full_url, {info.size_param: info.total}))
+        await asyncio.sleep(PAGE_LOAD_WAIT)
+        loaded, blocked = await page_state(page)
+        if not loaded or blocked:
+            logger.warning("    Listing %s on page-size reload: %s", "blocked" if blocked else "did not load", full_url)
+            return ListingResult(expected=info.total, loaded=loaded, blocked=blocked)
+
+    await scroll_until_stable(page)
+    first = await _extract(page, extract_js)
+    batches = [first]
+    pages = 1
+
+    if info.page_param and not (info.size_param and info.total):
+        pages = info.max_page
+        if info.total and first:
+            pages = max(pages, math.ceil(info.total / len(first)))
+        pages = min(pages, LISTING_MAX_PAGES)
+        if pages > 1:
+            logger.info("    Paginated via ?%s= (%d pages)", info.page_param, pages)
+            semaphore = asyncio.Semaphore(LISTING_PAGE_CONCURRENCY)
+            urls = [with_query(full_url, {info.page_param: n}) for n in range(2, pages + 1)]
+            batches += await asyncio.gather(*(_fetch_extra_page(browser, u, extract_js, semaphore) for u in urls))
+
+    listing = ListingResult(items=merge_by_sku(batches), expected=info.total, pages=pages)
+    if not listing.complete:
+        logger.warning("    Incomplete listing: captured %d of %d", len(listing.items), listing.expected)
+    return listing
@@ -0,0 +1,60 @@
+"""
+SKU membership index: which (category, subcategory, position) listings each SKU appeared in.
+
+The listing crawl records every appearance here instead of dropping SKUs seen
+in an earlier subcategory, so detail pages can be fetched once per SKU while
+multi-membership (e.g. Sofas and Sale) is kept and exported as its own table.
+"""
+
+import csv
+from pathlib import Path
+from typing import Iterator
+
+MEMBERSHIP_HEADER = ["sku", "category", "sub_category", "position"]
+
+Membership = tuple[str, str, int]
+
+
+class MembershipIndex:
+    """SKU -> set of (category, subcategory, position)."""
+
+    def __init__(self) -> None:
+        self._index: dict[str, set[Membership]] = {}
+
+    def add(self, sku: str, category: str, subcategory: str, position: int) -> bool:
+        """Record one listing appearance. Returns True if the SKU was not seen before."""
+        is_new = sku not in self._index
+        self._index.setdefault(sku, set()).add((category, subcategory, position))
+        return is_new
+
+    def __contains__(self, sku: str) -> bool:
+        return sku in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def memberships(self, sku: str) -> set[Membership]:
+        return self._index.get(sku, set())
+
+    def rows(self) -> Iterator[dict]:
+        """Yield one row per (sku, membership), sorted for stable output."""
+        for sku in sorted(self._index):
+            for category, subcategory, position in sorted(self._index[sku]):
+                yield {"sku": sku, "category": category, "sub_category": subcategory, "position": position}
+
+    def multi_membership_count(self) -> int:
+        """Number of SKUs listed in more than one subcategory."""
+        return sum(1 for m in self._index.values() if len({(c, s) for c, s, _ in m}) > 1)
+
+    def write_csv(self, csv_path) -> int:
+        """Write the membership table. Returns the number of rows written."""
+        path = Path(csv_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        count = 0
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=MEMBERSHIP_HEADER)
+            writer.writeheader()
+            for row in self.rows():
+                writer.writerow(row)
+                count += 1
+        return count
@@ -0,0 +1,180 @@
+"""
+Memory governor: recycle a tab or the browser only when it is actually bloated.
+
+Every MEMORY_SAMPLE_EVERY pages the governor reads the working tab's JS heap
+and DOM counts over CDP (Performance.getMetrics) and the RSS of the browser's
+process tree (browser_profiles.process_tree_usage), appends them to the
+memory curve CSV, and acts:
+
+    tab      JS heap or DOM node count of the tab over its limit: open a fresh
+             tab and close the old one (same browser, cookies and session)
+    browser  process-tree RSS over BROWSER_RSS_LIMIT_MB, or still over it at
+             the next sample after a tab recycle: restart the browser
+
+    browser = await start_browser(profile)
+    meter = ResourceMeter(profile, browser)
+    governor = MemoryGovernor(profile, meter)
+    for url in urls:
+        page = await browser.get(url)
+        ...
+        meter.page_done()
+        browser = await governor.after_page(browser)    # may be a new browser
+
+Pages are counted by the meter, so one governor check can follow several
+page loads (a listing's pages, a coordinator job).
+"""
+
+import logging
+import time
+from typing import Optional
+
+from nodriver import cdp
+
+import extractors
+from browser_profiles import ResourceMeter, start_browser
+from config import (
+    BROWSER_RSS_LIMIT_MB,
+    MEMORY_LOG_CSV,
+    MEMORY_SAMPLE_EVERY,
+    TAB_DOM_NODES_LIMIT,
+    TAB_HEAP_LIMIT_MB,
+)
+from csv_writer import BufferedCsvWriter
+
+logger = logging.getLogger(__name__)
+
+MEMORY_LOG_HEADER = [
+    "time", "profile", "pages", "browser_rss_mb", "js_heap_used_mb", "js_heap_total_mb",
+    "dom_nodes", "documents", "js_listeners", "action",
+]
+
+OK, RECYCLE_TAB, RESTART_BROWSER = "ok", "tab", "browser"
+
+
+async def tab_metrics(tab) -> dict[str, float]:
+    """Performance.getMetrics of a tab as {name: value} (JSHeapUsedSize, Nodes, ...)."""
+    await tab.send(cdp.performance.enable())
+    return {m.name: m.value for m in await tab.send(cdp.performance.get_metrics())}
+
+
+async def recycle_tab(browser):
+    """Replace the browser's working tab with a fresh one; returns the new tab."""
+    old = browser.main_tab
+    new = await browser.get("about:blank", new_tab=True)
+    await old.close()
+    extractors.forget(old)
+    await browser.update_targets()
+    return new
+
+
+class MemoryGovernor:
+    """Samples memory every sample_every pages and recycles the tab or browser past the limits."""
+
+    def __init__(self, profile=None, meter: Optional[ResourceMeter] = None, user_data_dir: Optional[str] = None,
+                 log_path=MEMORY_LOG_CSV, sample_every: int = MEMORY_SAMPLE_EVERY,
+                 tab_heap_mb: float = TAB_HEAP_LIMIT_MB, tab_nodes: int = TAB_DOM_NODES_LIMIT,
+                 browser_rss_mb: float = BROWSER_RSS_LIMIT_MB) -> None:
+        self.profile = profile
+        self.meter = meter or ResourceMeter(profile)
+        self.user_data_dir = user_data_dir
+        self.sample_every = max(1, sample_every)
+        self.tab_heap_mb = tab_heap_mb
+        self.tab_nodes = tab_nodes
+        self.browser_rss_mb = browser_rss_mb
+        self._next_sample = self.sample_every
+        self.tab_recycles = 0
+        self.browser_restarts = 0
+        self.last: dict = {}
+        self._tab_recycled_at: Optional[int] = None
+        self._log = None
+        if log_path:
+            self._log = BufferedCsvWriter(log_path, MEMORY_LOG_HEADER)
+            self._log.open()
+
+    def attach(self, browser) -> None:
+        self.meter.attach(browser)
+        self._tab_recycled_at = None
+
+    async def sample(self, browser) -> dict:
+        """Current memory readings of the browser and its working tab (MB / counts)."""
+        rss_mb = self.meter.sample() / 2**20
+        try:
+            metrics = await tab_metrics(browser.main_tab)
+        except Exception as e:
+            logger.debug("Performance.getMetrics failed: %s", e)
+            metrics = {}
+        return {
+            "browser_rss_mb": round(rss_mb, 1),
+            "js_heap_used_mb": round(metrics.get("JSHeapUsedSize", 0) / 2**20, 1),
+            "js_heap_total_mb": round(metrics.get("JSHeapTotalSize", 0) / 2**20, 1),
+            "dom_nodes": int(metrics.get("Nodes", 0)),
+            "documents": int(metrics.get("Documents", 0)),
+            "js_listeners": int(metrics.get("JSEventListeners", 0)),
+        }
+
+    def decide(self, reading: dict) -> str:
+        over_rss = self.browser_rss_mb and reading["browser_rss_mb"] > self.browser_rss_mb
+        if over_rss and self._tab_recycled_at is not None:
+            return RESTART_BROWSER  # A fresh tab did not bring the process tree back down
+        if reading["js_heap_used_mb"] > self.tab_heap_mb or reading["dom_nodes"] > self.tab_nodes or over_rss:
+            return RECYCLE_TAB
+        return OK
+
+    @property
+    def pages(self) -> int:
+        return self.meter.pages
+
+    async def after_page(self, browser):
+        """Call after meter.page_done(); when a sample is due, act on it. Returns the browser to use from now on."""
+        if self.pages < self._next_sample:
+            return browser
+        self._next_sample = self.pages + self.sample_every
+        reading = await self.sample(browser)
+        action = self.decide(reading)
+        self.last = reading
+        self._write(reading, action)
+        if action == OK:
+            self._tab_recycled_at = None
+            return browser
+        if action == RECYCLE_TAB:
+            logger.info("Memory: recycling tab (heap %.0f MB, %d DOM nodes, browser %.0f MB)",
+                        reading["js_heap_used_mb"], reading["dom_nodes"], reading["browser_rss_mb"])
+            try:
+                await recycle_tab(browser)
+                self.tab_recycles += 1
+                self._tab_recycled_at = self.pages
+                return browser
+            except Exception as e:
+                logger.warning("Tab recycle failed (%s) - restarting the browser", e)
+        logger.info("Memory: restarting browser (%.0f MB over %d pages)", reading["browser_rss_mb"], self.pages)
+        return await self.restart(browser)
+
+    async def restart(self, browser):
+        try:
+            browser.stop()
+        except Exception:
+            pass
+        browser = await start_browser(self.profile, self.user_data_dir)
+        self.browser_restarts += 1
+        self.attach(browser)
+        return browser
+
+    def _write(self, reading: dict, action: str) -> None:
+        if self._log is None:
+            logger.info("Memory after %d pages: RSS %.0f MB, heap %.0f MB, %d DOM nodes -> %s", self.pages,
+                        reading["browser_rss_mb"], reading["js_heap_used_mb"], reading["dom_nodes"], action)
+            return
+        self._log.writerow({
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "profile": self.meter.profile,
+            "pages": self.pages, "action": action, **reading,
+        })
+
+    def summary(self) -> dict:
+        return {"pages": self.pages, "tab_recycles": self.tab_recycles,
+                "browser_restarts": self.browser_restarts, **self.last}
+
+    def close(self) -> None:
+        logger.info("Memory governor: %d pages, %d tab recycles, %d browser restarts",
+                    self.pages, self.tab_recycles, self.browser_restarts)
+        if self._log is not None:
+            self._log.close()
@@ -0,0 +1,426 @@
+"""
+Offline replay harness: a local stand-in for www.cb2.com.
+
+    python mock_server.py serve --latency 0.3 --jitter 0.2 --deny-rate 0.05
+    CB2_BASE_URL=http://127.0.0.1:8765 python full_scraper.py --profile headless-fast
+    python mock_server.py record https://www.cb2.com/furniture/sofas/ https://www.cb2.com/...
+
+The server answers on the site's own paths:
+
+    /                              home page with the nav menu (taxonomy discovery)
+    /<category>/<subcategory>/     listing of the category's products
+    /<slug>/s<sku>                 product page (dimensions, SKU, description,
+                                   colors, details, image gallery)
+    /cb2.scene7.com/is/image/...   gallery images (a 1x1 GIF)
+    /__mock/stats                  request counts as JSON
+
+A page saved under MOCK_FIXTURES_DIR at the same path (see record) is served
+as recorded, with links to www.cb2.com and cb2.scene7.com rewritten to the
+mock; every other page is generated from the seed, so the catalog, the
+latencies and the denied requests are the same on every run.
+
+Behaviour (MockBehavior):
+    latency, jitter    seconds before each page is sent
+    lazy_batch         listing cards rendered up front; the rest are appended
+                       as the page is scrolled, like the site's infinite scroll
+    page_size          > 0: listings are split into ?page= pages with a
+                       "N results" count, as fetch_listing() paginates
+    lazy_images        gallery images that only appear after a scroll
+    deny_rate          share of pages answered with "Access Denied" (403)...
+    deny_repeat        ...for this many visits before the real page is served
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from dataclasses import asdict, dataclass
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+from config import MOCK_FIXTURES_DIR, MOCK_HOST, MOCK_PORT, MOCK_SEED, PAGE_LOAD_WAIT
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+LIVE_HOSTS = ("https://www.cb2.com", "https://cb2.scene7.com")
+
+# 1x1 transparent GIF served for every gallery image
+PIXEL_GIF = bytes.fromhex("47494638396101000100800000000000ffffff21f90401000000002c00000000010001000002024401003b")
+
+ADJECTIVES = ["Gwyneth", "Lenyx", "Ettore", "Camden", "Fitz", "Piazza", "Axis", "Gather", "Lucite", "Marais",
+              "Strut", "Tatum", "Bacci", "Sorrento", "Hoyt", "Vigo", "Ravine", "Ora", "Holmby", "Kirra"]
+MATERIALS = ["Boucle", "Walnut", "Marble", "Brass", "Velvet", "Travertine", "Oak", "Linen", "Iron", "Leather"]
+NOUNS = ["Sofa", "Lounge Chair", "Coffee Table", "Side Table", "Dining Table", "Bar Stool", "Bed", "Nightstand",
+         "Table Lamp", "Floor Lamp", "Pendant", "Area Rug", "Wall Mirror", "Vase", "Throw Pillow", "Bench"]
+COLORS = ["Ivory", "Black", "Natural", "Cognac", "Sage", "Charcoal", "Rust", "Cream", "Navy", "Smoke"]
+
+PAGE_STYLE = """
+body { margin: 0; font-family: sans-serif; }
+.product-tile { display: inline-block; width: 280px; height: 420px; margin: 8px; vertical-align: top; }
+.product-tile img, .gallery img { display: block; width: 100%; height: 300px; }
+.gallery { width: 800px; }
+.gallery img { height: 600px; }
+"""
+
+# Appends the next batch of listing cards (or gallery images) when the page
+# is scrolled near its bottom. Formatted with %(items)s and %(batch)d.
+LAZY_APPEND_JS = """
+(function() {
+    const pending = %(items)s;
+    const target = document.getElementById('lazy');
+    const more = () => {
+        if (!pending.length) return;
+        if (window.innerHeight + window.scrollY < document.body.scrollHeight - 1200) return;
+        target.insertAdjacentHTML('beforeend', pending.splice(0, %(batch)d).join(''));
+    };
+    window.addEventListener('scroll', more, {passive: true});
+})();
+"""
+
+DENIED_HTML = """<!DOCTYPE html>
+<html><head><title>Access Denied</title></head>
+<body><h1>Access Denied</h1>
+<p>You don't have permission to access "%(path)s" on this server.</p>
+<p>Reference #18.%(ref)s</p></body></html>
+"""
+
+
+@dataclass
+class MockBehavior:
+    latency: float = 0.0
+    jitter: float = 0.0
+    lazy_batch: int = 24
+    page_size: int = 0
+    lazy_images: int = 4
+    deny_rate: float = 0.0
+    deny_repeat: int = 1
+
+
+def _rng(*parts) -> random.Random:
+    return random.Random(":".join(str(p) for p in parts))
+
+
+def _slug(name: str) -> str:
+    return "-".join(name.lower().split())
+
+
+class MockCatalog:
+    """Deterministic products and listings for the paths of a {category: {subcategory: path}} table."""
+
+    def __init__(self, categories: dict[str, dict[str, str]], seed: int = MOCK_SEED,
+                 min_products: int = 24, max_products: int = 96, shared_share: float = 0.1) -> None:
+        self.categories = categories
+        self.seed = seed
+        self.min_products = min_products
+        self.max_products = max(min_products, max_products)
+        self.shared_share = shared_share
+        # Products that appear in several listings (exercises membership tracking)
+        self._shared = _rng(seed, "shared").sample(range(100000, 1000000), 200)
+        self._listings: dict[str, list[str]] = {}
+
+    def product(self, sku: str) -> dict:
+        """The product with this SKU; every six-digit SKU exists."""
+        rng = _rng(self.seed, sku)
+        name = f"{rng.choice(ADJECTIVES)} {rng.choice(MATERIALS)} {rng.choice(NOUNS)}"
+        w, d, h = rng.randint(12, 96), rng.randint(12, 48), rng.randint(10, 40)
+        asset = name.replace(" ", "") + sku
+        return {
+            "sku": sku,
+            "name": name,
+            "path": f"/{_slug(name)}/s{sku}",
+            "price": f"${rng.randint(29, 4999):,}.00",
+            "dimensions": f'{w}"W x {d}"D x {h}"H',
+            "colors": rng.sample(COLORS, rng.randint(1, 4)),
+            "images": [f"/cb2.scene7.com/is/image/CB2/{asset}_{n}" for n in range(1, rng.randint(3, 9))],
+        }
+
+    def listing(self, path: str) -> list[str]:
+        """SKUs of a listing path, in display order."""
+        skus = self._listings.get(path)
+        if skus is None:
+            rng = _rng(self.seed, path)
+            count = rng.randint(self.min_products, self.max_products)
+            shared = rng.sample(self._shared, min(len(self._shared), int(count * self.shared_share)))
+            own = rng.sample(range(100000, 1000000), count - len(shared))
+            skus = [str(s) for s in own + shared]
+            rng.shuffle(skus)
+            self._listings[path] = skus
+        return skus
+
+    def listing_paths(self) -> list[str]:
+        return [path for subs in self.categories.values() for path in subs.values()]
+
+
+# ==================== PAGES ====================
+
+def _page(title: str, body: str, script: str = "") -> str:
+    script = f"<script>{script}</script>" if script else ""
+    return (f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{escape(title)} | CB2</title>"
+            f"<style>{PAGE_STYLE}</style></head><body>{body}{script}</body></html>")
+
+
+def _lazy_script(items: list[str], batch: int) -> str:
+    # "</" would end the <script> element early
+    return LAZY_APPEND_JS % {"items": json.dumps(items).replace("</", "<\\/"), "batch": max(1, batch)}
+
+
+def render_home(catalog: MockCatalog) -> str:
+    menus = []
+    for category, subs in catalog.categories.items():
+        links = "".join(f'<li><a href="{escape(path)}">{escape(name)}</a></li>' for name, path in subs.items())
+        menus.append(f'<li><a href="/{_slug(category)}/">{escape(category.upper())}</a>'
+                     f'<div class="flyout"><h3>Shop {escape(category)}</h3><ul>{links}</ul></div></li>')
+    return _page("Modern Furniture", f'<header><nav><ul>{"".join(menus)}</ul></nav></header><main><h1>CB2</h1></main>')
+
+
+def _card(product: dict) -> str:
+    return (f'<div class="product-tile" data-product-id="{product["sku"]}">'
+            f'<a href="{escape(product["path"])}"><img src="{product["images"][0]}?wid=400">'
+            f'<span class="product-name">{escape(product["name"])}</span></a>'
+            f'<span class="product-price">{product["price"]}</span></div>')
+
+
+def render_listing(catalog: MockCatalog, behavior: MockBehavior, path: str, page: int = 1) -> str:
+    skus = catalog.listing(path)
+    total = len(skus)
+    header = ""
+    if behavior.page_size > 0:
+        pages = max(1, -(-total // behavior.page_size))
+        skus = skus[(page - 1) * behavior.page_size:page * behavior.page_size]
+        links = "".join(f'<a href="{escape(path)}?page={n}">{n}</a> ' for n in range(1, pages + 1))
+        header = f'<span class="result-count">{total} results</span><div class="pagination">{links}</div>'
+    cards = [_card(catalog.product(sku)) for sku in skus]
+    batch = behavior.lazy_batch if behavior.lazy_batch > 0 else len(cards)
+    body = (f'<main><h1>{escape(path.strip("/").split("/")[-1].replace("-", " ").title())}</h1>{header}'
+            f'<div id="lazy" class="product-grid">{"".join(cards[:batch])}</div></main>')
+    return _page(path, body, _lazy_script(cards[batch:], batch) if cards[batch:] else "")
+
+
+def render_product(catalog: MockCatalog, behavior: MockBehavior, sku: str) -> str:
+    p = catalog.product(sku)
+    images = [f'<img src="{src}?$web_pdp_main$" alt="">' for src in p["images"]]
+    eager = max(1, len(images) - behavior.lazy_images)
+    swatches = "".join(f'<button class="swatch" data-color="{c}"></button>' for c in p["colors"])
+    body = (
+        f'<main><h1 class="product-name">{escape(p["name"])}</h1>'
+        f'<span class="product-price">{p["price"]}</span>'
+        f'<div class="gallery" id="lazy">{"".join(images[:eager])}</div>'
+        f'<div class="swatches">{swatches}</div>'
+        f'<p class="product-description">The {escape(p["name"])} is designed for everyday living, crafted '
+        f'from solid materials with a modern profile that works in any room of the home.</p>'
+        f'<div class="product-details"><h2>Details and Dimensions</h2>'
+        f'<p>Overall Dimensions: {p["dimensions"]}</p><p>SKU: {sku}</p>'
+        f'<p>Materials: {p["name"].split()[1]}, kiln-dried hardwood frame. Care: wipe clean with a dry cloth.</p>'
+        f'</div></main>'
+    )
+    return _page(p["name"], body, _lazy_script(images[eager:], 2) if images[eager:] else "")
+
+
+def fixture_path(fixtures_dir, url_path: str) -> Path:
+    """Where a recorded page for url_path lives: <dir>/<path>/index.html."""
+    return Path(fixtures_dir) / url_path.strip("/") / "index.html"
+
+
+# ==================== SERVER ====================
+
+class MockSite:
+    """Routing, fixtures, latency and denials; shared by every request thread."""
+
+    def __init__(self, catalog: MockCatalog, behavior: Optional[MockBehavior] = None,
+                 fixtures_dir=MOCK_FIXTURES_DIR) -> None:
+        self.catalog = catalog
+        self.behavior = behavior or MockBehavior()
+        self.fixtures_dir = Path(fixtures_dir) if fixtures_dir else None
+        self.base_url = ""
+        self.stats: Counter = Counter()
+        self._visits: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, kind: str) -> None:
+        with self._lock:
+            self.stats[kind] += 1
+
+    def _visit(self, path: str) -> int:
+        with self._lock:
+            self._visits[path] += 1
+            return self._visits[path]
+
+    def denied(self, path: str, visit: int) -> bool:
+        """Whether this visit to path gets an Access Denied page (the first deny_repeat visits of chosen paths)."""
+        b = self.behavior
+        return b.deny_rate > 0 and visit <= b.deny_repeat and _rng(self.catalog.seed, "deny", path).random() < b.deny_rate
+
+    def respond(self, raw_path: str) -> tuple[int, str, bytes]:
+        """(status, content type, body) for a request path."""
+        parts = urlsplit(raw_path)
+        path = parts.path or "/"
+        if path == "/__mock/stats":
+            with self._lock:
+                stats = dict(self.stats)
+            return 200, "application/json", json.dumps(stats).encode()
+        if path.startswith("/cb2.scene7.com/"):
+            self._count("image")
+            return 200, "image/gif", PIXEL_GIF
+        if "." in path.rsplit("/", 1)[-1]:
+            self._count("not_found")
+            return 404, "text/plain", b"Not Found"
+
+        visit = self._visit(path)
+        b = self.behavior
+        if b.latency or b.jitter:
+            time.sleep(b.latency + _rng(self.catalog.seed, "latency", path, visit).uniform(0, b.jitter))
+        if self.denied(path, visit):
+            self._count("denied")
+            return 403, "text/html", (DENIED_HTML % {"path": escape(path), "ref": zlib.crc32(path.encode())}).encode()
+
+        recorded = fixture_path(self.fixtures_dir, path) if self.fixtures_dir else None
+        if recorded is not None and recorded.exists():
+            self._count("fixture")
+            html = recorded.read_text(encoding="utf-8")
+            html = html.replace(LIVE_HOSTS[0], self.base_url).replace(LIVE_HOSTS[1], self.base_url + "/cb2.scene7.com")
+            return 200, "text/html", html.encode("utf-8")
+
+        segments = [s for s in path.split("/") if s]
+        if path == "/":
+            self._count("home")
+            html = render_home(self.catalog)
+        elif segments and len(segments[-1]) in (6, 7) and segments[-1][0] == "s" and segments[-1][1:].isdigit():
+            self._count("product")
+            html = render_product(self.catalog, b, segments[-1][1:])
+        else:
+            self._count("listing")
+            page = int((parse_qs(parts.query).get("page") or ["1"])[0] or 1)
+            html = render_listing(self.catalog, b, path if path.endswith("/") else path + "/", page)
+        return 200, "text/html", html.encode("utf-8")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "CB2Mock/1"
+
+    def do_GET(self) -> None:
+        try:
+            status, content_type, body = self.server.site.respond(self.path)
+        except Exception as e:
+            logger.exception("Mock error on %s", self.path)
+            status, content_type, body = 500, "text/plain", str(e).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8" if content_type.startswith("text") else content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class MockServer:
+    """Threaded HTTP server for a MockSite; start() runs it in the background, serve_forever() in the foreground."""
+
+    def __init__(self, site: MockSite, host: str = MOCK_HOST, port: int = MOCK_PORT) -> None:
+        self.site = site
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.site = site
+        self._thread: Optional[threading.Thread] = None
+        host, port = self._httpd.server_address[:2]
+        self.url = site.base_url = f"http://{host}:{port}"
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._httpd.serve_forever()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+# ==================== RECORDING ====================
+
+async def record(urls: list[str], fixtures_dir=MOCK_FIXTURES_DIR, profile=None) -> int:
+    """Save the live pages at urls (after scrolling them) as fixtures. Returns the number saved."""
+    from browser_profiles import start_browser
+    from listing import scroll_until_stable
+
+    browser = await start_browser(profile)
+    saved = 0
+    try:
+        for url in urls:
+            try:
+                page = await browser.get(url)
+                await asyncio.sleep(PAGE_LOAD_WAIT)
+                await scroll_until_stable(page)
+                html = await page.get_content()
+            except Exception as e:
+                logger.warning("Could not record %s: %s", url, e)
+                continue
+            target = fixture_path(fixtures_dir, urlsplit(url).path or "/")
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(html, encoding="utf-8")
+            saved += 1
+            logger.info("Recorded %s -> %s (%d KB)", url, target, len(html) // 1024)
+    finally:
+        browser.stop()
+    return saved
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local mock CB2 site for offline, repeatable crawl runs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="Serve the mock site")
+    serve.add_argument("--host", default=MOCK_HOST)
+    serve.add_argument("--port", type=int, default=MOCK_PORT)
+    serve.add_argument("--seed", type=int, default=MOCK_SEED)
+    serve.add_argument("--fixtures", default=MOCK_FIXTURES_DIR, help="Recorded pages directory ('' for none)")
+    serve.add_argument("--min-products", type=int, default=24, help="Fewest products per listing")
+    serve.add_argument("--max-products", type=int, default=96, help="Most products per listing")
+    defaults = MockBehavior()
+    for name, value in asdict(defaults).items():
+        serve.add_argument("--" + name.replace("_", "-"), type=type(value), default=value)
+
+    rec = sub.add_parser("record", help="Save live pages as fixtures")
+    rec.add_argument("urls", nargs="+")
+    rec.add_argument("--fixtures", default=MOCK_FIXTURES_DIR)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        from full_scraper import CATEGORIES
+
+        behavior = MockBehavior(**{name: getattr(args, name) for name in asdict(defaults)})
+        catalog = MockCatalog(CATEGORIES, args.seed, args.min_products, args.max_products)
+        server = MockServer(MockSite(catalog, behavior, args.fixtures), args.host, args.port)
+        logger.info("Mock CB2 at %s (%d listings, %s)", server.url, len(catalog.listing_paths()), behavior)
+        logger.info("Point the scrapers at it with CB2_BASE_URL=%s", server.url)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    elif args.command == "record":
+        import nodriver as uc
+
+        saved = uc.loop().run_until_complete(record(args.urls, args.fixtures))
+        logger.info("Recorded %d of %d pages into %s", saved, len(args.urls), args.fixtures)
+
+
+if __name__ == "__main__":
+    main()
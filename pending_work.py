@@ -0,0 +1,108 @@
+"""
+Pending-work index for the enrichment pass (add_product_details).
+
+For every row of the details CSV that still has empty detail columns, the
+index keeps its key (the SKU, or the canonical URL when there is none) and
+the list of empty fields, in CSV order. It is saved inside the progress
+checkpoint, so a restart goes straight to the remaining rows instead of
+walking the whole CSV, and a pass can target particular fields:
+
+    pending = PendingWork.load(progress.get("pending"), products, DETAIL_COLUMNS)
+    for key in pending.select(["dimensions"]):     # rows missing dimensions
+        ...
+        pending.update(key, product)
+
+The saved index is only a hint: a row is re-checked before it is fetched, and
+the index is rebuilt when the CSV has a different number of rows. Fields a
+product page was loaded for but did not have are remembered as tried, so
+later targeted passes do not fetch the same page again for them.
+"""
+
+import logging
+from collections import Counter
+from typing import Iterable, Optional
+
+from product_urls import dedup_key
+
+logger = logging.getLogger(__name__)
+
+
+def row_key(product: dict) -> str:
+    return dedup_key(product.get('product_link', ''))
+
+
+def row_gaps(product: dict, fields: Iterable[str]) -> list[str]:
+    """Fields that are empty in a row."""
+    return [f for f in fields if not (product.get(f) or '').strip()]
+
+
+class PendingWork:
+    """Row key -> empty detail fields, for the rows that still have any."""
+
+    def __init__(self, fields: list[str], gaps: dict[str, list[str]], rows: int,
+                 tried: Optional[dict[str, list[str]]] = None) -> None:
+        self.fields = list(fields)
+        self.gaps = gaps
+        self.rows = rows
+        # key -> fields the product page was loaded for and did not have
+        self.tried = tried or {}
+
+    @classmethod
+    def build(cls, products: list[dict], fields: list[str]) -> "PendingWork":
+        gaps = {}
+        for product in products:
+            missing = row_gaps(product, fields)
+            if missing:
+                gaps[row_key(product)] = missing
+        return cls(fields, gaps, len(products))
+
+    @classmethod
+    def load(cls, saved: Optional[dict], products: list[dict], fields: list[str]) -> "PendingWork":
+        """The saved index if it still matches the CSV, else a fresh one."""
+        if saved and saved.get("rows") == len(products) and saved.get("fields") == list(fields):
+            return cls(fields, {k: list(v) for k, v in saved.get("gaps", {}).items()}, len(products),
+                       {k: list(v) for k, v in saved.get("tried", {}).items()})
+        if saved:
+            logger.info("Pending-work index is stale (%s rows saved, %d in CSV) - rebuilding",
+                        saved.get("rows"), len(products))
+        return cls.build(products, fields)
+
+    def to_progress(self) -> dict:
+        return {"rows": self.rows, "fields": self.fields, "gaps": self.gaps, "tried": self.tried}
+
+    def __len__(self) -> int:
+        return len(self.gaps)
+
+    def select(self, targets: Optional[Iterable[str]] = None, retry_tried: bool = False) -> list[str]:
+        """Keys of rows missing any of targets (default: any field), in CSV order."""
+        targets = set(self.fields if targets is None else targets)
+        keys = []
+        for key, missing in self.gaps.items():
+            wanted = targets.intersection(missing)
+            if not retry_tried:
+                wanted.difference_update(self.tried.get(key, ()))
+            if wanted:
+                keys.append(key)
+        return keys
+
+    def missing(self, key: str) -> list[str]:
+        return self.gaps.get(key, [])
+
+    def update(self, key: str, product: dict) -> list[str]:
+        """Re-check a row after it changed; returns its remaining gaps."""
+        missing = row_gaps(product, self.fields)
+        if missing:
+            self.gaps[key] = missing
+        else:
+            self.gaps.pop(key, None)
+        return missing
+
+    def mark_tried(self, key: str, targets: Iterable[str]) -> None:
+        """Record that a loaded page left these of its targets empty."""
+        left = [f for f in targets if f in self.gaps.get(key, ())]
+        if left:
+            self.tried[key] = sorted(set(self.tried.get(key, [])).union(left))
+
+    def field_counts(self) -> Counter:
+        """Rows missing each field."""
+        return Counter(f for missing in self.gaps.values() for f in missing)
@@ -0,0 +1,230 @@
+"""
+Price and availability history keyed by SKU, stored as per-run deltas.
+
+    python price_history.py record cb2_all_products.csv       # after a crawl
+    python price_history.py at 123456 --date 2026-03-01       # price of one SKU on a date
+    python price_history.py changed --since 2026-03-01        # every change since a date
+
+Each recorded run appends one small columnar segment holding only the SKUs
+whose price or availability changed since the previous run (SKUs missing
+from a complete run are recorded as unavailable). A daily crawl where a few
+hundred prices move adds a few kilobytes instead of a copy of the catalog.
+
+Layout under PRICE_HISTORY_DIR:
+
+    skus.txt                      SKU dictionary, one per line; line number = code
+    seg-20260301T060000123456.npz columns: code int32, price_cents int32 (-1 = none), available int8
+"""
+
+import argparse
+import csv
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from config import PRICE_HISTORY_DIR
+from utils import get_product_sku
+
+logger = logging.getLogger(__name__)
+
+NO_PRICE = -1
+SEGMENT_TIME_FORMAT = "%Y%m%dT%H%M%S%f"
+# Segments written before names carried microseconds
+LEGACY_SEGMENT_TIME_FORMAT = "%Y%m%dT%H%M%S"
+
+_PRICE_RE = re.compile(r"\$\s*([\d,]+(?:\.\d{1,2})?)")
+
+
+def parse_price_cents(price: str) -> int:
+    """First dollar amount in a listing price string, in cents ('$1,299.00' -> 129900). NO_PRICE if none."""
+    match = _PRICE_RE.search(price or "")
+    if not match:
+        return NO_PRICE
+    return int(round(float(match.group(1).replace(",", "")) * 100))
+
+
+class PriceHistory:
+    """Append-only delta store. Segments are loaded lazily and cached until the next record()."""
+
+    def __init__(self, root=PRICE_HISTORY_DIR) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._skus_path = self.root / "skus.txt"
+        self._skus: list[str] = self._skus_path.read_text(encoding="utf-8").split() if self._skus_path.exists() else []
+        self._codes = {sku: i for i, sku in enumerate(self._skus)}
+        self._history: Optional[pd.DataFrame] = None
+
+    def _code(self, sku: str, new_skus: list[str]) -> int:
+        code = self._codes.get(sku)
+        if code is None:
+            code = self._codes[sku] = len(self._skus)
+            self._skus.append(sku)
+            new_skus.append(sku)
+        return code
+
+    def segments(self) -> list[tuple[datetime, Path]]:
+        out = []
+        for path in self.root.glob("seg-*.npz"):
+            if path.name.endswith(".tmp.npz"):
+                continue
+            stamp = path.stem[4:]
+            fmt = SEGMENT_TIME_FORMAT if len(stamp) > 15 else LEGACY_SEGMENT_TIME_FORMAT
+            out.append((datetime.strptime(stamp, fmt), path))
+        return sorted(out)
+
+    def history(self) -> pd.DataFrame:
+        """Every recorded change: columns sku (category), observed, price_cents, available; sorted by sku, observed."""
+        if self._history is None:
+            frames = []
+            for observed, path in self.segments():
+                with np.load(path) as seg:
+                    frames.append(pd.DataFrame({
+                        "code": seg["code"],
+                        "observed": observed,
+                        "price_cents": seg["price_cents"],
+                        "available": seg["available"].astype(bool),
+                    }))
+            if frames:
+                df = pd.concat(frames, ignore_index=True)
+            else:
+                df = pd.DataFrame({"code": np.array([], dtype=np.int32), "observed": pd.Series([], dtype="datetime64[ns]"),
+                                   "price_cents": np.array([], dtype=np.int32), "available": np.array([], dtype=bool)})
+            df["sku"] = pd.Categorical.from_codes(df.pop("code"), categories=self._skus) if self._skus else pd.Categorical([])
+            self._history = df.sort_values(["sku", "observed"], kind="stable").reset_index(drop=True)
+        return self._history
+
+    def state_at(self, when: Optional[datetime] = None) -> pd.DataFrame:
+        """Latest known price/availability per SKU as of when (default: now), indexed by sku."""
+        df = self.history()
+        if when is not None:
+            df = df[df["observed"] <= when]
+        return df.groupby("sku", observed=True).last()[["observed", "price_cents", "available"]]
+
+    def price_at(self, sku: str, when: Optional[datetime] = None) -> Optional[dict]:
+        """{'price_cents', 'available', 'observed'} for sku as of when, or None if never seen by then."""
+        if sku not in self._codes:
+            return None
+        df = self.history()
+        rows = df[df["sku"] == sku]
+        if when is not None:
+            rows = rows[rows["observed"] <= when]
+        if rows.empty:
+            return None
+        last = rows.iloc[-1]
+        return {"price_cents": int(last["price_cents"]), "available": bool(last["available"]), "observed": last["observed"]}
+
+    def changed_since(self, since: datetime) -> pd.DataFrame:
+        """Changes recorded after since, with the previous value of each: sku, observed, old/new price, available."""
+        df = self.history()
+        prev = df.groupby("sku", observed=True)[["price_cents", "available"]].shift(1)
+        out = df.assign(old_price_cents=prev["price_cents"], was_available=prev["available"])
+        out = out[out["observed"] > since]
+        return out[["sku", "observed", "old_price_cents", "price_cents", "was_available", "available"]].reset_index(drop=True)
+
+    def record(self, prices: dict[str, int], observed: Optional[datetime] = None, complete: bool = True) -> int:
+        """
+        Record one run's {sku: price_cents} and write only the changes. Returns the number of changes.
+
+        If complete, SKUs seen before but missing from prices are recorded as unavailable.
+        """
+        observed = observed or datetime.now()
+        current = self.state_at()
+        known = dict(zip(current.index.astype(str), zip(current["price_cents"], current["available"])))
+
+        changes: dict[str, tuple[int, bool]] = {}
+        for sku, cents in prices.items():
+            if known.get(sku) != (cents, True):
+                changes[sku] = (cents, True)
+        if complete:
+            for sku, (cents, available) in known.items():
+                if available and sku not in prices:
+                    changes[sku] = (cents, False)
+        if not changes:
+            logger.info("Price history: no changes (%d SKUs)", len(prices))
+            return 0
+
+        new_skus: list[str] = []
+        codes = np.array([self._code(sku, new_skus) for sku in changes], dtype=np.int32)
+        price_cents = np.array([c for c, _ in changes.values()], dtype=np.int32)
+        available = np.array([a for _, a in changes.values()], dtype=np.int8)
+
+        if new_skus:
+            with open(self._skus_path, "a", encoding="utf-8") as f:
+                f.write("".join(f"{sku}\n" for sku in new_skus))
+                f.flush()
+                os.fsync(f.fileno())
+        path = self.root / f"seg-{observed.strftime(SEGMENT_TIME_FORMAT)}.npz"
+        while path.exists():
+            # Two runs recorded at the same instant: order the later one just after
+            observed += timedelta(microseconds=1)
+            path = self.root / f"seg-{observed.strftime(SEGMENT_TIME_FORMAT)}.npz"
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez_compressed(tmp, code=codes, price_cents=price_cents, available=available)
+        os.replace(tmp, path)
+        self._history = None
+        logger.info("Price history: %d changes (%d new SKUs) -> %s", len(changes), len(new_skus), path.name)
+        return len(changes)
+
+
+def prices_from_csv(csv_path) -> dict[str, int]:
+    """{sku: price_cents} from any products CSV with product_link and price columns."""
+    prices = {}
+    with open(csv_path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            sku = get_product_sku(row.get("product_link", ""))
+            if sku:
+                prices.setdefault(sku, parse_price_cents(row.get("price", "")))
+    return prices
+
+
+def _format_cents(cents) -> str:
+    return "" if pd.isna(cents) or cents == NO_PRICE else f"${cents / 100:,.2f}"
+
+
+def main() -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    parser = argparse.ArgumentParser(description="SKU price/availability history.")
+    parser.add_argument("--dir", default=PRICE_HISTORY_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    record = sub.add_parser("record", help="Record a products CSV as one run")
+    record.add_argument("csv")
+    record.add_argument("--partial", action="store_true", help="Do not mark missing SKUs unavailable")
+
+    at = sub.add_parser("at", help="Price of a SKU at a date")
+    at.add_argument("sku")
+    at.add_argument("--date", type=datetime.fromisoformat)
+
+    changed = sub.add_parser("changed", help="Changes since a date")
+    changed.add_argument("--since", type=datetime.fromisoformat, required=True)
+
+    args = parser.parse_args()
+    history = PriceHistory(args.dir)
+
+    if args.command == "record":
+        history.record(prices_from_csv(args.csv), complete=not args.partial)
+    elif args.command == "at":
+        found = history.price_at(args.sku, args.date)
+        if found is None:
+            print(f"{args.sku}: no record")
+        else:
+            status = "available" if found["available"] else "unavailable"
+            print(f"{args.sku}: {_format_cents(found['price_cents']) or 'no price'} ({status}, since {found['observed']})")
+    elif args.command == "changed":
+        for row in history.changed_since(args.since).itertuples(index=False):
+            print(f"{row.observed}  {row.sku:>10}  {_format_cents(row.old_price_cents):>12} -> "
+                  f"{_format_cents(row.price_cents):<12} {'' if row.available else 'UNAVAILABLE'}")
+
+
+if __name__ == "__main__":
+    main()
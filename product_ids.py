@@ -0,0 +1,140 @@
+"""
+Deterministic product IDs derived from the SKU, plus a first-seen index.
+
+In "stable" mode (PRODUCT_ID_MODE) the ID written to the uuid7 column is a
+UUIDv5 of the SKU, so the same product gets the same ID on every run and
+downstream merges can join on it instead of fuzzy-matching product_link.
+Links without a SKU fall back to a UUIDv5 of the normalized URL. "uuid7"
+mode keeps the old random per-row IDs.
+
+Since a UUIDv5 carries no time, the first time each SKU was seen is kept in
+PRODUCT_ID_INDEX_CSV (sku, product_id, first_seen).
+
+    python product_ids.py backfill old.csv new.csv    # rewrite uuid7 column to stable IDs
+"""
+
+import argparse
+import csv
+import logging
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from config import PRODUCT_ID_INDEX_CSV, PRODUCT_ID_MODE
+from utils import generate_uuid7, get_product_sku, normalize_product_url
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "https://www.cb2.com/")
+
+PRODUCT_ID_INDEX_HEADER = ["sku", "product_id", "first_seen"]
+
+
+def stable_product_id(sku: str) -> str:
+    """UUIDv5 of a SKU. Never changes for a given SKU."""
+    return str(uuid.uuid5(PRODUCT_ID_NAMESPACE, f"sku:{sku}"))
+
+
+def product_id(product_link: str, mode: str = PRODUCT_ID_MODE) -> str:
+    """ID for the uuid7 column of a product row."""
+    if mode != "stable":
+        return generate_uuid7()
+    sku = get_product_sku(product_link)
+    if sku:
+        return stable_product_id(sku)
+    return str(uuid.uuid5(PRODUCT_ID_NAMESPACE, f"url:{normalize_product_url(product_link)}"))
+
+
+class ProductIdIndex:
+    """SKU -> first-seen timestamp, persisted as CSV."""
+
+    def __init__(self, csv_path=PRODUCT_ID_INDEX_CSV) -> None:
+        self.path = Path(csv_path)
+        self._first_seen: dict[str, str] = {}
+        self._dirty = False
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    self._first_seen[row["sku"]] = row["first_seen"]
+
+    def __contains__(self, sku: str) -> bool:
+        return sku in self._first_seen
+
+    def __len__(self) -> int:
+        return len(self._first_seen)
+
+    def first_seen(self, sku: str) -> Optional[str]:
+        return self._first_seen.get(sku)
+
+    def see(self, sku: str, when: Optional[datetime] = None) -> bool:
+        """Record sku as seen. Returns True if it was never seen before."""
+        if not sku or sku in self._first_seen:
+            return False
+        self._first_seen[sku] = (when or datetime.now()).isoformat(timespec="seconds")
+        self._dirty = True
+        return True
+
+    def rows(self) -> list[dict]:
+        return [
+            {"sku": sku, "product_id": stable_product_id(sku), "first_seen": first_seen}
+            for sku, first_seen in sorted(self._first_seen.items())
+        ]
+
+    def save(self, writer=None) -> None:
+        """
+        Write the index (atomically) if anything was added since the last save.
+
+        With an async_writer.AsyncWriter, the write is queued on it instead of done here.
+        """
+        if not self._dirty:
+            return
+        self._dirty = False
+        if writer is not None:
+            writer.rewrite_csv(self.path, PRODUCT_ID_INDEX_HEADER, self.rows())
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            out = csv.DictWriter(f, fieldnames=PRODUCT_ID_INDEX_HEADER)
+            out.writeheader()
+            out.writerows(self.rows())
+        os.replace(tmp, self.path)
+
+
+def backfill(input_csv, output_csv, index: Optional[ProductIdIndex] = None) -> int:
+    """Rewrite the uuid7 column of a products CSV to stable IDs. Returns the number of rows."""
+    count = 0
+    with open(input_csv, "r", encoding="utf-8") as fin, open(output_csv, "w", encoding="utf-8", newline="") as fout:
+        reader = csv.DictReader(fin)
+        writer = csv.DictWriter(fout, fieldnames=reader.fieldnames)
+        writer.writeheader()
+        for row in reader:
+            link = row.get("product_link", "")
+            row["uuid7"] = product_id(link, mode="stable")
+            if index is not None:
+                index.see(get_product_sku(link))
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+    parser = argparse.ArgumentParser(description="Stable product IDs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    fill = sub.add_parser("backfill", help="Rewrite the uuid7 column of a CSV to stable IDs")
+    fill.add_argument("input")
+    fill.add_argument("output")
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        index = ProductIdIndex()
+        rows = backfill(args.input, args.output, index)
+        index.save()
+        logger.info("Backfilled %d rows -> %s (%d SKUs in index)", rows, args.output, len(index))
+
+
+if __name__ == "__main__":
+    main()
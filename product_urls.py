@@ -0,0 +1,71 @@
+"""
+Canonical product URLs and SKUs.
+
+One set of rules for every place that compares or keys product links:
+absolute BASE_URL (https://www.cb2.com) URL, no query string, fragment or trailing
+slash; the SKU is the /s123456 path segment. Patterns are compiled once and
+results are memoized, since the same links are seen many times per run
+(every listing page, pagination merge, dedup check and CSV row).
+"""
+
+import re
+from functools import lru_cache
+
+from config import BASE_URL
+
+# Site-relative and www.cb2.com links resolve against BASE_URL (the mock server when CB2_BASE_URL is set)
+BASE = BASE_URL
+
+_HOST_RE = re.compile(r"^(?:https?:)?//(?:www\.)?cb2\.com(?=/|$)", re.IGNORECASE)
+_SKU_RE = re.compile(r"/s(\d{5,6})")
+
+URL_CACHE_SIZE = 1 << 17
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def canonical_url(url: str) -> str:
+    """Absolute product URL without query, fragment or trailing slash. '' for an empty link."""
+    u = url.strip()
+    if "?" in u:
+        u = u[:u.index("?")]
+    if "#" in u:
+        u = u[:u.index("#")]
+    u = u.rstrip("/")
+    if not u:
+        return ""
+    # Listing hrefs are nearly always site-relative or already canonical
+    if u[0] == "/" and u[:2] != "//":
+        return BASE + u
+    if u.startswith(BASE) and u[len(BASE):len(BASE) + 1] in ("", "/"):
+        return u
+    u = _HOST_RE.sub(BASE, u, count=1)
+    if u.startswith("/"):
+        return BASE + u
+    if not u.startswith("http"):
+        return BASE + "/" + u
+    return u
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def product_sku(url: str) -> str:
+    """SKU from a product URL ('/s123456'), or '' if it has none."""
+    match = _SKU_RE.search(url)
+    return match.group(1) if match else ""
+
+
+def dedup_key(url: str) -> str:
+    """The SKU when there is one, else the lower-cased canonical URL."""
+    return product_sku(url) or canonical_url(url).lower()
+
+
+def canonicalize_batch(urls: list[str]) -> list[tuple[str, str]]:
+    """(canonical_url, sku) for each link of an extracted listing, in order."""
+    out = []
+    seen: dict[str, tuple[str, str]] = {}
+    for url in urls:
+        pair = seen.get(url)
+        if pair is None:
+            canonical = canonical_url(url or "")
+            pair = seen[url] = (canonical, product_sku(canonical))
+        out.append(pair)
+    return out
@@ -3,10 +3,10 @@ CB2 Scraper - Full subcategory scraping.
 Scrapes all subcategories to properly categorize products.
 """
 
+import argparse
 import asyncio
 import logging
 import re
-import json
 from datetime import datetime
 from pathlib import Path
 from urllib.parse import urljoin
@@ -15,25 +15,32 @@ import nodriver as uc
 
 from config import (
     BASE_URL,
-    HEADLESS,
-    PAGE_LOAD_WAIT,
     OUTPUT_CSV,
     PROGRESS_JSON,
     CHROME_USER_DATA_DIR,
     BATCH_SAVE_EVERY,
-    WINDOW_WIDTH,
-    WINDOW_HEIGHT,
+    DEDUP_BACKEND,
+    DEDUP_PATH,
 )
 from utils import (
     load_progress,
-    save_progress,
-    is_url_scraped,
+    progress_data,
     normalize_product_url,
-    append_products_to_csv,
+    clean_csv_row,
+    CSV_HEADER,
     ensure_csv_header,
-    generate_uuid7,
+    get_product_sku,
     sanitize_text,
 )
+from async_writer import AsyncWriter
+from browser_profiles import ResourceMeter, add_profile_argument, start_browser
+from memory_governor import MemoryGovernor
+from checkpoint import read_output_rows
+from dedup import open_dedup
+from listing import fetch_listing
+from product_ids import ProductIdIndex, product_id
+from product_urls import canonicalize_batch
+from taxonomy import get_taxonomy, mark_empty_url
 
 logging.basicConfig(
     level=logging.INFO,
@@ -192,70 +199,49 @@ EXTRACT_JS = """
 """
 
 
-async def scroll_page(page, times: int = 20) -> None:
-    """Scroll to load products."""
-    for _ in range(times):
-        try:
-            await page.evaluate("window.scrollBy(0, 800)")
-        except Exception:
-            pass
-        await asyncio.sleep(0.5)
-
-
-async def extract_products_js(page, category: str, subcategory: str, scraped_urls: set) -> list[dict]:
-    """Extract products using JavaScript."""
+def build_products(items: list[dict], category: str, subcategory: str, scraped_urls: set) -> list[dict]:
+    """Convert extracted listing items to CSV product rows, skipping already-scraped URLs."""
     products = []
+    links = canonicalize_batch([item.get("url", "") for item in items])
     
-    try:
-        result = await page.evaluate(EXTRACT_JS)
-        
-        if result:
-            items = json.loads(result)
+    for item, (url, _) in zip(items, links):
+        if not url:
+            continue
             
-            for item in items:
-                url = normalize_product_url(item.get("url", ""))
-                if not url:
-                    continue
-                    
-                if is_url_scraped(url, scraped_urls):
-                    continue
-                
-                name = sanitize_text(item.get("name", "")) or "Unknown"
-                
-                products.append({
-                    "uuid7": generate_uuid7(),
-                    "name": name,
-                    "images": item.get("image", ""),
-                    "price": item.get("price", ""),
-                    "product_link": url,
-                    "platform": "CB2",
-                    "category": category,
-                    "sub_category": subcategory,
-                })
-                
-    except Exception as e:
-        logger.error("JS extraction error: %s", e)
+        if url in scraped_urls:
+            continue
+        
+        name = sanitize_text(item.get("name", "")) or "Unknown"
+        
+        products.append({
+            "uuid7": product_id(url),
+            "name": name,
+            "images": item.get("image", ""),
+            "price": item.get("price", ""),
+            "product_link": url,
+            "platform": "CB2",
+            "category": category,
+            "sub_category": subcategory,
+        })
     
     return products
 
 
-async def scrape_subcategory(browser, url: str, category: str, subcategory: str, scraped_urls: set) -> list[dict]:
-    """Scrape a subcategory page."""
+async def scrape_subcategory(browser, url: str, category: str, subcategory: str, scraped_urls: set, meter=None) -> list[dict]:
+    """Scrape a subcategory page (all of its result pages, when paginated)."""
     products = []
     full_url = BASE_URL.rstrip('/') + url
     
     try:
         logger.info("  Loading: %s", url)
-        page = await browser.get(full_url)
-        await asyncio.sleep(PAGE_LOAD_WAIT + 1)
-        
-        # Scroll to load products
-        await scroll_page(page, 25)
-        await asyncio.sleep(1)
+        listing = await fetch_listing(browser, full_url, EXTRACT_JS)
+        if meter is not None:
+            meter.page_done(listing.pages)
+        if listing.confirmed_empty:
+            mark_empty_url(url)
         
-        # Extract using JS
-        products = await extract_products_js(page, category, subcategory, scraped_urls)
-        logger.info("    Found %d products", len(products))
+        products = build_products(listing.items, category, subcategory, scraped_urls)
+        logger.info("    Found %d products (%d on site, %d page(s))", len(products), listing.expected, listing.pages)
         
     except Exception as e:
         logger.error("Error scraping %s: %s", subcategory, e)
@@ -263,38 +249,82 @@ async def scrape_subcategory(browser, url: str, category: str, subcategory: str,
     return products
 
 
-async def main() -> None:
-    """Main entry."""
+def open_seen_urls(progress: dict):
+    """Open the dedup backend, seeding it once from a progress file that still lists scraped_urls."""
+    seen = open_dedup(DEDUP_BACKEND, DEDUP_PATH)
+    legacy = progress.get("scraped_urls", [])
+    if legacy and not len(seen):
+        for u in legacy:
+            seen.add(normalize_product_url(u))
+        seen.flush()
+        logger.info("Moved %d scraped URLs from %s into %s (%s)", len(legacy), PROGRESS_JSON, DEDUP_PATH, DEDUP_BACKEND)
+    return seen
+
+
+def reconcile_output(progress: dict, seen) -> int:
+    """
+    Catch the checkpoint up with rows already in OUTPUT_CSV: rows written after it
+    (a crash between the CSV flush and the checkpoint) are marked seen so they are
+    not scraped again. Returns the product count to resume from.
+    """
+    offset = progress.get("output_bytes", 0)
+    rows = read_output_rows(OUTPUT_CSV, offset) if Path(OUTPUT_CSV).exists() else []
+    recovered = sum(seen.add(normalize_product_url(r.get("product_link", ""))) for r in rows if r.get("product_link"))
+    if recovered:
+        seen.flush()
+        logger.info("Recovered %d products written after the last checkpoint", recovered)
+    if not offset:
+        # No byte offset (older checkpoint or none): the file itself is the count
+        return max(progress.get("product_count", 0), len(rows))
+    return progress.get("product_count", 0) + len(rows)
+
+
+async def main(profile=None) -> None:
+    """Main entry. profile: execution profile name (default EXECUTION_PROFILE)."""
     progress = load_progress(PROGRESS_JSON)
-    scraped_list: list[str] = progress.get("scraped_urls", [])
-    scraped_set = {normalize_product_url(u) for u in scraped_list}
-    product_count = progress.get("product_count", 0)
+    seen = open_seen_urls(progress)
+    pending = set()  # URLs not yet written; added to seen once their rows are on disk
+    product_count = reconcile_output(progress, seen)
     
     ensure_csv_header(OUTPUT_CSV)
+    product_ids = ProductIdIndex()
+    writer = AsyncWriter()
+    writer.start()
     browser = None
+    meter = governor = None
+    
+    def save_batch(batch: list[dict]) -> None:
+        # Queued on the writer task; URLs are marked seen only after their rows are written
+        urls = [p["product_link"] for p in batch]
+        
+        def mark_seen() -> None:
+            for u in urls:
+                seen.add(u)
+                pending.discard(u)
+        
+        writer.append_rows(OUTPUT_CSV, CSV_HEADER, [clean_csv_row(p) for p in batch], after=mark_seen)
+        writer.submit(seen.flush)
+        writer.checkpoint(PROGRESS_JSON, progress_data([], product_count), output=OUTPUT_CSV)
+        product_ids.save(writer)
     
     try:
         # Start browser with Chrome profile
         logger.info("Starting browser...")
-        start_kw = {"headless": HEADLESS}
         if CHROME_USER_DATA_DIR:
-            start_kw["user_data_dir"] = CHROME_USER_DATA_DIR
             logger.info("Using profile: %s", CHROME_USER_DATA_DIR)
         
-        browser = await uc.start(**start_kw)
-        logger.info("Browser started.")
+        browser = await start_browser(profile, CHROME_USER_DATA_DIR)
+        meter = ResourceMeter(profile, browser)
+        governor = MemoryGovernor(profile, meter, CHROME_USER_DATA_DIR)
         
-        try:
-            await browser.set_window_size(WINDOW_WIDTH, WINDOW_HEIGHT)
-        except Exception:
-            pass
+        categories = await get_taxonomy(browser, BASE_URL, fallback=CATEGORIES)
         
         # Process all categories and subcategories
         batch = []
-        total_subcats = sum(len(subs) for subs in CATEGORIES.values())
+        total_subcats = sum(len(subs) for subs in categories.values())
         processed = 0
         
-        for category, subcategories in CATEGORIES.items():
+        for category, subcategories in categories.items():
             logger.info("=" * 60)
             logger.info("CATEGORY: %s (%d subcategories)", category, len(subcategories))
             logger.info("=" * 60)
@@ -305,14 +335,15 @@ async def main() -> None:
                 processed += 1
                 logger.info("[%d/%d] %s > %s", processed, total_subcats, category, subcategory)
                 
-                products = await scrape_subcategory(browser, url_path, category, subcategory, scraped_set)
+                products = await scrape_subcategory(browser, url_path, category, subcategory, seen, meter)
+                browser = await governor.after_page(browser)
                 
                 new_count = 0
                 for p in products:
-                    p_url = normalize_product_url(p["product_link"])
-                    if p_url not in scraped_set:
-                        scraped_set.add(p_url)
-                        scraped_list.append(p["product_link"])
+                    p_url = p["product_link"]
+                    if p_url not in pending:
+                        pending.add(p_url)
+                        product_ids.see(get_product_sku(p_url))
                         product_count += 1
                         new_count += 1
                         category_count += 1
@@ -322,8 +353,7 @@ async def main() -> None:
                 
                 # Save batch periodically
                 if len(batch) >= BATCH_SAVE_EVERY:
-                    append_products_to_csv(OUTPUT_CSV, batch)
-                    save_progress(PROGRESS_JSON, scraped_list, product_count)
+                    save_batch(batch)
                     logger.info("    [Saved batch of %d products]", len(batch))
                     batch = []
                 
@@ -333,9 +363,7 @@ async def main() -> None:
             logger.info("Category %s complete: %d products", category, category_count)
         
         # Final save
-        if batch:
-            append_products_to_csv(OUTPUT_CSV, batch)
-        save_progress(PROGRESS_JSON, scraped_list, product_count)
+        save_batch(batch)
         
         logger.info("=" * 60)
         logger.info("SCRAPING COMPLETE!")
@@ -345,6 +373,12 @@ async def main() -> None:
     except Exception as e:
         logger.exception("Scraper failed: %s", e)
     finally:
+        await writer.close()
+        seen.close()
+        if meter:
+            meter.log()
+        if governor:
+            governor.close()
         if browser:
             try:
                 browser.stop()
@@ -353,4 +387,7 @@ async def main() -> None:
 
 
 if __name__ == "__main__":
-    uc.loop().run_until_complete(main())
+    parser = argparse.ArgumentParser(description="Scrape every CB2 subcategory listing.")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    uc.loop().run_until_complete(main(args.profile))
@@ -0,0 +1,551 @@
+"""
+Soak tests: the crawl pipelines over thousands of pages against the mock site.
+
+    python soak.py crawl --pages 10000                  # full_scraper-style: listings, then each new SKU's PDP
+    python soak.py enrich --pages 10000                 # add_product_details-style: PDP pass over a products CSV
+    python soak.py all --pages 2000 --fetch http        # both, without a browser
+    python soak.py enrich --base-url http://127.0.0.1:8765   # against a running mock_server.py
+
+Unless --base-url is given, a mock_server.MockServer is started in-process on a
+free port. Pages are loaded with the scrapers' own code (--fetch browser:
+listing.fetch_listing, the get_product_details of full_scraper and
+add_product_details, the memory governor) or with plain HTTP and regex
+extraction (--fetch http), which leaves the Python side alone: SKU dedup,
+image index, pending-work index, AsyncWriter appends, CSV rewrites and
+checkpoints, at the scripts' own save cadence. Politeness delays between pages
+are not applied; the waits inside a page load are.
+
+Every SOAK_SAMPLE_EVERY pages a row is appended to soak_<stage>.csv in the
+run's directory under SOAK_DIR: pages/min over the window, Python and browser
+RSS, open file descriptors, and the newest checkpoint's size and times (spent
+queueing on the event loop, and until it was on disk). The run fails (exit
+status 1) when, after SOAK_WARMUP_PAGES:
+
+    throughput of the last windows is more than max_throughput_decay below the first
+    Python RSS or open descriptors grew by more than max_rss_growth_mb / max_fd_growth
+    a checkpoint took longer than max_checkpoint_ms to reach disk
+    more than max_error_rate of the pages yielded no data
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import re
+import statistics
+import sys
+import time
+import urllib.error
+import urllib.request
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from html import unescape
+from itertools import count
+from pathlib import Path
+from typing import Callable, Optional
+from urllib.parse import urljoin
+
+import nodriver as uc
+
+import add_product_details
+import full_scraper
+from async_writer import AsyncWriter
+from browser_profiles import ResourceMeter, add_profile_argument, process_tree_usage, start_browser
+from checkpoint import output_size
+from config import (
+    MAX_RETRIES,
+    MOCK_SEED,
+    SOAK_DIR,
+    SOAK_MAX_CHECKPOINT_MS,
+    SOAK_MAX_ERROR_RATE,
+    SOAK_MAX_FD_GROWTH,
+    SOAK_MAX_RSS_GROWTH_MB,
+    SOAK_MAX_THROUGHPUT_DECAY,
+    SOAK_SAMPLE_EVERY,
+    SOAK_WARMUP_PAGES,
+)
+from csv_writer import BufferedCsvWriter
+from image_urls import ImageIndex, dedupe_image_urls
+from listing import fetch_listing
+from membership import MembershipIndex
+from memory_governor import MemoryGovernor
+from mock_server import MockBehavior, MockCatalog, MockServer, MockSite
+from pending_work import PendingWork, row_key
+from product_ids import product_id
+from product_urls import canonicalize_batch
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+# Progress saves as often as the scripts do them
+CRAWL_SAVE_EVERY = 100      # full_scraper: every 100 products
+ENRICH_SAVE_EVERY = 5       # add_product_details: every 5 products with data (CSV rewrite + checkpoint)
+
+SOAK_HEADER = [
+    "time", "stage", "pages", "errors", "elapsed_s", "pages_per_min", "python_rss_mb", "browser_rss_mb",
+    "open_fds", "checkpoint_kb", "checkpoint_queue_ms", "checkpoint_write_ms",
+]
+
+ENRICH_INPUT_HEADER = ["uuid7", "name", "price", "product_link", "category", "sub_category"]
+
+
+@dataclass
+class SoakThresholds:
+    max_throughput_decay: float = SOAK_MAX_THROUGHPUT_DECAY
+    max_rss_growth_mb: float = SOAK_MAX_RSS_GROWTH_MB
+    max_fd_growth: int = SOAK_MAX_FD_GROWTH
+    max_checkpoint_ms: float = SOAK_MAX_CHECKPOINT_MS
+    max_error_rate: float = SOAK_MAX_ERROR_RATE
+
+
+def python_rss() -> int:
+    """RSS of this process in bytes (without the browser it started)."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    usage = process_tree_usage(os.getpid()).get(os.getpid())
+    return usage[1] if usage else 0
+
+
+def open_fds() -> int:
+    """Open file descriptors (handles on Windows) of this process; 0 if unknown."""
+    if psutil is not None:
+        proc = psutil.Process()
+        return proc.num_fds() if hasattr(proc, "num_fds") else proc.num_handles()
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return 0
+
+
+# ==================== RECORDING ====================
+
+class SoakRecorder:
+    """Counts pages and writes a resource sample every sample_every pages."""
+
+    def __init__(self, stage: str, path, sample_every: int = SOAK_SAMPLE_EVERY,
+                 meter: Optional[ResourceMeter] = None) -> None:
+        self.stage = stage
+        self.sample_every = max(1, sample_every)
+        self.meter = meter
+        self.pages = 0
+        self.errors = 0
+        self.samples: list[dict] = []
+        self.checkpoint = {"checkpoint_kb": 0.0, "checkpoint_queue_ms": 0.0, "checkpoint_write_ms": 0.0}
+        self.worst_checkpoint_ms = 0.0
+        self._t0 = time.perf_counter()
+        self._window = (self._t0, 0)
+        self._next_sample = self.sample_every
+        self._log = BufferedCsvWriter(path, SOAK_HEADER)
+        self._log.open()
+
+    def page_done(self, ok: bool = True, pages: int = 1) -> None:
+        self.pages += pages
+        if not ok:
+            self.errors += pages
+        if self.pages >= self._next_sample:
+            self._next_sample = self.pages + self.sample_every
+            self.sample()
+
+    def checkpoint_done(self, size: int, queue_s: float, write_s: float) -> None:
+        self.checkpoint = {
+            "checkpoint_kb": round(size / 1024, 1),
+            "checkpoint_queue_ms": round(queue_s * 1000, 1),
+            "checkpoint_write_ms": round(write_s * 1000, 1),
+        }
+        self.worst_checkpoint_ms = max(self.worst_checkpoint_ms, write_s * 1000)
+
+    def sample(self) -> dict:
+        now = time.perf_counter()
+        started, pages_then = self._window
+        self._window = (now, self.pages)
+        row = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "stage": self.stage,
+            "pages": self.pages,
+            "errors": self.errors,
+            "elapsed_s": round(now - self._t0, 1),
+            "pages_per_min": round((self.pages - pages_then) / max(now - started, 1e-9) * 60, 1),
+            "python_rss_mb": round(python_rss() / 2**20, 1),
+            "browser_rss_mb": round(self.meter.sample() / 2**20, 1) if self.meter else 0.0,
+            "open_fds": open_fds(),
+            **self.checkpoint,
+        }
+        self.samples.append(row)
+        self._log.writerow(row)
+        logger.info("Soak %s: %d pages, %.0f pages/min, RSS %.0f MB (browser %.0f MB), %d fds, checkpoint %.0f KB in %.0f ms",
+                    self.stage, row["pages"], row["pages_per_min"], row["python_rss_mb"], row["browser_rss_mb"],
+                    row["open_fds"], row["checkpoint_kb"], row["checkpoint_write_ms"])
+        return row
+
+    def close(self) -> None:
+        if self.pages and (not self.samples or self.samples[-1]["pages"] != self.pages):
+            self.sample()
+        self._log.close()
+
+
+def evaluate(recorder: SoakRecorder, thresholds: SoakThresholds, warmup: int = SOAK_WARMUP_PAGES) -> list[str]:
+    """Threshold violations of a finished stage (empty when it passed)."""
+    failures = []
+    after = [s for s in recorder.samples if s["pages"] > warmup]
+    if len(after) >= 2:
+        # Compare the average of a few windows at each end, not single noisy ones
+        n = max(1, min(3, len(after) // 2))
+        baseline = statistics.mean(s["pages_per_min"] for s in after[:n])
+        final = statistics.mean(s["pages_per_min"] for s in after[-n:])
+        if baseline and (baseline - final) / baseline > thresholds.max_throughput_decay:
+            failures.append(f"throughput fell {(baseline - final) / baseline:.0%} "
+                            f"({baseline:.0f} -> {final:.0f} pages/min)")
+        rss_growth = after[-1]["python_rss_mb"] - after[0]["python_rss_mb"]
+        if rss_growth > thresholds.max_rss_growth_mb:
+            failures.append(f"Python RSS grew {rss_growth:.0f} MB after warmup "
+                            f"({after[0]['python_rss_mb']:.0f} -> {after[-1]['python_rss_mb']:.0f} MB)")
+        fd_growth = after[-1]["open_fds"] - after[0]["open_fds"]
+        if fd_growth > thresholds.max_fd_growth:
+            failures.append(f"open file descriptors grew by {fd_growth} "
+                            f"({after[0]['open_fds']} -> {after[-1]['open_fds']})")
+    else:
+        logger.warning("%s: only %d samples after %d warmup pages - throughput, RSS and fd trends not checked",
+                       recorder.stage, len(after), warmup)
+    if recorder.worst_checkpoint_ms > thresholds.max_checkpoint_ms:
+        failures.append(f"slowest checkpoint took {recorder.worst_checkpoint_ms:.0f} ms")
+    error_rate = recorder.errors / max(recorder.pages, 1)
+    if error_rate > thresholds.max_error_rate:
+        failures.append(f"{error_rate:.1%} of pages yielded no data ({recorder.errors} of {recorder.pages})")
+    return failures
+
+
+async def timed_save(writer: AsyncWriter, recorder: SoakRecorder, checkpoint_path: Path, save: Callable[[], None]) -> None:
+    """Run save() (which queues writes on writer), wait until they are on disk, and record both times."""
+    t0 = time.perf_counter()
+    save()
+    queued = time.perf_counter() - t0
+    await writer.flush()
+    recorder.checkpoint_done(output_size(checkpoint_path), queued, time.perf_counter() - t0)
+
+
+# ==================== PAGE LOADING ====================
+
+_LINK_RE = re.compile(r'href=\\?"(/[^"\\]+/s\d{5,6})\\?"')
+_IMAGE_RE = re.compile(r'(?:src|srcset)=\\?"([^"\\]*cb2\.scene7\.com[^"\\]*)')
+_DIMENSIONS_RE = re.compile(r"Overall Dimensions:\s*([^<]+)")
+_SKU_RE = re.compile(r"SKU:\s*([A-Z0-9-]+)", re.IGNORECASE)
+_DESCRIPTION_RE = re.compile(r'class="product-description">([^<]+)')
+_DETAILS_RE = re.compile(r'class="product-details">(.*?)</div>', re.S)
+_COLOR_RE = re.compile(r'data-color="([^"]+)"')
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def _first(regex: re.Pattern, html: str) -> str:
+    match = regex.search(html)
+    return match.group(1).strip() if match else ""
+
+
+class HttpFetcher:
+    """Plain HTTP GETs with regex extraction of the mock's markup; no browser."""
+
+    meter = None
+
+    def __init__(self) -> None:
+        self.denied = 0
+
+    async def start(self) -> None:
+        pass
+
+    async def _get(self, url: str) -> str:
+        for _ in range(MAX_RETRIES):
+            try:
+                return await asyncio.to_thread(self._read, url)
+            except urllib.error.HTTPError as e:
+                if e.code != 403:
+                    return ""
+                self.denied += 1
+            except OSError as e:
+                logger.debug("GET %s failed: %s", url, e)
+                return ""
+        return ""
+
+    @staticmethod
+    def _read(url: str) -> str:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            return response.read().decode("utf-8", errors="replace")
+
+    async def listing(self, url: str) -> tuple[list[dict], int]:
+        html = await self._get(url)
+        # Lazy-loaded cards are in the page's script, so one GET sees the whole listing
+        links = dict.fromkeys(_LINK_RE.findall(html))
+        return [{"url": urljoin(url, link), "name": "", "image": "", "price": ""} for link in links], 1
+
+    async def product(self, url: str) -> dict:
+        """Same keys as add_product_details.get_product_details."""
+        html = await self._get(url)
+        details = _DETAILS_RE.search(html)
+        return {
+            "dimensions": unescape(_first(_DIMENSIONS_RE, html)),
+            "all_images": dedupe_image_urls(urljoin(url, src) for src in _IMAGE_RE.findall(html)),
+            "sku": _first(_SKU_RE, html),
+            "description": unescape(_first(_DESCRIPTION_RE, html)),
+            "colors": list(dict.fromkeys(_COLOR_RE.findall(html))),
+            "details": unescape(" ".join(_TAG_RE.sub(" ", details.group(1)).split())) if details else "",
+            "loaded": bool(html),
+        }
+
+    async def crawl_details(self, url: str) -> tuple[str, list[str]]:
+        details = await self.product(url)
+        return details["dimensions"], details["all_images"]
+
+    async def enrich_details(self, url: str) -> dict:
+        return await self.product(url)
+
+    async def close(self) -> None:
+        if self.denied:
+            logger.info("HTTP fetcher: %d Access Denied responses retried", self.denied)
+
+
+class BrowserFetcher:
+    """The scrapers' own page loading and extraction, with the memory governor."""
+
+    def __init__(self, profile=None, memory_log: Optional[Path] = None) -> None:
+        self.profile = profile
+        self.memory_log = memory_log
+        self.browser = None
+        self.meter: Optional[ResourceMeter] = None
+        self.governor: Optional[MemoryGovernor] = None
+
+    async def start(self) -> None:
+        self.browser = await start_browser(self.profile)
+        self.meter = ResourceMeter(self.profile, self.browser)
+        self.governor = MemoryGovernor(self.profile, self.meter, log_path=self.memory_log)
+
+    async def _done(self, pages: int = 1) -> None:
+        self.meter.page_done(pages)
+        self.browser = await self.governor.after_page(self.browser)
+
+    async def listing(self, url: str) -> tuple[list[dict], int]:
+        result = await fetch_listing(self.browser, url, full_scraper.EXTRACT_LISTING_JS)
+        await self._done(result.pages)
+        return result.items, result.pages
+
+    async def crawl_details(self, url: str) -> tuple[str, list[str]]:
+        dimensions, images = await full_scraper.get_product_details(self.browser, url)
+        await self._done()
+        return dimensions, images
+
+    async def enrich_details(self, url: str) -> dict:
+        details = await add_product_details.get_product_details(self.browser, url)
+        await self._done()
+        return details
+
+    async def close(self) -> None:
+        if self.governor is not None:
+            self.governor.close()
+        if self.meter is not None:
+            self.meter.log()
+        if self.browser is not None:
+            self.browser.stop()
+
+
+# ==================== PIPELINES ====================
+
+def listing_paths(catalog: MockCatalog):
+    """The catalog's listing paths, then as many synthetic ones as a long soak needs."""
+    yield from catalog.listing_paths()
+    for n in count(1):
+        yield f"/soak/listing-{n}/"
+
+
+async def run_crawl(fetcher, base_url: str, catalog: MockCatalog, pages: int, run_dir: Path, recorder: SoakRecorder) -> None:
+    """full_scraper-style: each listing, then the PDP of every SKU not listed before."""
+    output = run_dir / "crawl_products.csv"
+    progress_path = run_dir / "crawl_progress.json"
+    memberships = MembershipIndex()
+    image_index = ImageIndex()
+    scraped_skus, processed_skus = set(), set()
+    progress = {}
+    writer = AsyncWriter()
+    writer.start()
+
+    def save_all():
+        progress["scraped_skus"] = list(scraped_skus)
+        progress["processed_skus"] = list(processed_skus)
+        writer.checkpoint(progress_path, progress, output=output)
+
+    try:
+        for path in listing_paths(catalog):
+            if recorder.pages >= pages:
+                break
+            items, listing_pages = await fetcher.listing(base_url + path)
+            recorder.page_done(bool(items), listing_pages)
+            new = []
+            links = canonicalize_batch([item.get("url", "") for item in items])
+            for position, (item, (url, sku)) in enumerate(zip(items, links), 1):
+                if sku and memberships.add(sku, "Soak", path, position):
+                    new.append((url, sku, item))
+                    scraped_skus.add(sku)
+
+            for url, sku, item in new:
+                if recorder.pages >= pages:
+                    break
+                dimensions, images = await fetcher.crawl_details(url)
+                recorder.page_done(bool(dimensions or images))
+                writer.append_rows(output, full_scraper.OUTPUT_HEADER, [{
+                    "uuid7": product_id(url), "name": item.get("name", ""), "images": item.get("image", ""),
+                    "price": item.get("price", ""), "product_link": url, "platform": "CB2",
+                    "category": "Soak", "sub_category": path, "dimensions": dimensions,
+                    "all_images": "|".join(image_index.add(sku, images)[:10]),
+                }])
+                processed_skus.add(sku)
+                if len(processed_skus) % CRAWL_SAVE_EVERY == 0:
+                    await timed_save(writer, recorder, progress_path, save_all)
+        await timed_save(writer, recorder, progress_path, save_all)
+    finally:
+        await writer.close()
+
+
+def enrich_input(base_url: str, catalog: MockCatalog, size: int) -> list[dict]:
+    """Listing rows (no detail columns yet) for size distinct products of the catalog."""
+    rows, seen = [], set()
+    for path in listing_paths(catalog):
+        for sku in catalog.listing(path):
+            if sku in seen:
+                continue
+            seen.add(sku)
+            product = catalog.product(sku)
+            url = base_url + product["path"]
+            rows.append({"uuid7": product_id(url), "name": product["name"], "price": product["price"],
+                         "product_link": url, "category": "Soak", "sub_category": path,
+                         **{col: "" for col in add_product_details.DETAIL_COLUMNS}})
+            if len(rows) >= size:
+                return rows
+    return rows
+
+
+async def run_enrich(fetcher, base_url: str, catalog: MockCatalog, pages: int, run_dir: Path, recorder: SoakRecorder) -> None:
+    """add_product_details-style: every row missing detail columns, with whole-CSV rewrites."""
+    output = run_dir / "enrich_products.csv"
+    progress_path = run_dir / "enrich_progress.json"
+    fields = add_product_details.DETAIL_COLUMNS
+    fieldnames = ENRICH_INPUT_HEADER + fields
+    products = enrich_input(base_url, catalog, pages)
+    rows_by_key = {row_key(p): p for p in products}
+    pending = PendingWork.build(products, fields)
+    image_index = ImageIndex()
+    processed = set()
+    progress = {}
+    writer = AsyncWriter()
+    writer.start()
+
+    def save_all():
+        progress["processed"] = list(processed)
+        progress["pending"] = pending.to_progress()
+        writer.rewrite_csv(output, fieldnames, products)
+        writer.checkpoint(progress_path, progress)
+
+    try:
+        for key in pending.select():
+            if recorder.pages >= pages:
+                break
+            product = rows_by_key[key]
+            details = await fetcher.enrich_details(product["product_link"])
+            ok = add_product_details.merge_details(product, details, image_index)
+            recorder.page_done(ok)
+            if ok:
+                pending.update(key, product)
+                processed.add(product["product_link"])
+                if len(processed) % ENRICH_SAVE_EVERY == 0:
+                    await timed_save(writer, recorder, progress_path, save_all)
+            elif details.get("loaded"):
+                pending.mark_tried(key, fields)
+        await timed_save(writer, recorder, progress_path, save_all)
+    finally:
+        await writer.close()
+
+
+PIPELINES = {"crawl": run_crawl, "enrich": run_enrich}
+
+
+async def run_soak(stages: list[str], pages: int, run_dir: Path, fetch: str = "browser", profile=None,
+                   base_url: Optional[str] = None, behavior: Optional[MockBehavior] = None, seed: int = MOCK_SEED,
+                   thresholds: Optional[SoakThresholds] = None, sample_every: int = SOAK_SAMPLE_EVERY,
+                   warmup: int = SOAK_WARMUP_PAGES) -> list[str]:
+    """Run each stage for pages pages; returns the threshold violations of all of them."""
+    thresholds = thresholds or SoakThresholds()
+    run_dir.mkdir(parents=True, exist_ok=True)
+    catalog = MockCatalog(full_scraper.CATEGORIES, seed)
+    server = None
+    if not base_url:
+        server = MockServer(MockSite(catalog, behavior, fixtures_dir=None), port=0).start()
+        base_url = server.url
+    logger.info("Soak: %s for %d pages each via %s against %s -> %s", "+".join(stages), pages, fetch, base_url, run_dir)
+
+    failures = []
+    try:
+        for stage in stages:
+            if fetch == "http":
+                fetcher = HttpFetcher()
+            else:
+                fetcher = BrowserFetcher(profile, run_dir / f"memory_{stage}.csv")
+            await fetcher.start()
+            recorder = SoakRecorder(stage, run_dir / f"soak_{stage}.csv", sample_every, fetcher.meter)
+            try:
+                await PIPELINES[stage](fetcher, base_url, catalog, pages, run_dir, recorder)
+            finally:
+                recorder.close()
+                await fetcher.close()
+            stage_failures = evaluate(recorder, thresholds, warmup)
+            logger.info("Soak %s: %d pages, %d without data, %s", stage, recorder.pages, recorder.errors,
+                        "FAIL" if stage_failures else "pass")
+            failures += [f"{stage}: {failure}" for failure in stage_failures]
+    finally:
+        if server is not None:
+            server.stop()
+    return failures
+
+
+def main() -> None:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--pages", type=int, default=10_000, help="Page loads per stage")
+    common.add_argument("--fetch", choices=["browser", "http"], default="browser",
+                        help="Load pages with the scrapers' browser code, or with plain HTTP (no browser)")
+    common.add_argument("--base-url", help="A running mock_server.py (default: start one in-process)")
+    common.add_argument("--seed", type=int, default=MOCK_SEED)
+    common.add_argument("--sample-every", type=int, default=SOAK_SAMPLE_EVERY)
+    common.add_argument("--warmup", type=int, default=SOAK_WARMUP_PAGES)
+    add_profile_argument(common)
+    for name, value in [*asdict(MockBehavior()).items(), *asdict(SoakThresholds()).items()]:
+        common.add_argument("--" + name.replace("_", "-"), type=type(value), default=value)
+
+    parser = argparse.ArgumentParser(description="Soak tests of the crawl pipelines against the mock site.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in [("crawl", "full_scraper-style listings + PDPs"),
+                            ("enrich", "add_product_details-style PDP pass"),
+                            ("all", "crawl, then enrich")]:
+        sub.add_parser(name, parents=[common], help=help_text)
+
+    args = parser.parse_args()
+    stages = list(PIPELINES) if args.command == "all" else [args.command]
+    behavior = MockBehavior(**{name: getattr(args, name) for name in asdict(MockBehavior())})
+    thresholds = SoakThresholds(**{name: getattr(args, name) for name in asdict(SoakThresholds())})
+    run_dir = Path(SOAK_DIR) / f"{args.command}-{datetime.now():%Y%m%d-%H%M%S}"
+
+    failures = uc.loop().run_until_complete(run_soak(
+        stages, args.pages, run_dir, args.fetch, args.profile, args.base_url, behavior, args.seed,
+        thresholds, args.sample_every, args.warmup,
+    ))
+    for failure in failures:
+        logger.error("FAIL %s", failure)
+    if failures:
+        sys.exit(1)
+    logger.info("Soak passed (%s)", run_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Category taxonomy discovery from the CB2 navigation menu.
+
+Builds category -> group -> subcategory -> URL path by hovering each entry of
+MAIN_CATEGORY_NAMES and reading its flyout. The result is cached in
+TAXONOMY_CACHE_JSON and reused until TAXONOMY_TTL_HOURS have passed, so the
+nav is crawled at most once per TTL. Subcategory URLs that produced no
+products are recorded in the cache and skipped until the next rediscovery.
+"""
+
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+from config import (
+    MAIN_CATEGORY_NAMES,
+    NAV_HOVER_WAIT,
+    SELECTORS,
+    TAXONOMY_CACHE_JSON,
+    TAXONOMY_TTL_HOURS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Taxonomy shape: {category: {group: {subcategory: url_path}}}
+Taxonomy = dict[str, dict[str, dict[str, str]]]
+
+# Hover a top-level nav entry so its flyout renders. Formatted with %(name)s and %(nav)s.
+HOVER_NAV_JS = """
+(function() {
+    const name = %(name)s;
+    const navs = document.querySelectorAll(%(nav)s);
+    for (const nav of navs) {
+        for (const el of nav.querySelectorAll('a, button, span')) {
+            if ((el.textContent || '').trim().toUpperCase() !== name) continue;
+            ['mouseover', 'mouseenter', 'pointerover', 'focus'].forEach(type => {
+                el.dispatchEvent(new MouseEvent(type, {bubbles: true}));
+            });
+            return true;
+        }
+    }
+    return false;
+})();
+"""
+
+# Collect subcategory links under one top-level nav entry, with the heading
+# of the flyout column they sit in. Formatted with %(name)s and %(nav)s.
+EXTRACT_NAV_JS = """
+(function() {
+    const name = %(name)s;
+    const entries = [];
+    const seen = new Set();
+    const headingSel = 'h2, h3, h4, h5, strong, [class*="heading"], [class*="Heading"], [class*="title"]';
+
+    const clean = t => (t || '').replace(/\\s+/g, ' ').trim();
+
+    let root = null;
+    for (const nav of document.querySelectorAll(%(nav)s)) {
+        for (const el of nav.querySelectorAll('a, button, span')) {
+            if (clean(el.textContent).toUpperCase() !== name) continue;
+            root = el.closest('li') || el.parentElement;
+            break;
+        }
+        if (root) break;
+    }
+    if (!root) return JSON.stringify(entries);
+
+    root.querySelectorAll('a[href]').forEach(a => {
+        const url = new URL(a.href, location.href);
+        if (url.host !== location.host) return;
+        const path = url.pathname;
+        // Subcategory listings are /<category>/<subcategory>/; skip product pages
+        if (/\\/s\\d{5,6}(?:\\/|$)/.test(path)) return;
+        if (path === '/') return;
+        const label = clean(a.textContent);
+        if (!label || label.length > 60 || label.toUpperCase() === name) return;
+        if (seen.has(path)) return;
+        seen.add(path);
+
+        // Group heading: nearest heading in the enclosing list's column
+        let group = '';
+        let col = a.closest('ul');
+        for (let i = 0; i < 3 && col && !group; i++) {
+            let prev = col.previousElementSibling;
+            while (prev && !group) {
+                const h = prev.matches(headingSel) ? prev : prev.querySelector(headingSel);
+                if (h) group = clean(h.textContent);
+                prev = prev.previousElementSibling;
+            }
+            col = col.parentElement;
+        }
+        entries.push({group: group.toUpperCase(), subcategory: label, url: path.endsWith('/') ? path : path + '/'});
+    });
+    return JSON.stringify(entries);
+})();
+"""
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _category_display_name(nav_name: str) -> str:
+    """Nav shows 'BEDDING & BATH'; the CSVs use 'Bedding & Bath'."""
+    return nav_name.title()
+
+
+def to_categories(taxonomy: Taxonomy, skip_urls: Optional[set[str]] = None) -> dict[str, dict[str, str]]:
+    """Flatten a taxonomy to the {category: {subcategory: url}} shape the scrapers iterate."""
+    skip_urls = skip_urls or set()
+    categories: dict[str, dict[str, str]] = {}
+    for category, groups in taxonomy.items():
+        for subcategories in groups.values():
+            for subcategory, url in subcategories.items():
+                if url in skip_urls:
+                    continue
+                categories.setdefault(category, {})[subcategory] = url
+    return categories
+
+
+def to_subcategory_groups(taxonomy: Taxonomy) -> dict[str, str]:
+    """Map subcategory -> group, for add_category_groups."""
+    return {
+        subcategory: group
+        for groups in taxonomy.values()
+        for group, subcategories in groups.items()
+        for subcategory in subcategories
+    }
+
+
+def load_taxonomy_cache(cache_path: str = TAXONOMY_CACHE_JSON) -> Optional[dict[str, Any]]:
+    """Load the raw cache dict, or None if missing/unreadable."""
+    path = Path(cache_path)
+    if not path.exists():
+        return None
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (json.JSONDecodeError, IOError):
+        return None
+    if not isinstance(data, dict) or not data.get("categories"):
+        return None
+    data.setdefault("empty_urls", [])
+    return data
+
+
+def is_cache_fresh(cache: dict[str, Any], ttl_hours: float = TAXONOMY_TTL_HOURS) -> bool:
+    """True if the cache was discovered within ttl_hours."""
+    try:
+        discovered = datetime.fromisoformat(cache["discovered_at"].rstrip("Z"))
+    except (KeyError, ValueError, AttributeError):
+        return False
+    if discovered.tzinfo is None:
+        discovered = discovered.replace(tzinfo=timezone.utc)
+    return _now() - discovered < timedelta(hours=ttl_hours)
+
+
+def save_taxonomy_cache(taxonomy: Taxonomy, cache_path: str = TAXONOMY_CACHE_JSON, empty_urls: Optional[list[str]] = None) -> None:
+    """Write taxonomy to the cache file with a fresh discovered_at stamp."""
+    path = Path(cache_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {
+        "discovered_at": _now().replace(tzinfo=None).isoformat() + "Z",
+        "categories": taxonomy,
+        "empty_urls": sorted(set(empty_urls or [])),
+    }
+    path.write_text(json.dumps(data, indent=2), encoding="utf-8")
+
+
+def mark_empty_url(url_path: str, cache_path: str = TAXONOMY_CACHE_JSON) -> None:
+    """Record that a subcategory URL returned no products so later runs skip it until rediscovery."""
+    cache = load_taxonomy_cache(cache_path)
+    if cache is None or url_path in cache["empty_urls"]:
+        return
+    cache["empty_urls"].append(url_path)
+    Path(cache_path).write_text(json.dumps(cache, indent=2), encoding="utf-8")
+
+
+async def discover_taxonomy(browser, base_url: str) -> Taxonomy:
+    """Crawl the nav menu once and return the discovered taxonomy (may be empty)."""
+    taxonomy: Taxonomy = {}
+    page = await browser.get(base_url.rstrip("/") + "/")
+    await asyncio.sleep(NAV_HOVER_WAIT * 2)
+
+    for nav_name in MAIN_CATEGORY_NAMES:
+        params = {"name": json.dumps(nav_name.upper()), "nav": json.dumps(SELECTORS.nav_menu)}
+        try:
+            hovered = await page.evaluate(HOVER_NAV_JS % params)
+            if not hovered:
+                logger.warning("Nav entry not found: %s", nav_name)
+                continue
+            await asyncio.sleep(NAV_HOVER_WAIT)
+            result = await page.evaluate(EXTRACT_NAV_JS % params)
+            entries = json.loads(result) if result else []
+        except Exception as e:
+            logger.warning("Nav discovery failed for %s: %s", nav_name, e)
+            continue
+
+        category = _category_display_name(nav_name)
+        for entry in entries:
+            group = entry.get("group") or nav_name.upper()
+            taxonomy.setdefault(category, {}).setdefault(group, {})[entry["subcategory"]] = entry["url"]
+        logger.info("  Nav %s: %d subcategories", nav_name, len(entries))
+
+    return taxonomy
+
+
+async def get_taxonomy(
+    browser,
+    base_url: str,
+    fallback: dict[str, dict[str, str]],
+    cache_path: str = TAXONOMY_CACHE_JSON,
+    ttl_hours: float = TAXONOMY_TTL_HOURS,
+    refresh: bool = False,
+) -> dict[str, dict[str, str]]:
+    """
+    Return {category: {subcategory: url}} for the scrapers to iterate.
+
+    Uses the cache when fresh, otherwise rediscovers from the nav menu. If
+    discovery finds nothing, a stale cache is preferred over the hand-kept
+    fallback table.
+    """
+    cache = load_taxonomy_cache(cache_path)
+    if cache and not refresh and is_cache_fresh(cache, ttl_hours):
+        logger.info("Using cached taxonomy from %s (%s)", cache_path, cache["discovered_at"])
+        return to_categories(cache["categories"], set(cache["empty_urls"]))
+
+    logger.info("Discovering category taxonomy from navigation...")
+    taxonomy: Taxonomy = {}
+    try:
+        taxonomy = await discover_taxonomy(browser, base_url)
+    except Exception as e:
+        logger.warning("Taxonomy discovery failed: %s", e)
+
+    if taxonomy:
+        save_taxonomy_cache(taxonomy, cache_path)
+        total = sum(len(subs) for groups in taxonomy.values() for subs in groups.values())
+        logger.info("Discovered %d subcategories in %d categories", total, len(taxonomy))
+        return to_categories(taxonomy)
+
+    if cache:
+        logger.warning("Discovery found nothing - using stale taxonomy cache")
+        return to_categories(cache["categories"], set(cache["empty_urls"]))
+
+    logger.warning("Discovery found nothing - using built-in category table")
+    return fallback
@@ -3,12 +3,14 @@ Helper functions: UUID7 generation, CSV handling, progress tracking.
 """
 
 import csv
-import json
 import random
 import time
 from pathlib import Path
 from typing import Any
 
+from checkpoint import load_checkpoint, save_checkpoint
+from product_urls import canonical_url, product_sku
+
 try:
     import uuid6
     def generate_uuid7() -> str:
@@ -31,49 +33,45 @@ def random_delay(min_sec: float, max_sec: float) -> None:
 
 
 def load_progress(progress_path: str) -> dict[str, Any]:
-    """Load progress from JSON. Returns dict with scraped_urls, product_count, last_updated."""
-    path = Path(progress_path)
-    if not path.exists():
-        return {"scraped_urls": [], "product_count": 0, "last_updated": None}
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        data.setdefault("scraped_urls", [])
-        data.setdefault("product_count", 0)
-        data.setdefault("last_updated", None)
-        return data
-    except (json.JSONDecodeError, IOError):
-        return {"scraped_urls": [], "product_count": 0, "last_updated": None}
+    """
+    Load progress (see checkpoint.load_checkpoint). Returns dict with scraped_urls,
+    product_count, last_updated and, when recorded, output_bytes.
+    """
+    data = load_checkpoint(progress_path, {"scraped_urls": [], "product_count": 0, "last_updated": None})
+    data.setdefault("scraped_urls", [])
+    data.setdefault("product_count", 0)
+    data.setdefault("last_updated", None)
+    return data
 
 
-def save_progress(progress_path: str, scraped_urls: list[str], product_count: int) -> None:
-    """Save progress to JSON."""
+def progress_data(scraped_urls: list[str], product_count: int) -> dict[str, Any]:
+    """The progress JSON document (see load_progress)."""
     from datetime import datetime
-    path = Path(progress_path)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    data = {
+    return {
         "scraped_urls": scraped_urls,
         "product_count": product_count,
         "last_updated": datetime.utcnow().isoformat() + "Z",
     }
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+
+
+def save_progress(progress_path: str, scraped_urls: list[str], product_count: int) -> None:
+    """Save progress as an atomic checkpoint."""
+    save_checkpoint(progress_path, progress_data(scraped_urls, product_count))
 
 
 def is_url_scraped(url: str, scraped_urls: set[str]) -> bool:
-    """Check if product URL was already scraped (normalize URL for comparison)."""
-    u = url.strip().split("?")[0].rstrip("/")
-    return u in scraped_urls
+    """Check if product URL was already scraped (scraped_urls holds canonical URLs)."""
+    return canonical_url(url) in scraped_urls
 
 
 def normalize_product_url(url: str) -> str:
     """Normalize product URL for deduplication."""
-    u = url.strip().split("?")[0].rstrip("/")
-    if u.startswith("/"):
-        u = "https://www.cb2.com" + u
-    elif not u.startswith("http"):
-        u = "https://www.cb2.com/" + u.lstrip("/")
-    return u
+    return canonical_url(url)
+
+
+def get_product_sku(url: str) -> str:
+    """Extract product SKU from URL for deduplication."""
+    return product_sku(url)
 
 
 # CSV column order matching plan
@@ -106,8 +104,12 @@ def append_products_to_csv(csv_path: str, products: list[dict[str, Any]]) -> Non
         if not file_exists:
             writer.writerow(CSV_HEADER)
         for p in products:
-            row = [str(p.get(col, "")).replace("\r", " ").replace("\n", " ") for col in CSV_HEADER]
-            writer.writerow(row)
+            writer.writerow(clean_csv_row(p).values())
+
+
+def clean_csv_row(product: dict[str, Any]) -> dict[str, str]:
+    """Product as a CSV_HEADER row with newlines flattened."""
+    return {col: str(product.get(col, "")).replace("\r", " ").replace("\n", " ") for col in CSV_HEADER}
 
 
 def sanitize_text(text: str) -> str:
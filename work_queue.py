@@ -0,0 +1,239 @@
+"""
+SQLite work queue with leases and heartbeats, shared by crawl worker processes.
+
+Jobs are (kind, key) unique, so enqueueing the same subcategory or SKU range
+twice is a no-op. A worker leases one job at a time; the lease expires after
+lease_seconds unless the worker heartbeats. Expired leases - e.g. from a
+crashed worker - go back to pending on the next lease() or reclaim_expired()
+call, and results are only accepted from the worker that currently holds the
+lease.
+"""
+
+import json
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from config import LEASE_SECONDS, MAX_JOB_ATTEMPTS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    updated REAL NOT NULL,
+    UNIQUE (kind, key)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, kind);
+CREATE TABLE IF NOT EXISTS workers (
+    worker TEXT PRIMARY KEY,
+    jobs_done INTEGER NOT NULL DEFAULT 0,
+    jobs_failed INTEGER NOT NULL DEFAULT 0,
+    busy_seconds REAL NOT NULL DEFAULT 0,
+    metrics TEXT,
+    last_seen REAL NOT NULL
+);
+"""
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    key: str
+    payload: dict
+    attempts: int
+
+
+class WorkQueue:
+    """Lease-based job queue in a SQLite file (WAL mode, safe across processes)."""
+
+    def __init__(self, db_path: str, lease_seconds: float = LEASE_SECONDS, max_attempts: int = MAX_JOB_ATTEMPTS) -> None:
+        self.db_path = str(db_path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def enqueue(self, kind: str, key: str, payload: dict) -> bool:
+        """Add a job unless (kind, key) already exists. Returns True if added."""
+        cur = self._conn.execute(
+            "INSERT OR IGNORE INTO jobs (kind, key, payload, updated) VALUES (?, ?, ?, ?)",
+            (kind, key, json.dumps(payload), time.time()),
+        )
+        return cur.rowcount == 1
+
+    def enqueue_many(self, kind: str, jobs: list[tuple[str, dict]]) -> int:
+        """Enqueue (key, payload) pairs in one transaction. Returns the number added."""
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO jobs (kind, key, payload, updated) VALUES (?, ?, ?, ?)",
+                [(kind, key, json.dumps(payload), now) for key, payload in jobs],
+            )
+            added = self._conn.total_changes - before
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def _reclaim(self, now: float) -> int:
+        # Same rule as fail(): a job that keeps outliving its leases stops being handed out
+        cur = self._conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "worker = NULL, lease_expires = NULL, error = COALESCE(error, 'lease expired'), updated = ? "
+            "WHERE status = 'leased' AND lease_expires < ?",
+            (self.max_attempts, now, now),
+        )
+        return cur.rowcount
+
+    def reclaim_expired(self) -> int:
+        """Return jobs whose lease has expired to pending (failed after max_attempts). Returns the number reclaimed."""
+        return self._reclaim(time.time())
+
+    def lease(self, worker: str, kind: Optional[str] = None) -> Optional[Job]:
+        """
+        Reclaim expired leases, then lease the oldest pending job (of kind, if given).
+
+        A worker holds one job at a time, so if it still holds a lease (its
+        earlier lease() response was lost and the call retried) that job is
+        returned again with a renewed lease instead of leasing a second one.
+        """
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._reclaim(now)
+            held = "SELECT id, kind, key, payload, attempts FROM jobs WHERE status = 'leased' AND worker = ?"
+            held_params: tuple = (worker,)
+            if kind:
+                held += " AND kind = ?"
+                held_params += (kind,)
+            row = self._conn.execute(held + " ORDER BY id LIMIT 1", held_params).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ?",
+                    (now + self.lease_seconds, now, row[0]),
+                )
+                self._conn.execute("COMMIT")
+                return Job(id=row[0], kind=row[1], key=row[2], payload=json.loads(row[3]), attempts=row[4])
+            sql = "SELECT id, kind, key, payload, attempts FROM jobs WHERE status = 'pending'"
+            params: tuple = ()
+            if kind:
+                sql += " AND kind = ?"
+                params = (kind,)
+            row = self._conn.execute(sql + " ORDER BY id LIMIT 1", params).fetchone()
+            if row is None:
+                self._conn.execute("COMMIT")
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                (worker, now + self.lease_seconds, now, row[0]),
+            )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return Job(id=row[0], kind=row[1], key=row[2], payload=json.loads(row[3]), attempts=row[4] + 1)
+
+    def heartbeat(self, job_id: int, worker: str) -> bool:
+        """Extend the lease. Returns False if the worker no longer holds it."""
+        now = time.time()
+        cur = self._conn.execute(
+            "UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+            (now + self.lease_seconds, now, job_id, worker),
+        )
+        return cur.rowcount == 1
+
+    def complete(self, job_id: int, worker: str, result: Any) -> bool:
+        """
+        Store the result and mark done, only if worker still holds the lease.
+
+        A job's result is committed exactly once: completions from a worker
+        that lost its lease are rejected, and a repeated completion by the
+        committing worker (e.g. a retried network call) returns True without
+        writing again.
+        """
+        cur = self._conn.execute(
+            "UPDATE jobs SET status = 'done', result = ?, lease_expires = NULL, updated = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+            (json.dumps(result), time.time(), job_id, worker),
+        )
+        if cur.rowcount == 1:
+            return True
+        row = self._conn.execute("SELECT status, worker FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row == ("done", worker)
+
+    def fail(self, job_id: int, worker: str, error: str) -> None:
+        """Return the job to pending, or mark it failed after max_attempts."""
+        self._conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "worker = NULL, lease_expires = NULL, error = ?, updated = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+            (self.max_attempts, error[:500], time.time(), job_id, worker),
+        )
+
+    def release_worker(self, worker: str) -> int:
+        """Return every job leased by worker to pending, or failed after max_attempts (its process is known dead)."""
+        cur = self._conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "worker = NULL, lease_expires = NULL, error = COALESCE(error, 'worker died'), updated = ? "
+            "WHERE worker = ? AND status = 'leased'",
+            (self.max_attempts, time.time(), worker),
+        )
+        return cur.rowcount
+
+    def report(self, worker: str, done: int = 0, failed: int = 0, busy_seconds: float = 0.0, metrics: Optional[dict] = None) -> None:
+        """Add to a worker's job counters and store its latest free-form metrics."""
+        self._conn.execute(
+            "INSERT INTO workers (worker, jobs_done, jobs_failed, busy_seconds, metrics, last_seen) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (worker) DO UPDATE SET jobs_done = jobs_done + excluded.jobs_done, "
+            "jobs_failed = jobs_failed + excluded.jobs_failed, busy_seconds = busy_seconds + excluded.busy_seconds, "
+            "metrics = COALESCE(excluded.metrics, metrics), last_seen = excluded.last_seen",
+            (worker, done, failed, busy_seconds, json.dumps(metrics) if metrics else None, time.time()),
+        )
+
+    def worker_stats(self) -> list[dict]:
+        """Per-worker counters, most recently seen first."""
+        rows = self._conn.execute(
+            "SELECT worker, jobs_done, jobs_failed, busy_seconds, metrics, last_seen FROM workers ORDER BY last_seen DESC"
+        ).fetchall()
+        return [
+            {"worker": w, "jobs_done": d, "jobs_failed": f, "busy_seconds": b, "metrics": json.loads(m) if m else {}, "last_seen": t}
+            for w, d, f, b, m, t in rows
+        ]
+
+    def reset(self, kind: str) -> int:
+        """Delete every job of kind so the stage starts from scratch. Returns the number deleted."""
+        return self._conn.execute("DELETE FROM jobs WHERE kind = ?", (kind,)).rowcount
+
+    def counts(self, kind: Optional[str] = None) -> dict[str, int]:
+        """Job counts by status."""
+        sql = "SELECT status, COUNT(*) FROM jobs"
+        params: tuple = ()
+        if kind:
+            sql += " WHERE kind = ?"
+            params = (kind,)
+        counts = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        counts.update(dict(self._conn.execute(sql + " GROUP BY status", params).fetchall()))
+        return counts
+
+    def results(self, kind: str) -> list[tuple[str, Any]]:
+        """(key, result) for every done job of kind, in enqueue order."""
+        rows = self._conn.execute(
+            "SELECT key, result FROM jobs WHERE kind = ? AND status = 'done' ORDER BY id", (kind,)
+        ).fetchall()
+        return [(key, json.loads(result)) for key, result in rows]